@@ -1,7 +1,13 @@
-from pyrankvote.models import Candidate, Ballot
+from pyrankvote.models import Candidate, Ballot, CandidateRegistry
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.sqlite_store import SQLiteBallotStore
+from pyrankvote.streaming import BallotStream
 from pyrankvote.single_seat_ranking_methods import instant_runoff_voting
 from pyrankvote.multiple_seat_ranking_methods import (
     single_transferable_vote,
+    meek_single_transferable_vote,
     preferential_block_voting,
 )
 
@@ -10,7 +16,14 @@ __version__ = "2.0.5"
 __all__ = [
     "Candidate",
     "Ballot",
+    "CandidateRegistry",
+    "BallotTrie",
+    "EncodedBallots",
+    "BallotProfile",
+    "SQLiteBallotStore",
+    "BallotStream",
     "instant_runoff_voting",
     "single_transferable_vote",
+    "meek_single_transferable_vote",
     "preferential_block_voting",
 ]
@@ -0,0 +1,6 @@
+import sys
+
+from pyrankvote.command_line import main
+
+
+sys.exit(main())
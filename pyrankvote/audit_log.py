@@ -0,0 +1,272 @@
+"""
+Binary audit log of ballot transfers
+
+An audit log records where the value of every ballot goes in every round of a count: the first choices the
+ballots are distributed to before the first round, and every later transfer from an elected or rejected
+candidate to the next candidate on the ballot (or to blank votes when the ballot is exhausted).
+
+> with AuditLog("count.prvaud") as audit_log:
+>     election_result = pyrankvote.single_transferable_vote(candidates, ballots, 3, audit_log=audit_log)
+> AuditLogReader("count.prvaud", candidates).get_ballot_path(42)
+
+Ballots are identified by their index in the list of ballots given to the ranking method. Each call to
+ElectionManager.transfer_votes(..) moves all ballots from one candidate with the same weight, so the log is
+written as blocks with one (round, from candidate, weight) header and two arrays: the ballot indexes and
+the receiving candidates. The blocks are buffered and written by a background thread, so logging costs
+little more than appending two integers per transferred ballot.
+
+The file is only appended to: a JSON header with the candidate names, followed by the blocks. If the count
+is interrupted, the blocks that were written can still be read.
+"""
+
+import array
+import json
+import queue
+import struct
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from pyrankvote.models import Candidate
+
+
+FILE_MAGIC = b"PRVAUD\x00\x01"
+HEADER_FORMAT = "<8sQ"  # Magic and length of the JSON header
+BLOCK_FORMAT = "<iidQ"  # Round, from candidate index, weight and number of ballots
+
+NO_CANDIDATE = -1  # From candidate of the first distribution, and receiver of exhausted ballots
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+MAX_QUEUED_BUFFERS = 16
+
+
+class AuditRecord(NamedTuple):
+    round: int
+    ballot_index: int
+    from_candidate: Optional[Candidate]  # None when the ballots are first distributed
+    to_candidate: Optional[Candidate]  # None when the ballot is exhausted
+    weight: float
+
+
+class AuditLog:
+    """
+    Writes an audit log to file_path. Give it as audit_log to a ranking method (or an ElectionManager),
+    and close it (or use it as a context manager) after the count.
+
+    With use_thread=True the buffered blocks are written by a background thread, and at most
+    MAX_QUEUED_BUFFERS buffers of buffer_size bytes wait to be written.
+    """
+
+    def __init__(
+        self, file_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE, use_thread: bool = True
+    ):
+        self.file_path = file_path
+        self.buffer_size = buffer_size
+        self.candidates: Optional[List[Candidate]] = None
+
+        self._f = open(file_path, "wb")
+        self._buffer: List[bytes] = []
+        self._buffered_size = 0
+        self._error: Optional[BaseException] = None
+
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        if use_thread:
+            self._queue = queue.Queue(MAX_QUEUED_BUFFERS)
+            self._thread = threading.Thread(target=self._write_queued_buffers, daemon=True)
+            self._thread.start()
+
+    def __repr__(self) -> str:
+        return "<AuditLog('%s')>" % self.file_path
+
+    def __enter__(self) -> "AuditLog":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def begin_count(self, candidates: List[Candidate]):
+        """Writes the header. Candidates are referred to by their index in candidates in the log."""
+        if self.candidates is not None:
+            raise RuntimeError("An audit log can only be used for one count")
+        self.candidates = list(candidates)
+
+        header = {
+            "candidates": [candidate.name for candidate in self.candidates],
+            "byteorder": sys.byteorder,
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        self._append(struct.pack(HEADER_FORMAT, FILE_MAGIC, len(header_bytes)) + header_bytes)
+
+    def write_transfers(
+        self,
+        round_number: int,
+        from_index: int,
+        weight: float,
+        ballot_indexes: array.array,
+        to_indexes: array.array,
+    ):
+        """
+        Writes that the ballots with ballot_indexes (an array of typecode "q") moved weight votes each from
+        the candidate with from_index to the candidates with to_indexes (an array of typecode "i").
+        """
+        if len(ballot_indexes) != len(to_indexes):
+            raise ValueError("Expected one receiving candidate for every ballot")
+        if len(ballot_indexes) == 0:
+            return
+
+        block = struct.pack(BLOCK_FORMAT, round_number, from_index, weight, len(ballot_indexes))
+        self._append(block + ballot_indexes.tobytes() + to_indexes.tobytes())
+
+    def flush(self):
+        """Hands the buffered blocks to the writer"""
+        if not self._buffer:
+            return
+
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered_size = 0
+
+        if self._queue is not None:
+            self._raise_writer_error()
+            self._queue.put(data)
+        else:
+            self._f.write(data)
+
+    def close(self):
+        """Writes the remaining blocks and closes the file"""
+        if self._f.closed:
+            return
+
+        try:
+            self.flush()
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._raise_writer_error()
+        finally:
+            self._f.close()
+
+    # INTERNAL METHODS
+
+    def _append(self, data: bytes):
+        self._buffer.append(data)
+        self._buffered_size += len(data)
+        if self._buffered_size >= self.buffer_size:
+            self.flush()
+
+    def _write_queued_buffers(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is not None:
+                # Keep emptying the queue, so the counting thread is not blocked
+                continue
+            try:
+                self._f.write(data)
+            except BaseException as error:
+                self._error = error
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            raise IOError("Could not write audit log %s: %s" % (self.file_path, self._error))
+
+
+class AuditLogReader:
+    """
+    Reads an audit log written by AuditLog. Candidates with the same name as one of the given candidate
+    objects are replaced by that object, other candidates are created as new Candidate objects.
+    """
+
+    def __init__(self, file_path: str, candidates: List[Candidate] = ()):
+        self.file_path = file_path
+
+        with open(file_path, "rb") as f:
+            header_size = struct.calcsize(HEADER_FORMAT)
+            header_data = f.read(header_size)
+            if len(header_data) < header_size:
+                raise ValueError("%s is not an audit log" % file_path)
+
+            magic, header_length = struct.unpack(HEADER_FORMAT, header_data)
+            if magic != FILE_MAGIC:
+                raise ValueError("%s is not an audit log" % file_path)
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError("%s was written with another byte order" % file_path)
+
+        candidates_by_name = {candidate.name: candidate for candidate in candidates}
+        self.candidates: List[Candidate] = [
+            candidates_by_name.get(name) or Candidate(name) for name in header["candidates"]
+        ]
+        self._data_offset = header_size + header_length
+
+    def __repr__(self) -> str:
+        return "<AuditLogReader('%s')>" % self.file_path
+
+    def __iter__(self) -> Iterator[AuditRecord]:
+        for round_number, from_index, weight, ballot_indexes, to_indexes in self.iter_blocks():
+            from_candidate = self._get_candidate(from_index)
+            for ballot_index, to_index in zip(ballot_indexes, to_indexes):
+                yield AuditRecord(
+                    round_number, ballot_index, from_candidate, self._get_candidate(to_index), weight
+                )
+
+    def iter_blocks(self) -> Iterator[Tuple[int, int, float, array.array, array.array]]:
+        """
+        Yields (round, from index, weight, ballot indexes, to indexes) for every block, with candidates as
+        indexes in candidates (NO_CANDIDATE for the first distribution and exhausted ballots). A block that
+        was only partly written is ignored.
+        """
+        block_size = struct.calcsize(BLOCK_FORMAT)
+        with open(self.file_path, "rb") as f:
+            f.seek(self._data_offset)
+            while True:
+                block_data = f.read(block_size)
+                if len(block_data) < block_size:
+                    return
+
+                round_number, from_index, weight, number_of_ballots = struct.unpack(
+                    BLOCK_FORMAT, block_data
+                )
+                ballot_indexes = array.array("q")
+                to_indexes = array.array("i")
+                try:
+                    ballot_indexes.fromfile(f, number_of_ballots)
+                    to_indexes.fromfile(f, number_of_ballots)
+                except EOFError:
+                    return
+
+                yield round_number, from_index, weight, ballot_indexes, to_indexes
+
+    def get_ballot_path(self, ballot_index: int) -> List[AuditRecord]:
+        """Returns the records of a ballot, in the order its value moved"""
+        return self.get_ballot_paths([ballot_index])[ballot_index]
+
+    def get_ballot_paths(self, ballot_indexes: Iterable[int]) -> Dict[int, List[AuditRecord]]:
+        """Returns the records of each of the ballots, reading the log once"""
+        paths: Dict[int, List[AuditRecord]] = {ballot_index: [] for ballot_index in ballot_indexes}
+
+        for round_number, from_index, weight, block_ballot_indexes, to_indexes in self.iter_blocks():
+            from_candidate = self._get_candidate(from_index)
+            for ballot_index, path in paths.items():
+                # Searching the array is fast, so the records are only built for the ballots in the block
+                if ballot_index not in block_ballot_indexes:
+                    continue
+                for i, block_ballot_index in enumerate(block_ballot_indexes):
+                    if block_ballot_index == ballot_index:
+                        path.append(
+                            AuditRecord(
+                                round_number,
+                                ballot_index,
+                                from_candidate,
+                                self._get_candidate(to_indexes[i]),
+                                weight,
+                            )
+                        )
+
+        return paths
+
+    def _get_candidate(self, index: int) -> Optional[Candidate]:
+        return None if index == NO_CANDIDATE else self.candidates[index]
@@ -0,0 +1,123 @@
+"""
+Ballot profile shared by many counts
+
+Every call to a ranking method encodes the ballots and distributes the first votes from scratch. A
+BallotProfile is built once from the candidates and ballots, and can be given to every ranking method
+instead of the ballots. It computes the preprocessed forms of the ballots the first time they are needed,
+and keeps them for the next counts:
+
+ - the encoded rankings, with every distinct ranking stored once with its number of ballots (EncodedBallots)
+ - the ballots as a BallotTrie, which the ranking methods count
+ - the first votes of each candidate for each number of votes per voter (and set of withdrawn candidates)
+ - positional counts and first preference tallies
+ - the pairwise matrix used by the Condorcet methods (see pairwise.py)
+
+> profile = BallotProfile(candidates, ballots)
+> irv_result = pyrankvote.instant_runoff_voting(candidates, profile)
+> stv_result = pyrankvote.single_transferable_vote(candidates, profile, number_of_seats=3)
+> profile.get_first_preference_tallies()
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.models import Candidate
+from pyrankvote.pairwise import PairwiseMatrix
+
+
+class BallotProfile:
+    """
+    The ballots of an election, with cached preprocessed forms of them. Ballots can be a list of ballots,
+    EncodedBallots or a BallotTrie.
+
+    The ballots must not be changed after the profile is created.
+    """
+
+    def __init__(self, candidates: List[Candidate], ballots):
+        self.candidates: List[Candidate] = list(candidates)
+
+        self._ballots = None
+        self._encoded_ballots = None
+        self._trie = None
+        if isinstance(ballots, BallotTrie):
+            self._trie = ballots
+        elif isinstance(ballots, EncodedBallots):
+            self._encoded_ballots = ballots
+        else:
+            self._ballots = ballots
+
+        self._first_votes: Dict[Tuple[Tuple[bool, ...], int], Tuple] = {}
+        self._positional_counts = None
+        self._pairwise_matrix: Optional[PairwiseMatrix] = None
+
+    def __repr__(self) -> str:
+        return "<BallotProfile(%i candidates, %i ballots)>" % (
+            len(self.candidates),
+            self.get_number_of_ballots(),
+        )
+
+    def get_encoded_ballots(self) -> EncodedBallots:
+        """Returns every distinct ranking with its number of ballots"""
+        if self._encoded_ballots is None:
+            if self._trie is not None:
+                self._encoded_ballots = EncodedBallots.from_ranking_counts(
+                    self._trie.candidates, self._trie.iter_rankings()
+                )
+            else:
+                self._encoded_ballots = EncodedBallots.from_ballots(self.candidates, self._ballots)
+                # Only the encoded ballots are used from now on
+                self._ballots = None
+        return self._encoded_ballots
+
+    def get_trie(self) -> BallotTrie:
+        if self._trie is None:
+            self._trie = self.get_encoded_ballots().to_trie()
+        return self._trie
+
+    def get_number_of_ballots(self) -> float:
+        if self._trie is not None:
+            return self._trie.get_number_of_ballots()
+        if self._encoded_ballots is not None:
+            return self._encoded_ballots.get_number_of_ballots()
+        return len(self._ballots)
+
+    def get_first_votes(
+        self, included_labels: Sequence[bool], number_of_votes_pr_voter: int = 1
+    ) -> Tuple[List[List[int]], List[float], float, float]:
+        """Same as BallotTrie.get_first_votes(..), but cached"""
+        key = (tuple(included_labels), number_of_votes_pr_voter)
+        first_votes = self._first_votes.get(key)
+        if first_votes is None:
+            first_votes = self.get_trie().get_first_votes(included_labels, number_of_votes_pr_voter)
+            self._first_votes[key] = first_votes
+        return first_votes
+
+    def get_positional_counts(self) -> List[Dict[Candidate, float]]:
+        """Returns the number of ballots that rank each candidate first, second, third and so on"""
+        if self._positional_counts is None:
+            encoded_ballots = self.get_encoded_ballots()
+            counts: List[List[float]] = []
+            for ranking, count in encoded_ballots.iter_rankings():
+                for position, label in enumerate(ranking):
+                    if position == len(counts):
+                        counts.append([0.0] * len(encoded_ballots.candidates))
+                    counts[position][label] += count
+
+            self._positional_counts = [
+                dict(zip(encoded_ballots.candidates, position_counts)) for position_counts in counts
+            ]
+        return self._positional_counts
+
+    def get_first_preference_tallies(self) -> Dict[Candidate, float]:
+        """Returns the number of ballots that rank each candidate first"""
+        positional_counts = self.get_positional_counts()
+        if len(positional_counts) == 0:
+            return {candidate: 0.0 for candidate in self.get_encoded_ballots().candidates}
+        return positional_counts[0]
+
+    def get_pairwise_matrix(self, jobs: Optional[int] = 1) -> PairwiseMatrix:
+        """Returns the number of ballots that rank each candidate before each other candidate"""
+        if self._pairwise_matrix is None:
+            self._pairwise_matrix = PairwiseMatrix.from_trie(self.get_trie(), jobs=jobs)
+        return self._pairwise_matrix
@@ -0,0 +1,437 @@
+"""
+Prefix tree (trie) of ranked ballots, and an ElectionManager that counts votes on the trie.
+
+Ballots that share a ranking prefix always move together when votes are transferred: if the first
+choice of a group of voters is eliminated, they all move on to the same second choice. BallotTrie
+therefore stores ballots as a prefix tree with the number of ballots at each node, and
+TrieElectionManager lets every vote pile (CandidateVoteCount.votes) hold trie nodes instead of
+ballots. Each node stands for all ballots in its subtree, so transferring votes moves whole subtrees,
+and the work per round scales with the number of distinct ranking prefixes, not the number of ballots.
+
+> trie = BallotTrie.from_ballots(candidates, ballots)
+> election_result = pyrankvote.instant_runoff_voting(candidates, trie)
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pyrankvote.helpers import (
+    CandidateStatus,
+    CandidateVoteCount,
+    CompareMethodIfEqual,
+    ElectionManager,
+)
+from pyrankvote.models import Candidate, Ballot
+
+
+ROOT_NODE = 0
+
+
+class BallotTrie:
+    """
+    A prefix tree of ranked ballots.
+
+    Candidates are stored as integer labels (the index in BallotTrie.candidates). Node 0 is the root,
+    and every other node is the ranking prefix you get by following the labels from the root. The
+    count of a node is the number of ballots that start with that prefix.
+    """
+
+    def __init__(self, candidates: List[Candidate]):
+        self.candidates: List[Candidate] = list(candidates)
+        self._candidate_indexes: Dict[Candidate, int] = {
+            candidate: index for index, candidate in enumerate(self.candidates)
+        }
+
+        self.labels: List[int] = [-1]
+        self.parents: List[int] = [-1]
+        self.depths: List[int] = [0]
+        self.children: List[Dict[int, int]] = [{}]
+        self.counts: List[float] = [0]
+
+    @classmethod
+    def from_ballots(cls, candidates: List[Candidate], ballots: List[Ballot]) -> "BallotTrie":
+        trie = cls(candidates)
+        for ballot in ballots:
+            trie.add_ballot(ballot)
+        return trie
+
+    def __repr__(self) -> str:
+        return "<BallotTrie(%i ballots, %i nodes)>" % (
+            self.get_number_of_ballots(),
+            self.get_number_of_nodes(),
+        )
+
+    def add_ballot(self, ballot: Ballot, count: float = 1):
+        ranking = [
+            self._candidate_indexes[candidate] for candidate in ballot.ranked_candidates
+        ]
+        self.add_ranking(ranking, count)
+
+    def add_ranking(self, ranking: Sequence[int], count: float = 1) -> int:
+        """Adds count ballots with the ranking given as candidate indexes, and returns the node of the ranking"""
+        node = ROOT_NODE
+        self.counts[node] += count
+
+        for label in ranking:
+            child = self.children[node].get(label)
+            if child is None:
+                child = len(self.labels)
+                self.labels.append(label)
+                self.parents.append(node)
+                self.depths.append(self.depths[node] + 1)
+                self.children.append({})
+                self.counts.append(0)
+                self.children[node][label] = child
+
+            node = child
+            self.counts[node] += count
+
+        return node
+
+    def get_node_counts(self, nodes: Sequence[int], terminal_counts: Sequence[float]) -> List[float]:
+        """
+        Returns the node counts of the trie if terminal_counts[i] ballots ended at nodes[i], and no other
+        ballots were in the trie. Use with copy_with_counts(..) to count the same rankings with new weights.
+        """
+        counts = [0] * self.get_number_of_nodes()
+        for node, count in zip(nodes, terminal_counts):
+            counts[node] += count
+
+        # Children are always added after their parents, so iterating backwards adds subtrees before parents
+        parents = self.parents
+        for node in range(len(counts) - 1, ROOT_NODE, -1):
+            counts[parents[node]] += counts[node]
+        return counts
+
+    def copy_with_counts(self, counts: List[float]) -> "BallotTrie":
+        """
+        Returns a trie with the same nodes and new node counts. The nodes are shared with this trie, not
+        copied, so ballots must not be added to any of the tries afterwards.
+        """
+        trie = BallotTrie.__new__(BallotTrie)
+        trie.candidates = self.candidates
+        trie._candidate_indexes = self._candidate_indexes
+        trie.labels = self.labels
+        trie.parents = self.parents
+        trie.depths = self.depths
+        trie.children = self.children
+        trie.counts = counts
+        return trie
+
+    def get_first_votes(
+        self, included_labels: Sequence[bool], number_of_votes_pr_voter: int = 1
+    ) -> Tuple[List[List[int]], List[float], float, float]:
+        """
+        Distributes the first votes: every ballot votes for its first number_of_votes_pr_voter candidates
+        with included_labels[label] == True (the others are skipped).
+
+        Returns (nodes of each label, votes of each label, number of ballots with fewer candidates than
+        votes, blank votes of those ballots), where the nodes of a label stand for all ballots in their
+        subtrees that vote for the label.
+        """
+        label_nodes: List[List[int]] = [[] for _ in self.candidates]
+        label_votes = [0.0] * len(self.candidates)
+        number_of_short_ballots_total = 0.0
+        number_of_blank_votes = 0.0
+
+        # Nodes get a vote from every ballot in their subtree, until number_of_votes_pr_voter
+        # candidates are found on the path from the root. Ballots that end before that have blank votes.
+        stack = [(ROOT_NODE, 0)]
+        while stack:
+            node, number_of_candidates_voted_on = stack.pop()
+
+            if node != ROOT_NODE:
+                label = self.labels[node]
+                if included_labels[label]:
+                    label_nodes[label].append(node)
+                    label_votes[label] += self.counts[node]
+                    number_of_candidates_voted_on += 1
+
+            if number_of_candidates_voted_on < number_of_votes_pr_voter:
+                number_of_short_ballots = self.get_terminal_count(node)
+                if number_of_short_ballots > 0:
+                    number_of_short_ballots_total += number_of_short_ballots
+                    number_of_blank_votes += number_of_short_ballots * (
+                        number_of_votes_pr_voter - number_of_candidates_voted_on
+                    )
+                stack.extend(
+                    (child, number_of_candidates_voted_on)
+                    for child in self.children[node].values()
+                )
+
+        return label_nodes, label_votes, number_of_short_ballots_total, number_of_blank_votes
+
+    def get_number_of_ballots(self) -> float:
+        return self.counts[ROOT_NODE]
+
+    def get_number_of_nodes(self) -> int:
+        return len(self.labels)
+
+    def get_terminal_count(self, node: int) -> float:
+        """Returns the number of ballots that end at this node"""
+        return self.counts[node] - sum(
+            self.counts[child] for child in self.children[node].values()
+        )
+
+    def get_ranking(self, node: int) -> Tuple[int, ...]:
+        ranking = []
+        while node != ROOT_NODE:
+            ranking.append(self.labels[node])
+            node = self.parents[node]
+        return tuple(ranking[::-1])
+
+    def iter_rankings(self) -> Iterator[Tuple[Tuple[int, ...], float]]:
+        """Yields (ranking, number of ballots) for every distinct ranking in the trie"""
+        for node in range(self.get_number_of_nodes()):
+            terminal_count = self.get_terminal_count(node)
+            if terminal_count > 0:
+                yield self.get_ranking(node), terminal_count
+
+
+class TrieElectionManager(ElectionManager):
+    """
+    ElectionManager that counts ballots stored in a BallotTrie.
+
+    The vote piles (CandidateVoteCount.votes) hold trie nodes instead of ballots, where each node
+    stands for all the ballots in its subtree. The counting rules are exactly the same as in
+    ElectionManager, except that pick_random_if_blank and audit_log are not supported, since they
+    require every ballot to be handled by itself.
+
+    Candidates in the trie must be in the list of candidates or in withdrawn_candidates (see
+    ElectionManager), otherwise KeyError is raised.
+
+    Ballots is a BallotTrie, or a BallotProfile (see ballot_profile.py) that caches the first votes
+    between counts.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        ballots,
+        number_of_votes_pr_voter=1,
+        compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
+        pick_random_if_blank=False,
+        audit_log=None,
+        withdrawn_candidates: Iterable[Candidate] = (),
+    ):
+        if pick_random_if_blank:
+            raise ValueError("pick_random_if_blank is not supported when counting a BallotTrie")
+        if audit_log is not None:
+            raise ValueError("An audit log of single ballots is not supported when counting a BallotTrie")
+
+        if isinstance(ballots, BallotTrie):
+            self._trie = ballots
+        else:
+            # A BallotProfile, that caches the first votes
+            self._trie = ballots.get_trie()
+        self._get_first_votes = ballots.get_first_votes
+        self._counts = self._trie.counts
+        self._number_of_exhausted_ballots = 0.0
+        self._most_second_choices_cache: Dict[int, List[float]] = {}
+        self._candidate_labels: Dict[Candidate, int] = {
+            candidate: label for label, candidate in enumerate(self._trie.candidates)
+        }
+
+        super().__init__(
+            candidates,
+            [],
+            number_of_votes_pr_voter=number_of_votes_pr_voter,
+            compare_method_if_equal=compare_method_if_equal,
+            pick_random_if_blank=pick_random_if_blank,
+            withdrawn_candidates=withdrawn_candidates,
+        )
+
+    # METHODS WITH SIDE-EFFECTS
+
+    def elect_candidate(self, candidate: Candidate):
+        super().elect_candidate(candidate)
+        self._most_second_choices_cache.clear()
+
+    def reject_candidate(self, candidate: Candidate):
+        super().reject_candidate(candidate)
+        self._most_second_choices_cache.clear()
+
+    def transfer_votes(
+        self, candidate: Candidate, number_of_trans_votes: float, last_parcel_only: bool = False
+    ):
+        if candidate not in self._candidate_vote_counts:
+            raise RuntimeError("Candidate not found in electionManager")
+        if round(number_of_trans_votes, 4) == 0.000:
+            # Do nothing
+            return
+
+        candidate_cv = self._candidate_vote_counts[candidate]
+        if candidate_cv.status == CandidateStatus.Hopeful:
+            raise RuntimeError(
+                "ElectionManager can not transfer votes from a candidate "
+                "that is still in the race (candidateStatus == Hopeful)"
+            )
+
+        transfers = self._get_transfer_matrix()
+        candidate_index = self._candidate_indexes[candidate]
+
+        kept_nodes, nodes = self._split_ballots_to_transfer(candidate_cv, last_parcel_only)
+        voters = sum(self._counts[node] for node in nodes)
+        votes_pr_voter = self._get_transferred_votes_pr_voter(
+            candidate_cv, number_of_trans_votes, voters, last_parcel_only
+        )
+        parcel_starts = self._start_parcels()
+
+        x = self._number_of_votes_pr_voter - 1
+        for node in nodes:
+            for new_node, new_label, number_of_ballots in self._find_candidate_nr_x_in_race(
+                node, x
+            ):
+                if new_label is None:
+                    # Blank or exhausted ballots
+                    self._number_of_exhausted_ballots += number_of_ballots
+                    self._number_of_blank_votes += number_of_ballots * votes_pr_voter
+                    transfers.add_votes(candidate_index, None, number_of_ballots * votes_pr_voter)
+                else:
+                    new_candidate_cv = self._label_vote_counts[new_label]
+                    new_candidate_cv.number_of_votes += number_of_ballots * votes_pr_voter
+                    new_candidate_cv.votes.append(new_node)
+                    transfers.add_votes(
+                        candidate_index,
+                        self._candidate_indexes[new_candidate_cv.candidate],
+                        number_of_ballots * votes_pr_voter,
+                    )
+
+        self._end_parcels(parcel_starts, votes_pr_voter)
+        candidate_cv.number_of_votes -= number_of_trans_votes
+        candidate_cv.votes = kept_nodes
+
+        self._sort_candidates_in_race()
+
+    # METHODS WITHOUT SIDE-EFFECTS
+
+    def get_number_of_non_exhausted_votes(self):
+        """Returns number of votes excluding blank and exhausted ballots"""
+        return (
+            self._trie.get_number_of_ballots() * self._number_of_votes_pr_voter
+            - self._number_of_blank_votes
+        )
+
+    def get_number_of_non_exhausted_ballots(self):
+        """Returns number of ballots excluding blank and exhausted ballots"""
+        return self._trie.get_number_of_ballots() - self._number_of_exhausted_ballots
+
+    # INTERNAL METHODS
+
+    def _distribute_votes(self, candidates: List[Candidate]):
+        # None for withdrawn candidates
+        self._label_vote_counts: List[Optional[CandidateVoteCount]] = [
+            self._get_vote_count_or_none(candidate) for candidate in self._trie.candidates
+        ]
+
+        included_labels = [candidate_vc is not None for candidate_vc in self._label_vote_counts]
+        first_votes = self._get_first_votes(included_labels, self._number_of_votes_pr_voter)
+        label_nodes, label_votes, number_of_short_ballots, number_of_blank_votes = first_votes
+
+        for candidate_vc, nodes, number_of_votes in zip(
+            self._label_vote_counts, label_nodes, label_votes
+        ):
+            if candidate_vc is not None:
+                candidate_vc.number_of_votes += number_of_votes
+                # The nodes may be cached (by a BallotProfile), so the vote pile gets a copy
+                candidate_vc.votes.extend(nodes)
+
+        self._number_of_exhausted_ballots += number_of_short_ballots
+        self._number_of_blank_votes += number_of_blank_votes
+
+    def _is_label_in_race(self, label: int) -> bool:
+        candidate_vc = self._label_vote_counts[label]
+        return candidate_vc is not None and candidate_vc.is_in_race
+
+    def _find_candidate_nr_x_in_race(
+        self, node: int, x: int
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Finds the x-th candidate in race (zero indexed) on the ballots in the subtree of node.
+
+        Returns a list of (node, label, number of ballots), where node is the trie node that now
+        stands for the ballots. Label is None for ballots that have no x-th candidate in race.
+        """
+        trie = self._trie
+
+        # Candidates in race on the ranking prefix that all the ballots share
+        prefix_candidates_in_race = []
+        ancestor = node
+        while ancestor != ROOT_NODE:
+            label = trie.labels[ancestor]
+            if self._is_label_in_race(label):
+                prefix_candidates_in_race.append(label)
+            ancestor = trie.parents[ancestor]
+
+        if len(prefix_candidates_in_race) > x:
+            label = prefix_candidates_in_race[::-1][x]
+            return [(node, label, self._counts[node])]
+
+        # Search the subtree until the x-th candidate in race is found
+        found = []
+        number_of_found_ballots = 0.0
+        stack = [(child, len(prefix_candidates_in_race)) for child in trie.children[node].values()]
+        while stack:
+            child, number_in_race = stack.pop()
+            label = trie.labels[child]
+
+            if self._is_label_in_race(label):
+                if number_in_race == x:
+                    found.append((child, label, self._counts[child]))
+                    number_of_found_ballots += self._counts[child]
+                    continue
+                number_in_race += 1
+
+            stack.extend(
+                (grandchild, number_in_race) for grandchild in trie.children[child].values()
+            )
+
+        number_of_exhausted_ballots = self._counts[node] - number_of_found_ballots
+        if number_of_exhausted_ballots > 0:
+            found.append((node, None, number_of_exhausted_ballots))
+
+        return found
+
+    def _get_most_second_choices_votes(self, x: int) -> List[float]:
+        """Returns the number of ballots that has each candidate as x-th choice of candidates in race"""
+        if x in self._most_second_choices_cache:
+            return self._most_second_choices_cache[x]
+
+        votes = [0.0] * len(self._label_vote_counts)
+        trie = self._trie
+        stack = [(child, 0) for child in trie.children[ROOT_NODE].values()]
+        while stack:
+            node, number_in_race = stack.pop()
+            label = trie.labels[node]
+
+            if self._is_label_in_race(label):
+                if number_in_race == x:
+                    votes[label] += self._counts[node]
+                    continue
+                number_in_race += 1
+
+            stack.extend((child, number_in_race) for child in trie.children[node].values())
+
+        self._most_second_choices_cache[x] = votes
+        return votes
+
+    def _candidate1_has_most_second_choices(
+        self,
+        candidate1_vc: CandidateVoteCount,
+        candidate2_vc: CandidateVoteCount,
+        x: int,
+    ) -> bool:
+        if x >= self._number_of_candidates:
+            return self._candidate1_wins_final_tie_break(candidate1_vc, candidate2_vc)
+
+        votes = self._get_most_second_choices_votes(x)
+        label1 = self._candidate_labels.get(candidate1_vc.candidate)
+        label2 = self._candidate_labels.get(candidate2_vc.candidate)
+        votes_candidate1 = votes[label1] if label1 is not None else 0.0
+        votes_candidate2 = votes[label2] if label2 is not None else 0.0
+
+        if votes_candidate1 == votes_candidate2:
+            return self._candidate1_has_most_second_choices(
+                candidate1_vc, candidate2_vc, x + 1
+            )
+        else:
+            return votes_candidate1 > votes_candidate2
@@ -0,0 +1,308 @@
+"""
+Bootstrap resampling of elections
+
+Shows how robust an outcome is: the ballots are resampled with replacement many times, every sample is
+counted, and the results are the share of samples each candidate wins and the distribution of votes in
+every round.
+
+The ballots are encoded once, as a BallotTrie with one node for every distinct ranking. A bootstrap sample
+is then only an array of weights (the number of times each distinct ranking is drawn, which follows a
+multinomial distribution), and it is counted on a copy of the trie where only the node counts are new.
+No Ballot objects are created, and both drawing and counting a sample scale with the number of distinct
+rankings instead of the number of ballots.
+
+The weights are drawn with NumPy if it is installed (and otherwise in pure Python), so the same seed gives
+the same samples only where NumPy is installed in both places or in neither.
+
+> analysis = BootstrapAnalysis(candidates, ballots)
+> bootstrap_results = analysis.resample(1000, seed=1, jobs=4)
+> bootstrap_results.get_winner_frequencies()
+"""
+
+import array
+import math
+import random
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tabulate import tabulate
+
+from pyrankvote import single_seat_ranking_methods
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.helpers import ElectionResults
+from pyrankvote.models import Candidate
+from pyrankvote.parallel import map_with_shared_state
+
+
+DEFAULT_BATCH_SIZE = 50
+
+
+class BootstrapResults:
+    """
+    The results of counting number_of_samples bootstrap samples.
+
+     - winner_counts: the number of samples each candidate is elected in
+     - outcome_counts: the number of samples each set of elected candidates is elected in
+     - round_votes: round_votes[i][j] is an array with the votes of candidate j (in the order of
+       candidates) in round i, with one value for every sample that has a round i
+     - round_blank_votes: round_blank_votes[i] is an array with the blank votes in round i
+    """
+
+    def __init__(self, candidates: List[Candidate]):
+        self.candidates: List[Candidate] = list(candidates)
+        self.number_of_samples = 0
+
+        self.winner_counts: Dict[Candidate, int] = {candidate: 0 for candidate in candidates}
+        self.outcome_counts: Dict[Tuple[Candidate, ...], int] = {}
+        self.round_votes: List[List[array.array]] = []
+        self.round_blank_votes: List[array.array] = []
+
+    def __repr__(self) -> str:
+        return "<BootstrapResults(%i samples)>" % self.number_of_samples
+
+    def __str__(self) -> str:
+        winner_frequencies = self.get_winner_frequencies()
+        rows = [
+            (str(candidate), winner_frequencies[candidate])
+            for candidate in sorted(self.candidates, key=lambda c: -winner_frequencies[c])
+        ]
+        return tabulate(rows, headers=["Candidate", "Elected"], floatfmt=".1%")
+
+    def register_sample(self, winners: Tuple[int, ...], rounds: List[Tuple[List[float], float]]):
+        """Registers the results of one sample, with winners and votes given by candidate indexes"""
+        self.number_of_samples += 1
+
+        winner_candidates = tuple(self.candidates[index] for index in sorted(winners))
+        for candidate in winner_candidates:
+            self.winner_counts[candidate] += 1
+        self.outcome_counts[winner_candidates] = self.outcome_counts.get(winner_candidates, 0) + 1
+
+        for i, (votes, blank_votes) in enumerate(rounds):
+            if i == len(self.round_votes):
+                self.round_votes.append([array.array("d") for _ in self.candidates])
+                self.round_blank_votes.append(array.array("d"))
+            for candidate_votes, number_of_votes in zip(self.round_votes[i], votes):
+                candidate_votes.append(number_of_votes)
+            self.round_blank_votes[i].append(blank_votes)
+
+    def get_winner_frequencies(self) -> Dict[Candidate, float]:
+        """Returns the share of samples each candidate is elected in"""
+        return {
+            candidate: count / float(self.number_of_samples)
+            for candidate, count in self.winner_counts.items()
+        }
+
+    def get_outcome_frequencies(self) -> Dict[Tuple[Candidate, ...], float]:
+        """Returns the share of samples each set of elected candidates (in the order of candidates) is elected in"""
+        return {
+            outcome: count / float(self.number_of_samples)
+            for outcome, count in self.outcome_counts.items()
+        }
+
+    def get_round_vote_distribution(self, round_index: int) -> Dict[Candidate, array.array]:
+        """Returns the votes of each candidate in round round_index (zero indexed), one value per sample"""
+        return dict(zip(self.candidates, self.round_votes[round_index]))
+
+
+class BootstrapAnalysis:
+    """
+    Counts bootstrap samples of an election.
+
+    method is one of the ranking methods, and kwargs are passed on to it (like number_of_seats). Ballots
+    can be a list of ballots, EncodedBallots, a BallotTrie or a BallotProfile.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        ballots,
+        method: Callable[..., ElectionResults] = single_seat_ranking_methods.instant_runoff_voting,
+        **kwargs
+    ):
+        self.candidates: List[Candidate] = list(candidates)
+        self.method = method
+        self.kwargs = kwargs
+
+        if isinstance(ballots, BallotProfile):
+            ballots = ballots.get_trie()
+        if isinstance(ballots, BallotTrie):
+            ranking_counts = list(ballots.iter_rankings())
+            trie_candidates = ballots.candidates
+        else:
+            if not isinstance(ballots, EncodedBallots):
+                ballots = EncodedBallots.from_ballots(candidates, ballots)
+            ranking_counts = list(ballots.iter_rankings())
+            trie_candidates = ballots.candidates
+
+        # One trie node for every distinct ranking
+        self._trie = BallotTrie(trie_candidates)
+        self._ranking_nodes = array.array(
+            "q", [self._trie.add_ranking(ranking, count) for ranking, count in ranking_counts]
+        )
+        total_count = sum(count for _, count in ranking_counts)
+        self._ranking_probabilities = [count / total_count for _, count in ranking_counts]
+        self.number_of_ballots = int(round(self._trie.get_number_of_ballots()))
+
+    def __repr__(self) -> str:
+        return "<BootstrapAnalysis(%s, %i ballots, %i distinct rankings)>" % (
+            self.method.__name__,
+            self.number_of_ballots,
+            len(self._ranking_nodes),
+        )
+
+    def resample(
+        self,
+        number_of_samples: int,
+        seed: Optional[int] = None,
+        jobs: Optional[int] = 1,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> BootstrapResults:
+        """
+        Counts number_of_samples bootstrap samples, in batches of batch_size samples that are counted by
+        jobs worker processes (see parallel.map_with_shared_state).
+
+        Every sample gets its own seed drawn from seed, and the random number generator is seeded with it
+        before the sample is counted (for random tie-breaks), so the results are reproducible and do not
+        depend on the number of jobs.
+        """
+        rng = random.Random(seed)
+        sample_seeds = [rng.getrandbits(64) for _ in range(number_of_samples)]
+        batches = [
+            sample_seeds[i : i + batch_size] for i in range(0, number_of_samples, batch_size)
+        ]
+
+        batch_results = map_with_shared_state(
+            _count_samples,
+            (
+                self.method,
+                self.candidates,
+                self._trie,
+                self._ranking_nodes,
+                self._ranking_probabilities,
+                self.number_of_ballots,
+                self.kwargs,
+            ),
+            batches,
+            jobs=jobs,
+        )
+
+        bootstrap_results = BootstrapResults(self.candidates)
+        for sample_results in batch_results:
+            for winners, rounds in sample_results:
+                bootstrap_results.register_sample(winners, rounds)
+        return bootstrap_results
+
+    def get_sample_weights(self, sample_seed: int) -> array.array:
+        """Returns the number of times each distinct ranking is drawn in the sample with the given seed"""
+        return _draw_weights(sample_seed, self._ranking_probabilities, self.number_of_ballots)
+
+
+def _draw_weights(sample_seed: int, probabilities: List[float], number_of_ballots: int) -> array.array:
+    """
+    Draws number_of_ballots ballots with replacement, and returns the number of draws of each distinct
+    ranking. The numbers are drawn from the multinomial distribution directly, in time proportional to the
+    number of distinct rankings: with NumPy if it is installed, and otherwise as a chain of binomial draws
+    (the draws of each ranking among the ballots not drawn for the rankings before it).
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if numpy is not None:
+        weights = numpy.random.default_rng(sample_seed).multinomial(number_of_ballots, probabilities)
+        return array.array("q", weights.astype(numpy.int64).tobytes())
+
+    rng = random.Random(sample_seed)
+    weights = array.array("q", bytes(8 * len(probabilities)))
+    remaining_ballots = number_of_ballots
+    remaining_probability = 1.0
+    for index, probability in enumerate(probabilities):
+        if remaining_ballots == 0:
+            break
+        if index == len(probabilities) - 1 or probability >= remaining_probability:
+            weights[index] = remaining_ballots
+            break
+        weights[index] = _draw_binomial(rng, remaining_ballots, probability / remaining_probability)
+        remaining_ballots -= weights[index]
+        remaining_probability -= probability
+    return weights
+
+
+def _draw_binomial(rng: random.Random, n: int, p: float) -> int:
+    """
+    Returns the number of successes in n trials with probability p. Uses the geometric method when n * p is
+    small, and otherwise transformed rejection with squeeze (BTRS, Hörmann 1993), so the expected time does
+    not grow with n.
+    """
+    if p <= 0.0:
+        return 0
+    if p >= 1.0:
+        return n
+    if p > 0.5:
+        return n - _draw_binomial(rng, n, 1.0 - p)
+
+    if n * p < 10.0:
+        # The gaps between successes are geometrically distributed
+        log_q = math.log(1.0 - p)
+        successes = trials = 0
+        while True:
+            trials += math.floor(math.log(1.0 - rng.random()) / log_q) + 1
+            if trials > n:
+                return successes
+            successes += 1
+
+    spq = math.sqrt(n * p * (1.0 - p))
+    b = 1.15 + 2.53 * spq
+    a = -0.0873 + 0.0248 * b + 0.01 * p
+    c = n * p + 0.5
+    v_r = 0.92 - 4.2 / b
+    alpha = (2.83 + 5.1 / b) * spq
+    log_odds = math.log(p / (1.0 - p))
+    mode = math.floor((n + 1) * p)
+    h = math.lgamma(mode + 1) + math.lgamma(n - mode + 1)
+    while True:
+        u = rng.random() - 0.5
+        v = rng.random()
+        us = 0.5 - abs(u)
+        k = math.floor((2.0 * a / us + b) * u + c)
+        if k < 0 or k > n:
+            continue
+        if us >= 0.07 and v <= v_r:
+            return k
+        v *= alpha / (a / (us * us) + b)
+        if math.log(v) <= h - math.lgamma(k + 1) - math.lgamma(n - k + 1) + (k - mode) * log_odds:
+            return k
+
+
+def _count_samples(count_state, sample_seeds: List[int]) -> List[Tuple[Tuple[int, ...], List]]:
+    """Returns (winner indexes, [(votes by candidate index, blank votes) for every round]) for every sample"""
+    method, candidates, trie, ranking_nodes, probabilities, number_of_ballots, kwargs = count_state
+    candidate_indexes = {candidate: index for index, candidate in enumerate(candidates)}
+
+    sample_results = []
+    random_state = random.getstate()
+    try:
+        for sample_seed in sample_seeds:
+            weights = _draw_weights(sample_seed, probabilities, number_of_ballots)
+            sample_trie = trie.copy_with_counts(trie.get_node_counts(ranking_nodes, weights))
+
+            random.seed(sample_seed)
+            election_results = method(candidates, sample_trie, **kwargs)
+
+            winners = tuple(
+                candidate_indexes[candidate] for candidate in election_results.get_winners()
+            )
+            rounds = []
+            for round_ in election_results.rounds:
+                votes = [0.0] * len(candidates)
+                for candidate_result in round_.candidate_results:
+                    index = candidate_indexes[candidate_result.candidate]
+                    votes[index] = candidate_result.number_of_votes
+                rounds.append((votes, round_.number_of_blank_votes))
+            sample_results.append((winners, rounds))
+    finally:
+        random.setstate(random_state)
+
+    return sample_results
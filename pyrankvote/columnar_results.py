@@ -0,0 +1,481 @@
+"""
+Columnar form of ElectionResults
+
+ElectionResults is a list of rounds, each with a list of CandidateResult tuples. That is convenient for
+small elections, but slow and bulky for results with hundreds of rounds and thousands of candidates.
+ColumnarResults stores the same results as typed arrays, with one row for every candidate in every round:
+
+ - rounds: the round index (zero indexed)
+ - candidate_indexes: the candidate, as an index in ColumnarResults.candidates
+ - votes: the number of votes
+ - status_codes: the status, as a code in helpers.STATUS_CODES
+
+The rows of a round are in the same order as the candidate results of the round. The number of blank votes
+of every round is stored in blank_votes, and the votes transferred before each round (RoundResult.transfers)
+in four more columns with one row for every cell of the rows of its transfer matrix:
+
+ - transfer_rounds: the round index
+ - transfer_from_indexes and transfer_to_indexes: the candidates the votes are transferred from and to, as
+   indexes in ColumnarResults.candidates (EXHAUSTED when the ballots are exhausted)
+ - transfer_votes: the number of votes
+
+ColumnarResults can be saved to a compact binary file (that is memory-mapped when loaded), written as JSON
+lines with one line per round, and converted to NumPy arrays or a pandas DataFrame, if those are installed.
+
+> columnar_results = ColumnarResults.from_election_results(election_results)
+> columnar_results.save("results.prvres")
+> data_frame = ColumnarResults.load("results.prvres").to_pandas()
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pyrankvote.helpers import (
+    STATUS_CODES,
+    STATUSES,
+    CandidateResult,
+    ElectionResults,
+    RoundResult,
+    TransferMatrix,
+)
+from pyrankvote.models import Candidate
+
+
+FILE_MAGIC = b"PRVRES\x00\x01"
+HEADER_FORMAT = "<8sQ"  # Magic and length of the JSON header
+ALIGNMENT = 8
+
+COLUMNS = [
+    # (name, typecode)
+    ("rounds", "i"),
+    ("candidate_indexes", "i"),
+    ("votes", "d"),
+    ("status_codes", "b"),
+]
+
+TRANSFER_COLUMNS = [
+    # (name, typecode)
+    ("transfer_rounds", "i"),
+    ("transfer_from_indexes", "i"),
+    ("transfer_to_indexes", "i"),
+    ("transfer_votes", "d"),
+]
+EXHAUSTED = -1  # Transfer to index of exhausted ballots
+
+
+class ColumnarResults:
+    """ElectionResults stored as typed arrays (columns) with one row for every candidate in every round"""
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        rounds: Optional[array.array] = None,
+        candidate_indexes: Optional[array.array] = None,
+        votes: Optional[array.array] = None,
+        status_codes: Optional[array.array] = None,
+        blank_votes: Optional[array.array] = None,
+        transfer_rounds: Optional[array.array] = None,
+        transfer_from_indexes: Optional[array.array] = None,
+        transfer_to_indexes: Optional[array.array] = None,
+        transfer_votes: Optional[array.array] = None,
+    ):
+        self.candidates: List[Candidate] = list(candidates)
+        self.rounds = rounds if rounds is not None else array.array("i")
+        self.candidate_indexes = (
+            candidate_indexes if candidate_indexes is not None else array.array("i")
+        )
+        self.votes = votes if votes is not None else array.array("d")
+        self.status_codes = status_codes if status_codes is not None else array.array("b")
+        self.blank_votes = blank_votes if blank_votes is not None else array.array("d")
+        self.transfer_rounds = transfer_rounds if transfer_rounds is not None else array.array("i")
+        self.transfer_from_indexes = (
+            transfer_from_indexes if transfer_from_indexes is not None else array.array("i")
+        )
+        self.transfer_to_indexes = (
+            transfer_to_indexes if transfer_to_indexes is not None else array.array("i")
+        )
+        self.transfer_votes = transfer_votes if transfer_votes is not None else array.array("d")
+
+        self._candidate_indexes_by_name: Dict[str, int] = {
+            candidate.name: index for index, candidate in enumerate(self.candidates)
+        }
+
+        # The memory map the arrays are views of (if loaded with use_mmap=True)
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_election_results(cls, election_results: ElectionResults) -> "ColumnarResults":
+        columnar_results = cls([])
+        for round_ in election_results.rounds:
+            columnar_results.add_round(round_)
+        return columnar_results
+
+    def __repr__(self) -> str:
+        return "<ColumnarResults(%i rounds, %i candidates)>" % (
+            self.get_number_of_rounds(),
+            len(self.candidates),
+        )
+
+    def __len__(self) -> int:
+        """Returns the number of rows"""
+        return len(self.votes)
+
+    def get_number_of_rounds(self) -> int:
+        return len(self.blank_votes)
+
+    def add_round(self, round_: RoundResult):
+        round_index = self.get_number_of_rounds()
+        for candidate, number_of_votes, status in round_.candidate_results:
+            self.rounds.append(round_index)
+            self.candidate_indexes.append(self._get_candidate_index(candidate))
+            self.votes.append(number_of_votes)
+            self.status_codes.append(STATUS_CODES[status])
+        self.blank_votes.append(round_.number_of_blank_votes)
+
+        if round_.transfers is not None:
+            candidate_indexes = [
+                self._get_candidate_index(candidate) for candidate in round_.transfers.candidates
+            ]
+            for from_index, to_index, number_of_votes in _get_transfers(round_.transfers, candidate_indexes):
+                self.transfer_rounds.append(round_index)
+                self.transfer_from_indexes.append(from_index)
+                self.transfer_to_indexes.append(EXHAUSTED if to_index is None else to_index)
+                self.transfer_votes.append(number_of_votes)
+
+    def to_election_results(self) -> ElectionResults:
+        election_results = ElectionResults()
+        round_transfers = self._get_round_transfers()
+        for round_index, start, end in self._iter_round_rows():
+            candidate_results = [
+                CandidateResult(
+                    self.candidates[self.candidate_indexes[i]],
+                    self.votes[i],
+                    STATUSES[self.status_codes[i]],
+                )
+                for i in range(start, end)
+            ]
+            transfers = None
+            if round_index in round_transfers:
+                transfers = TransferMatrix(self.candidates)
+                for from_index, to_index, number_of_votes in round_transfers[round_index]:
+                    transfers.add_votes(from_index, to_index, number_of_votes)
+            election_results.register_round_results(
+                RoundResult(candidate_results, self.blank_votes[round_index], transfers)
+            )
+        return election_results
+
+    # BINARY FILE FORMAT
+
+    def save(self, file_path: str):
+        """
+        Saves the results to a binary file: a JSON header with candidate names, followed by the columns,
+        the blank votes and the transfer columns.
+        """
+        header = {
+            "candidates": [candidate.name for candidate in self.candidates],
+            "number_of_rows": len(self),
+            "number_of_rounds": self.get_number_of_rounds(),
+            "number_of_transfers": len(self.transfer_votes),
+            "byteorder": sys.byteorder,
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (-(struct.calcsize(HEADER_FORMAT) + len(header_bytes)) % ALIGNMENT)
+
+        with open(file_path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, FILE_MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for values in self._get_arrays() + self._get_transfer_arrays():
+                data = values.tobytes()
+                f.write(data)
+                f.write(b"\0" * (-len(data) % ALIGNMENT))
+
+    @classmethod
+    def load(
+        cls, file_path: str, candidates: List[Candidate] = (), use_mmap: bool = True
+    ) -> "ColumnarResults":
+        """
+        Loads results saved with ColumnarResults.save(..). Candidates with the same name as one of the
+        given candidate objects are replaced by that object.
+
+        With use_mmap=True the columns are read-only views of the memory-mapped file.
+        """
+        with open(file_path, "rb") as f:
+            if use_mmap:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+
+        header_size = struct.calcsize(HEADER_FORMAT)
+        magic, header_length = struct.unpack_from(HEADER_FORMAT, buffer)
+        if magic != FILE_MAGIC:
+            raise ValueError("%s is not a results file" % file_path)
+
+        header = json.loads(bytes(buffer[header_size : header_size + header_length]).decode("utf-8"))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError("%s was saved with another byte order" % file_path)
+
+        view = memoryview(buffer)
+        position = header_size + header_length
+        arrays = []
+        # Files saved before the transfers were saved have no transfer columns
+        lengths = (
+            [header["number_of_rows"]] * len(COLUMNS)
+            + [header["number_of_rounds"]]
+            + [header.get("number_of_transfers", 0)] * len(TRANSFER_COLUMNS)
+        )
+        typecodes = (
+            [typecode for _, typecode in COLUMNS] + ["d"] + [typecode for _, typecode in TRANSFER_COLUMNS]
+        )
+        for typecode, length in zip(typecodes, lengths):
+            size = length * array.array(typecode).itemsize
+            arrays.append(view[position : position + size].cast(typecode))
+            position += size + (-size % ALIGNMENT)
+
+        columnar_results = cls(_get_candidates(header["candidates"], candidates), *arrays)
+        if use_mmap:
+            columnar_results._mmap = buffer
+        return columnar_results
+
+    # JSON LINES
+
+    def write_json_lines(self, f: IO[str]):
+        """Writes the results as JSON lines (see JsonLinesWriter) to the text file f"""
+        writer = JsonLinesWriter(f)
+        writer.write_new_candidates([candidate.name for candidate in self.candidates])
+        round_transfers = self._get_round_transfers()
+        for round_index, start, end in self._iter_round_rows():
+            writer.write_round_columns(
+                self.blank_votes[round_index],
+                self.candidate_indexes[start:end].tolist(),
+                self.votes[start:end].tolist(),
+                self.status_codes[start:end].tolist(),
+                round_transfers.get(round_index),
+            )
+
+    @classmethod
+    def read_json_lines(cls, lines: Iterable[str], candidates: List[Candidate] = ()) -> "ColumnarResults":
+        """
+        Reads results written by JsonLinesWriter. Candidates with the same name as one of the given
+        candidate objects are replaced by that object.
+        """
+        columnar_results = cls([])
+        candidate_names: List[str] = []
+
+        for line in lines:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "new_candidates" in data:
+                candidate_names.extend(data["new_candidates"])
+                continue
+
+            columnar_results.candidates = _get_candidates(candidate_names, candidates)
+            round_index = columnar_results.get_number_of_rounds()
+            columnar_results.rounds.extend([round_index] * len(data["candidate_indexes"]))
+            columnar_results.candidate_indexes.extend(data["candidate_indexes"])
+            columnar_results.votes.extend(data["votes"])
+            columnar_results.status_codes.extend(data["status_codes"])
+            columnar_results.blank_votes.append(data["blank_votes"])
+            for from_index, to_index, number_of_votes in data.get("transfers") or []:
+                columnar_results.transfer_rounds.append(round_index)
+                columnar_results.transfer_from_indexes.append(from_index)
+                columnar_results.transfer_to_indexes.append(EXHAUSTED if to_index is None else to_index)
+                columnar_results.transfer_votes.append(number_of_votes)
+
+        columnar_results.candidates = _get_candidates(candidate_names, candidates)
+        return columnar_results
+
+    # CONVERSIONS (OPTIONAL DEPENDENCIES)
+
+    def to_numpy(self) -> Dict[str, "numpy.ndarray"]:
+        """
+        Returns the columns as a dict of NumPy arrays (rounds, candidate_indexes, votes, status_codes and
+        blank_votes). The arrays share memory with the columns, so nothing is copied.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("ColumnarResults.to_numpy() requires numpy (pip install numpy)")
+
+        names = [name for name, _ in COLUMNS] + ["blank_votes"]
+        typecodes = [typecode for _, typecode in COLUMNS] + ["d"]
+        return {
+            name: numpy.frombuffer(values, dtype=typecode)
+            for name, typecode, values in zip(names, typecodes, self._get_arrays())
+        }
+
+    def to_pandas(self) -> "pandas.DataFrame":
+        """
+        Returns the rows as a pandas DataFrame with the columns round, candidate, votes and status, where
+        candidate and status are categorical columns.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("ColumnarResults.to_pandas() requires pandas (pip install pandas)")
+
+        columns = self.to_numpy()
+        status_names = [STATUSES[code] for code in sorted(STATUSES)]
+        return pandas.DataFrame(
+            {
+                "round": columns["rounds"],
+                "candidate": pandas.Categorical.from_codes(
+                    columns["candidate_indexes"], categories=[str(candidate) for candidate in self.candidates]
+                ),
+                "votes": columns["votes"],
+                "status": pandas.Categorical.from_codes(columns["status_codes"], categories=status_names),
+            }
+        )
+
+    # INTERNAL METHODS
+
+    def _get_candidate_index(self, candidate: Candidate) -> int:
+        index = self._candidate_indexes_by_name.get(candidate.name)
+        if index is None:
+            index = self._candidate_indexes_by_name[candidate.name] = len(self.candidates)
+            self.candidates.append(candidate)
+        return index
+
+    def _get_arrays(self) -> List:
+        return [self.rounds, self.candidate_indexes, self.votes, self.status_codes, self.blank_votes]
+
+    def _get_transfer_arrays(self) -> List:
+        return [
+            self.transfer_rounds,
+            self.transfer_from_indexes,
+            self.transfer_to_indexes,
+            self.transfer_votes,
+        ]
+
+    def _get_round_transfers(self) -> Dict[int, List[Tuple[int, Optional[int], float]]]:
+        """Returns the (from index, to index or None if exhausted, votes) of the transfers, by round index"""
+        round_transfers: Dict[int, List[Tuple[int, Optional[int], float]]] = {}
+        for round_index, from_index, to_index, number_of_votes in zip(*self._get_transfer_arrays()):
+            round_transfers.setdefault(round_index, []).append(
+                (from_index, None if to_index == EXHAUSTED else to_index, number_of_votes)
+            )
+        return round_transfers
+
+    def _iter_round_rows(self) -> Iterator[Tuple[int, int, int]]:
+        """Yields (round index, first row, end row) for every round"""
+        rounds = self.rounds
+        start = 0
+        for round_index in range(self.get_number_of_rounds()):
+            end = start
+            while end < len(rounds) and rounds[end] == round_index:
+                end += 1
+            yield round_index, start, end
+            start = end
+
+
+class JsonLinesWriter:
+    """
+    Writes results as JSON lines, one round at a time, so results can be streamed while the votes are
+    counted. Every round is written as one line:
+
+        {"round": 0, "blank_votes": 0.0, "candidate_indexes": [...], "votes": [...], "status_codes": [...]}
+
+    Candidates are given by index, and the first time a candidate is seen, a line with the names of the new
+    candidates is written before the round: {"new_candidates": ["Per", "Pål"]}
+
+    Rounds with transferred votes (RoundResult.transfers) also have "transfers": [[from index, to index,
+    votes], ...], with one item for every cell of the rows of the transfer matrix, and null as the to index
+    of exhausted ballots.
+    """
+
+    def __init__(self, f: IO[str]):
+        self._f = f
+        self._candidate_indexes_by_name: Dict[str, int] = {}
+        self._number_of_rounds = 0
+
+    def write_round(self, round_: RoundResult):
+        new_candidate_names: List[str] = []
+        candidate_indexes = []
+        votes = []
+        status_codes = []
+        for candidate, number_of_votes, status in round_.candidate_results:
+            candidate_indexes.append(self._get_candidate_index(candidate, new_candidate_names))
+            votes.append(number_of_votes)
+            status_codes.append(STATUS_CODES[status])
+
+        transfers = None
+        if round_.transfers is not None:
+            transfer_candidate_indexes = [
+                self._get_candidate_index(candidate, new_candidate_names)
+                for candidate in round_.transfers.candidates
+            ]
+            transfers = _get_transfers(round_.transfers, transfer_candidate_indexes)
+
+        if new_candidate_names:
+            self._write_line({"new_candidates": new_candidate_names})
+        self.write_round_columns(
+            round_.number_of_blank_votes, candidate_indexes, votes, status_codes, transfers
+        )
+
+    def write_new_candidates(self, candidate_names: List[str]):
+        """Writes candidates that will be referred to by index in the following rounds"""
+        for name in candidate_names:
+            self._candidate_indexes_by_name[name] = len(self._candidate_indexes_by_name)
+        self._write_line({"new_candidates": candidate_names})
+
+    def write_round_columns(
+        self,
+        number_of_blank_votes: float,
+        candidate_indexes: List[int],
+        votes: List[float],
+        status_codes: List[int],
+        transfers: Optional[List[Tuple[int, Optional[int], float]]] = None,
+    ):
+        data = {
+            "round": self._number_of_rounds,
+            "blank_votes": number_of_blank_votes,
+            "candidate_indexes": candidate_indexes,
+            "votes": votes,
+            "status_codes": status_codes,
+        }
+        if transfers is not None:
+            data["transfers"] = transfers
+        self._write_line(data)
+        self._number_of_rounds += 1
+
+    def write_results(self, election_results: ElectionResults):
+        for round_ in election_results.rounds:
+            self.write_round(round_)
+
+    def _get_candidate_index(self, candidate: Candidate, new_candidate_names: List[str]) -> int:
+        index = self._candidate_indexes_by_name.get(candidate.name)
+        if index is None:
+            index = self._candidate_indexes_by_name[candidate.name] = len(self._candidate_indexes_by_name)
+            new_candidate_names.append(candidate.name)
+        return index
+
+    def _write_line(self, data: Dict):
+        self._f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        self._f.write("\n")
+
+
+def _get_candidates(names: List[str], candidates: List[Candidate]) -> List[Candidate]:
+    candidates_by_name = {candidate.name: candidate for candidate in candidates}
+    return [candidates_by_name.get(name) or Candidate(name) for name in names]
+
+
+def _get_transfers(
+    transfers: TransferMatrix, candidate_indexes: List[int]
+) -> List[Tuple[int, Optional[int], float]]:
+    """
+    Returns (from index, to index or None if exhausted, votes) for every cell of the rows of the transfer
+    matrix, where candidate_indexes are the indexes of the candidates of the matrix. The cells are sorted by
+    the indexes, so the order does not depend on the order of the candidates of the matrix.
+    """
+    exhausted_column = len(candidate_indexes)
+    cells = []
+    for from_column, row in transfers.rows.items():
+        for to_column, number_of_votes in enumerate(row):
+            to_index = None if to_column == exhausted_column else candidate_indexes[to_column]
+            cells.append((candidate_indexes[from_column], to_index, number_of_votes))
+    cells.sort(key=lambda cell: (cell[0], cell[1] is None, cell[1] or 0))
+    return cells
@@ -0,0 +1,277 @@
+"""
+The pyrankvote command
+
+Counts a ballot file without writing any Python:
+
+    pyrankvote ballots.normalized.csv
+    pyrankvote ballots.normalized.csv --parse-jobs 4 --output results.jsonl
+    pyrankvote cvr_report.json --contest "Mayor"
+    pyrankvote huge_election.blt --method pbv --seats 3 --streaming
+
+Ballot files are parsed straight into EncodedBallots (without creating Ballot objects) and cached next
+to the file (see loaders.py), so counting the same file again skips the parsing. With --streaming, BLT
+and binary files are instead read again in every round (see streaming.py), so only the numbers of votes
+are held in memory. Each round is printed as soon as it is counted, and the results can be written as
+JSON lines (also one round at a time) or as a binary ColumnarResults file.
+
+The count itself runs in one process: --parse-jobs only parses CSV files with more worker processes.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+from typing import IO, Callable, List, Optional
+
+import pyrankvote
+from pyrankvote import loaders
+from pyrankvote.columnar_results import ColumnarResults, JsonLinesWriter
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.helpers import CandidateStatus, RoundResult
+from pyrankvote.streaming import BallotStream
+
+
+METHODS = {
+    "irv": pyrankvote.instant_runoff_voting,
+    "stv": pyrankvote.single_transferable_vote,
+    "pbv": pyrankvote.preferential_block_voting,
+}
+
+INPUT_FORMATS = {
+    # Format: file extensions
+    "csv": [".csv"],
+    "blt": [".blt"],
+    "cvr_json": [".json"],
+    "parquet": [".parquet"],
+    "binary": [loaders.CACHE_FILE_EXTENSION],
+}
+
+# Formats that can be read again in every round with --streaming
+STREAMING_FORMATS = ["blt", "binary"]
+
+OUTPUT_FORMATS = {
+    "jsonl": [".jsonl", ".json"],
+    "binary": [".prvres"],
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = get_argument_parser()
+    arguments = parser.parse_args(argv)
+
+    input_format = arguments.format or _get_format_from_extension(arguments.file, INPUT_FORMATS)
+    if input_format is None:
+        parser.error("Unknown file format of %s, use --format" % arguments.file)
+
+    output_format = None
+    if arguments.output is not None:
+        output_format = arguments.output_format or _get_format_from_extension(
+            arguments.output, OUTPUT_FORMATS
+        )
+        if output_format is None:
+            parser.error("Unknown file format of %s, use --output-format" % arguments.output)
+
+    if arguments.seats is not None and arguments.seats < 1:
+        parser.error("--seats must be at least 1")
+    if arguments.streaming and input_format not in STREAMING_FORMATS:
+        parser.error("--streaming only reads %s files" % " and ".join(STREAMING_FORMATS))
+    if arguments.streaming and arguments.method == "stv":
+        parser.error("--streaming only counts with --method irv or pbv")
+    # These options only apply when the ballots are loaded
+    if arguments.streaming and arguments.parse_jobs is not None:
+        parser.error("--parse-jobs can not be used with --streaming")
+    if arguments.streaming and arguments.contest is not None:
+        parser.error("--contest can not be used with --streaming")
+    if arguments.streaming and arguments.no_cache:
+        parser.error("--no-cache can not be used with --streaming")
+
+    progress = None if arguments.quiet else ProgressPrinter()
+    try:
+        if arguments.streaming:
+            ballots = BallotStream.from_file(arguments.file)
+        else:
+            ballots = load_ballots(
+                arguments.file,
+                input_format,
+                use_cache=not arguments.no_cache,
+                jobs=1 if arguments.parse_jobs is None else arguments.parse_jobs,
+                progress=progress,
+                contest=arguments.contest,
+            )
+    except (OSError, ValueError) as error:
+        print("pyrankvote: error: %s" % error, file=sys.stderr)
+        return 1
+    finally:
+        if progress is not None:
+            progress.finish()
+
+    number_of_seats = arguments.seats
+    if number_of_seats is None:
+        number_of_seats = ballots.metadata.get("number_of_seats", 1)
+    if arguments.method == "irv" and number_of_seats != 1:
+        parser.error("Instant runoff voting elects one candidate, use --method stv or pbv")
+
+    withdrawn_names = set(ballots.metadata.get("withdrawn_candidates", []))
+    candidates = [candidate for candidate in ballots.candidates if candidate.name not in withdrawn_names]
+    withdrawn_candidates = [
+        candidate for candidate in ballots.candidates if candidate.name in withdrawn_names
+    ]
+
+    kwargs = {} if arguments.method == "irv" else {"number_of_seats": number_of_seats}
+    kwargs["withdrawn_candidates"] = withdrawn_candidates
+    round_callbacks: List[Callable[[RoundResult], None]] = []
+    if not arguments.winners_only:
+        round_callbacks.append(RoundPrinter())
+
+    with contextlib.ExitStack() as exit_stack:
+        if output_format == "jsonl":
+            # Each round is written as soon as it is counted, like it is printed
+            f = exit_stack.enter_context(open(arguments.output, "w", encoding="utf-8"))
+            round_callbacks.append(JsonLinesRoundWriter(f))
+
+        election_results = METHODS[arguments.method](
+            candidates, ballots, round_callback=_get_round_callback(round_callbacks), **kwargs
+        )
+    print("Elected: %s" % ", ".join(str(candidate) for candidate in election_results.get_winners()))
+
+    if output_format == "binary":
+        ColumnarResults.from_election_results(election_results).save(arguments.output)
+
+    return 0
+
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pyrankvote",
+        description="Counts the ballots in a ballot file with a ranked voting method.",
+    )
+    parser.add_argument(
+        "file",
+        help="normalized CSV (.csv), BLT (.blt), NIST cast vote records (.json), Parquet with rank columns "
+        "(.parquet) or binary encoded ballots (%s)" % loaders.CACHE_FILE_EXTENSION,
+    )
+    parser.add_argument("--format", choices=sorted(INPUT_FORMATS), help="format of the ballot file")
+    parser.add_argument(
+        "--method", choices=sorted(METHODS), default="irv", help="ranking method (default: irv)"
+    )
+    parser.add_argument(
+        "--seats", type=int, help="number of seats (default: from the BLT file, otherwise 1)"
+    )
+    parser.add_argument(
+        "--parse-jobs",
+        type=int,
+        help="number of worker processes used to parse CSV files (default: 1, the count uses one process)",
+    )
+    parser.add_argument(
+        "--contest", help="contest to count (@id or name) in NIST cast vote records with more than one contest"
+    )
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument(
+        "--output-format",
+        choices=sorted(OUTPUT_FORMATS),
+        help="format of the results: JSON lines (.jsonl) or binary (.prvres)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the ballot cache")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="read the ballots from the file in every round instead of loading them (BLT and binary files, "
+        "irv and pbv)",
+    )
+    parser.add_argument("--winners-only", action="store_true", help="only print the elected candidates")
+    parser.add_argument("--quiet", action="store_true", help="don't show the progress")
+    return parser
+
+
+def load_ballots(
+    file_path: str,
+    input_format: str,
+    use_cache: bool = True,
+    jobs: int = 1,
+    progress: Optional[Callable[[int, int], None]] = None,
+    contest: Optional[str] = None,
+) -> EncodedBallots:
+    if input_format == "csv":
+        return loaders.load_normalized_csv(
+            file_path, use_cache=use_cache, jobs=jobs, progress=progress
+        )
+    if input_format == "blt":
+        return loaders.load_blt(file_path, use_cache=use_cache, progress=progress)
+    if input_format == "cvr_json":
+        return loaders.load_nist_cvr_json(file_path, contest=contest, use_cache=use_cache, progress=progress)
+    if input_format == "parquet":
+        return loaders.load_parquet(file_path, use_cache=use_cache)
+    return EncodedBallots.load(file_path)
+
+
+class RoundPrinter:
+    """
+    Prints each round as soon as it is counted (the same way as ElectionResults.__str__). The count ends
+    when no candidates are left in the race, so the round without hopeful candidates is the final result.
+    """
+
+    def __init__(self):
+        self._number_of_rounds = 0
+
+    def __call__(self, round_: RoundResult):
+        self._number_of_rounds += 1
+        if any(status == CandidateStatus.Hopeful for _, _, status in round_.candidate_results):
+            print("ROUND %i" % self._number_of_rounds)
+        else:
+            print("FINAL RESULT")
+        print(round_)
+        print("", flush=True)
+
+
+class JsonLinesRoundWriter:
+    """Writes each round to a JSON lines file as soon as it is counted (see JsonLinesWriter)"""
+
+    def __init__(self, f: IO[str]):
+        self._f = f
+        self._json_lines_writer = JsonLinesWriter(f)
+
+    def __call__(self, round_: RoundResult):
+        self._json_lines_writer.write_round(round_)
+        self._f.flush()
+
+
+class ProgressPrinter:
+    """Prints the progress of loading ballots to stderr, on one line that is overwritten"""
+
+    def __init__(self):
+        self._is_printed = False
+
+    def __call__(self, bytes_parsed: int, file_size: int):
+        percent = 100.0 * bytes_parsed / file_size if file_size > 0 else 100.0
+        sys.stderr.write(
+            "\rLoading ballots: %3.0f%% (%.1f of %.1f MB)"
+            % (percent, bytes_parsed / 1e6, file_size / 1e6)
+        )
+        sys.stderr.flush()
+        self._is_printed = True
+
+    def finish(self):
+        if self._is_printed:
+            sys.stderr.write("\n")
+            self._is_printed = False
+
+
+def _get_round_callback(
+    round_callbacks: List[Callable[[RoundResult], None]]
+) -> Optional[Callable[[RoundResult], None]]:
+    if not round_callbacks:
+        return None
+
+    def round_callback(round_: RoundResult):
+        for callback in round_callbacks:
+            callback(round_)
+
+    return round_callback
+
+
+def _get_format_from_extension(file_path: str, formats) -> Optional[str]:
+    extension = os.path.splitext(file_path)[1].lower()
+    for format_, extensions in formats.items():
+        if extension in extensions:
+            return format_
+    return None
@@ -0,0 +1,629 @@
+"""
+Local counting service
+
+Running the pyrankvote command for every count means starting Python, importing pyrankvote and loading the
+ballots every time. The counting service is a long-running local process that does this once: it keeps a
+pool of warm worker processes, and ballot sets that stay loaded (as SharedEncodedBallots, see
+shared_ballots.py) under a handle. Counts are run concurrently by the worker processes, that attach to the
+shared ballots instead of getting a copy of them. When more than max_pending_counts counts are waiting, new
+counts are refused (with HTTP status 503) instead of piling up.
+
+The service is reached over HTTP, on localhost or on a Unix socket:
+
+    python -m pyrankvote.counting_service --socket /tmp/pyrankvote.sock --jobs 4
+
+ - POST /ballots with {"file": path, "format": "csv"} loads a ballot file in the ballot directory (given with
+   --ballot-directory, ballot files can't be loaded over HTTP without it) and returns {"handle": ..}
+ - GET /ballots lists the loaded ballot sets, and DELETE /ballots/<handle> unloads one
+ - POST /count with {"handle": .., "method": "stv", "number_of_seats": 3} counts the ballots and returns
+   the winners and the rounds
+
+POST requests must have the Content-Type application/json. Browsers don't send that to another site
+without asking first (which the service never allows), so web pages can't make the service load or count
+ballots.
+
+> client = CountingClient(socket_path="/tmp/pyrankvote.sock")
+> handle = client.load_ballots("ballots.normalized.csv")
+> client.count(handle, "irv")["winners"]
+"""
+
+import argparse
+import collections
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from pyrankvote import command_line
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.helpers import ElectionResults
+from pyrankvote.shared_ballots import SharedEncodedBallots, resource_tracker
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8421
+MAX_REQUEST_SIZE = 1024 * 1024
+
+# Number of ballot sets each worker process keeps attached
+WORKER_CACHE_SIZE = 8
+
+
+class ServiceBusyError(RuntimeError):
+    pass
+
+
+class CountingService:
+    """
+    Keeps ballot sets loaded by handle, and counts them with a pool of jobs worker processes (one for each
+    CPU by default). At most max_pending_counts counts (4 per worker by default) are running or waiting at
+    a time, and count(..) raises ServiceBusyError when the limit is reached.
+
+    Over HTTP, only ballot files in ballot_directory can be loaded (see get_ballot_file_path).
+    """
+
+    def __init__(
+        self,
+        jobs: Optional[int] = None,
+        max_pending_counts: Optional[int] = None,
+        storage: Optional[str] = None,
+        ballot_directory: Optional[str] = None,
+    ):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_pending_counts = max_pending_counts or 4 * self.jobs
+        self.storage = storage
+        self.ballot_directory = None if ballot_directory is None else os.path.realpath(ballot_directory)
+
+        if resource_tracker is not None:
+            # Workers must share the resource tracker of this process, or their own trackers would remove
+            # the shared ballots when the workers exit
+            resource_tracker.ensure_running()
+        self._workers = [_Worker() for _ in range(self.jobs)]
+        self._idle_workers: "queue.Queue[_Worker]" = queue.Queue()
+        for worker in self._workers:
+            self._idle_workers.put(worker)
+
+        self._ballot_sets: Dict[str, SharedEncodedBallots] = {}
+        self._lock = threading.Lock()
+        self._number_of_pending_counts = 0
+        # Counts running or waiting for each ballot set, by name, and the unloaded ballot sets that are
+        # removed when their last count ends
+        self._number_of_counts_by_name: "collections.Counter[str]" = collections.Counter()
+        self._unloaded_ballot_sets: Dict[str, SharedEncodedBallots] = {}
+
+    def __repr__(self) -> str:
+        return "<CountingService(%i jobs, %i ballot sets)>" % (self.jobs, len(self._ballot_sets))
+
+    def __enter__(self) -> "CountingService":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_ballots(self, encoded_ballots: EncodedBallots) -> str:
+        """Copies the ballots to shared memory, and returns the handle of the ballot set"""
+        shared_ballots = SharedEncodedBallots.create(encoded_ballots, storage=self.storage)
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._ballot_sets[handle] = shared_ballots
+        return handle
+
+    def load_ballots(
+        self, file_path: str, input_format: Optional[str] = None, use_cache: bool = True
+    ) -> str:
+        """Loads a ballot file (in one of the formats of the pyrankvote command), and returns the handle"""
+        if input_format is None:
+            input_format = command_line._get_format_from_extension(
+                file_path, command_line.INPUT_FORMATS
+            )
+            if input_format is None:
+                raise ValueError("Unknown file format of %s" % file_path)
+        elif input_format not in command_line.INPUT_FORMATS:
+            raise ValueError("Unknown file format %r" % input_format)
+
+        encoded_ballots = command_line.load_ballots(file_path, input_format, use_cache=use_cache)
+        return self.add_ballots(encoded_ballots)
+
+    def get_ballot_file_path(self, file_path: str) -> str:
+        """
+        Returns the real path of a ballot file in the ballot directory (relative paths are relative to it),
+        and raises PermissionError if there is no ballot directory or the file is outside it
+        """
+        if self.ballot_directory is None:
+            raise PermissionError("Ballot files can only be loaded from a ballot directory")
+        real_path = os.path.realpath(os.path.join(self.ballot_directory, file_path))
+        if os.path.commonpath([real_path, self.ballot_directory]) != self.ballot_directory:
+            raise PermissionError("%s is not in the ballot directory" % file_path)
+        return real_path
+
+    def unload(self, handle: str):
+        """
+        Removes the ballot set. Counts of it that are already running or waiting are not affected: the
+        shared ballots are removed when the last of them ends.
+        """
+        with self._lock:
+            shared_ballots = self._ballot_sets.pop(handle, None)
+            if shared_ballots is None:
+                raise KeyError("Unknown ballot set %r" % handle)
+            if self._number_of_counts_by_name[shared_ballots.name] > 0:
+                self._unloaded_ballot_sets[shared_ballots.name] = shared_ballots
+                return
+        self._remove_ballot_set(shared_ballots)
+
+    def get_ballot_sets(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the number of ballots and the candidates of every ballot set, by handle"""
+        with self._lock:
+            ballot_sets = list(self._ballot_sets.items())
+        return {
+            handle: {
+                "number_of_ballots": shared_ballots.get_number_of_ballots(),
+                "candidates": [candidate.name for candidate in shared_ballots.candidates],
+                "metadata": shared_ballots.metadata,
+            }
+            for handle, shared_ballots in ballot_sets
+        }
+
+    def get_number_of_pending_counts(self) -> int:
+        return self._number_of_pending_counts
+
+    def count(
+        self, handle: str, method: str = "irv", number_of_seats: Optional[int] = None
+    ) -> ElectionResults:
+        """
+        Counts a ballot set with method (irv, stv or pbv) in one of the worker processes. The number of
+        seats is read from the ballot set metadata (like BLT files) if not given.
+        """
+        if method not in command_line.METHODS:
+            raise ValueError("Unknown method %r" % method)
+
+        with self._lock:
+            shared_ballots = self._ballot_sets.get(handle)
+            if shared_ballots is None:
+                raise KeyError("Unknown ballot set %r" % handle)
+            if self._number_of_pending_counts >= self.max_pending_counts:
+                raise ServiceBusyError(
+                    "%i counts are already pending" % self._number_of_pending_counts
+                )
+            self._number_of_pending_counts += 1
+            self._number_of_counts_by_name[shared_ballots.name] += 1
+
+        try:
+            worker = self._idle_workers.get()
+            try:
+                return worker.count((shared_ballots.name, shared_ballots.storage), method, number_of_seats)
+            finally:
+                self._idle_workers.put(worker)
+        finally:
+            self._end_count(shared_ballots)
+
+    def close(self):
+        """Removes all ballot sets, and stops the worker processes"""
+        with self._lock:
+            ballot_sets = list(self._ballot_sets.values()) + list(self._unloaded_ballot_sets.values())
+            self._ballot_sets.clear()
+            self._unloaded_ballot_sets.clear()
+        for shared_ballots in ballot_sets:
+            shared_ballots.unlink()
+        for worker in self._workers:
+            worker.stop()
+
+    def _end_count(self, shared_ballots: SharedEncodedBallots):
+        with self._lock:
+            self._number_of_pending_counts -= 1
+            self._number_of_counts_by_name[shared_ballots.name] -= 1
+            if self._number_of_counts_by_name[shared_ballots.name] > 0:
+                return
+            del self._number_of_counts_by_name[shared_ballots.name]
+            if self._unloaded_ballot_sets.pop(shared_ballots.name, None) is None:
+                return
+        # The ballot set was unloaded during the count
+        self._remove_ballot_set(shared_ballots)
+
+    def _remove_ballot_set(self, shared_ballots: SharedEncodedBallots):
+        """Removes the shared ballots, and makes every worker process detach from them"""
+        shared_ballots.unlink()
+        # A busy worker detaches after its count, as it handles its messages in order
+        for worker in self._workers:
+            worker.detach((shared_ballots.name, shared_ballots.storage))
+
+
+# WORKER PROCESSES
+
+
+class _Worker:
+    """
+    A worker process, and the connection to it. The worker handles the messages it gets in order: counts,
+    which it answers with the results (or the error), and requests to detach from a ballot set.
+    """
+
+    def __init__(self):
+        self._connection, worker_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_run_worker, args=(worker_connection,), daemon=True)
+        self._process.start()
+        worker_connection.close()
+        # Detach requests may be sent while a count is waiting for its results
+        self._send_lock = threading.Lock()
+
+    def count(
+        self, name_and_storage: Tuple[str, str], method: str, number_of_seats: Optional[int]
+    ) -> ElectionResults:
+        self._send(("count", (name_and_storage, method, number_of_seats)))
+        succeeded, result = self._connection.recv()
+        if not succeeded:
+            raise result
+        return result
+
+    def detach(self, name_and_storage: Tuple[str, str]):
+        self._send(("detach", (name_and_storage,)))
+
+    def stop(self):
+        self._connection.close()
+        self._process.terminate()
+        self._process.join()
+
+    def _send(self, message: Tuple[str, Tuple]):
+        with self._send_lock:
+            self._connection.send(message)
+
+
+# The ballot sets attached in a worker process, with the BallotProfile they are counted on
+_AttachedBallotSet = Tuple[SharedEncodedBallots, BallotProfile]
+_attached_ballot_sets: "collections.OrderedDict[Tuple[str, str], _AttachedBallotSet]" = (
+    collections.OrderedDict()
+)
+
+
+def _run_worker(connection):
+    # Ctrl+C stops the service, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            return
+
+        if command == "detach":
+            _detach_ballot_set(*args)
+            continue
+        try:
+            connection.send((True, _count_ballot_set(*args)))
+        except Exception as error:
+            connection.send((False, error))
+
+
+def _get_ballot_profile(name_and_storage: Tuple[str, str]) -> BallotProfile:
+    """
+    Returns the profile of a ballot set attached in this worker process, attaching to it if needed. The
+    profile keeps the ballot trie and first votes for the next counts of the ballot set.
+    """
+    if name_and_storage in _attached_ballot_sets:
+        _attached_ballot_sets.move_to_end(name_and_storage)
+        return _attached_ballot_sets[name_and_storage][1]
+
+    shared_ballots = SharedEncodedBallots.attach(*name_and_storage)
+    ballot_profile = BallotProfile(shared_ballots.candidates, shared_ballots)
+    _attached_ballot_sets[name_and_storage] = (shared_ballots, ballot_profile)
+    if len(_attached_ballot_sets) > WORKER_CACHE_SIZE:
+        _, (least_recently_used, _) = _attached_ballot_sets.popitem(last=False)
+        least_recently_used.close()
+    return ballot_profile
+
+
+def _detach_ballot_set(name_and_storage: Tuple[str, str]):
+    """Detaches this worker process from a ballot set that is removed from the service"""
+    if name_and_storage in _attached_ballot_sets:
+        shared_ballots, _ = _attached_ballot_sets.pop(name_and_storage)
+        shared_ballots.close()
+
+
+def _count_ballot_set(
+    name_and_storage: Tuple[str, str], method: str, number_of_seats: Optional[int]
+) -> ElectionResults:
+    ballot_profile = _get_ballot_profile(name_and_storage)
+    encoded_ballots = ballot_profile.get_encoded_ballots()
+
+    number_of_seats = number_of_seats or encoded_ballots.metadata.get("number_of_seats", 1)
+    if method == "irv" and number_of_seats != 1:
+        raise ValueError("Instant runoff voting elects one candidate, use stv or pbv")
+
+    withdrawn_names = set(encoded_ballots.metadata.get("withdrawn_candidates", []))
+    candidates = [
+        candidate for candidate in encoded_ballots.candidates if candidate.name not in withdrawn_names
+    ]
+    withdrawn_candidates = [
+        candidate for candidate in encoded_ballots.candidates if candidate.name in withdrawn_names
+    ]
+
+    kwargs = {} if method == "irv" else {"number_of_seats": number_of_seats}
+    kwargs["withdrawn_candidates"] = withdrawn_candidates
+    return command_line.METHODS[method](candidates, ballot_profile, **kwargs)
+
+
+# HTTP SERVER
+
+
+def election_results_to_json(election_results: ElectionResults) -> Dict[str, Any]:
+    return {
+        "winners": [candidate.name for candidate in election_results.get_winners()],
+        "rounds": [
+            {
+                "blank_votes": round_.number_of_blank_votes,
+                "candidates": [
+                    [candidate.name, number_of_votes, status]
+                    for candidate, number_of_votes, status in round_.candidate_results
+                ],
+            }
+            for round_ in election_results.rounds
+        ],
+    }
+
+
+class _UnsupportedMediaTypeError(ValueError):
+    pass
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "pyrankvote"
+
+    def do_GET(self):
+        service = self.server.counting_service
+        if self.path == "/ballots":
+            self._send_json(200, service.get_ballot_sets())
+        elif self.path == "/status":
+            self._send_json(
+                200,
+                {
+                    "jobs": service.jobs,
+                    "pending_counts": service.get_number_of_pending_counts(),
+                    "max_pending_counts": service.max_pending_counts,
+                },
+            )
+        else:
+            self._send_error(404, "Unknown path %s" % self.path)
+
+    def do_POST(self):
+        service = self.server.counting_service
+        try:
+            request = self._read_json()
+            if self.path == "/ballots":
+                handle = service.load_ballots(
+                    service.get_ballot_file_path(request["file"]),
+                    request.get("format"),
+                    request.get("use_cache", True),
+                )
+                self._send_json(200, {"handle": handle})
+            elif self.path == "/count":
+                election_results = service.count(
+                    request["handle"], request.get("method", "irv"), request.get("number_of_seats")
+                )
+                self._send_json(200, election_results_to_json(election_results))
+            else:
+                self._send_error(404, "Unknown path %s" % self.path)
+        except ServiceBusyError as error:
+            self._send_error(503, str(error))
+        except _UnsupportedMediaTypeError as error:
+            self._send_error(415, str(error))
+        except KeyError as error:
+            self._send_error(404 if self.path == "/count" else 400, "Missing or unknown %s" % error)
+        except PermissionError as error:
+            self._send_error(403, str(error))
+        except (OSError, ValueError, TypeError) as error:
+            self._send_error(400, str(error))
+
+    def do_DELETE(self):
+        prefix = "/ballots/"
+        if not self.path.startswith(prefix):
+            self._send_error(404, "Unknown path %s" % self.path)
+            return
+        try:
+            self.server.counting_service.unload(self.path[len(prefix) :])
+        except KeyError as error:
+            self._send_error(404, str(error))
+            return
+        self._send_json(200, {})
+
+    def address_string(self) -> str:
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST_SIZE:
+            raise ValueError("The request is too large")
+        body = self.rfile.read(length)
+        if self.headers.get_content_type() != "application/json":
+            raise _UnsupportedMediaTypeError("The Content-Type must be application/json")
+        request = json.loads(body.decode("utf-8") or "{}")
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object")
+        return request
+
+    def _send_json(self, status: int, data: Any):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {"error": message})
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(
+    counting_service: CountingService,
+    socket_path: Optional[str] = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    verbose: bool = False,
+) -> socketserver.BaseServer:
+    """
+    Returns an HTTP server for the counting service on the Unix socket socket_path, or on host and port.
+    Call serve_forever() to handle requests, each in a thread of its own.
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+    else:
+        server = _HTTPServer((host, port), _RequestHandler)
+
+    server.counting_service = counting_service
+    server.verbose = verbose
+    return server
+
+
+# CLIENT
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class CountingClient:
+    """Client of a counting service on the Unix socket socket_path, or on host and port"""
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        timeout: Optional[float] = None,
+    ):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        address = self.socket_path or "%s:%i" % (self.host, self.port)
+        return "<CountingClient('%s')>" % address
+
+    def load_ballots(
+        self, file_path: str, input_format: Optional[str] = None, use_cache: bool = True
+    ) -> str:
+        request = {"file": os.path.abspath(file_path), "format": input_format, "use_cache": use_cache}
+        return self._request("POST", "/ballots", request)["handle"]
+
+    def get_ballot_sets(self) -> Dict[str, Dict[str, Any]]:
+        return self._request("GET", "/ballots")
+
+    def unload(self, handle: str):
+        self._request("DELETE", "/ballots/%s" % handle)
+
+    def count(
+        self, handle: str, method: str = "irv", number_of_seats: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Returns the results as {"winners": [names], "rounds": [{"blank_votes", "candidates"}]}"""
+        request = {"handle": handle, "method": method, "number_of_seats": number_of_seats}
+        return self._request("POST", "/count", request)
+
+    def _request(self, http_method: str, path: str, request: Optional[Dict] = None) -> Any:
+        if self.socket_path is not None:
+            connection = _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        try:
+            body = None if request is None else json.dumps(request).encode("utf-8")
+            headers = {} if body is None else {"Content-Type": "application/json"}
+            connection.request(http_method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+
+        if response.status == 503:
+            raise ServiceBusyError(data["error"])
+        if response.status != 200:
+            raise ValueError(data["error"])
+        return data
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pyrankvote.counting_service",
+        description="Runs a local counting service with warm worker processes.",
+    )
+    parser.add_argument("--socket", help="listen on this Unix socket instead of on localhost")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="host (default: %s)" % DEFAULT_HOST)
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="port (default: %i)" % DEFAULT_PORT
+    )
+    parser.add_argument("--jobs", type=int, help="number of worker processes (default: one per CPU)")
+    parser.add_argument(
+        "--max-pending", type=int, help="number of pending counts before new counts are refused"
+    )
+    parser.add_argument("--load", action="append", default=[], help="ballot file to load at start")
+    parser.add_argument(
+        "--ballot-directory", help="directory of the ballot files that can be loaded with POST /ballots"
+    )
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    arguments = parser.parse_args(argv)
+
+    with CountingService(
+        jobs=arguments.jobs,
+        max_pending_counts=arguments.max_pending,
+        ballot_directory=arguments.ballot_directory,
+    ) as service:
+        for file_path in arguments.load:
+            try:
+                handle = service.load_ballots(file_path)
+            except (OSError, ValueError) as error:
+                print("pyrankvote: error: %s" % error, file=sys.stderr)
+                return 1
+            print("Loaded %s as %s" % (file_path, handle), flush=True)
+
+        server = create_server(
+            service, arguments.socket, arguments.host, arguments.port, verbose=arguments.verbose
+        )
+        print("Listening on %s" % (arguments.socket or "%s:%i" % (arguments.host, arguments.port)))
+
+        # Stop the same way on SIGTERM as on Ctrl+C, so the shared ballots are removed
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if arguments.socket is not None:
+                os.remove(arguments.socket)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
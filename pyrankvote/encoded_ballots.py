@@ -0,0 +1,253 @@
+"""
+Compact encoded form of a set of ballots.
+
+EncodedBallots stores every distinct ranking once, together with the number of ballots that have that
+ranking. Candidates are encoded as integer indexes (the index in EncodedBallots.candidates), and the
+rankings are stored back to back in typed arrays:
+
+ - offsets: ranking i is rankings[offsets[i]:offsets[i + 1]]
+ - counts: number of ballots with ranking i (integers, or weights as floats if a count is not an integer)
+ - rankings: candidate indexes
+
+The arrays can be saved to a binary file and memory-mapped when loaded, so large ballot sets can be
+reused without parsing them again.
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.models import Candidate, Ballot
+
+
+FILE_MAGIC = b"PRVENC\x00\x01"
+HEADER_FORMAT = "<8sQ"  # Magic and length of the JSON header
+ALIGNMENT = 8
+
+OFFSET_TYPECODE = "q"
+COUNT_TYPECODE = "q"
+WEIGHT_TYPECODE = "d"  # Counts that are not integers (weighted ballots)
+RANKING_TYPECODE = "i"
+
+
+class EncodedBallots:
+    """
+    A set of ballots where each distinct ranking is stored once with its number of ballots.
+
+    EncodedBallots can be given directly to the ranking methods instead of a list of ballots:
+
+    > encoded_ballots = EncodedBallots.from_ballots(candidates, ballots)
+    > election_result = pyrankvote.instant_runoff_voting(encoded_ballots.candidates, encoded_ballots)
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        offsets: Sequence[int],
+        counts: Sequence[int],
+        rankings: Sequence[int],
+        metadata: Optional[Dict] = None,
+    ):
+        self.candidates: List[Candidate] = list(candidates)
+        self.offsets = offsets
+        self.counts = counts
+        self.rankings = rankings
+        self.metadata: Dict = metadata or {}
+
+        # The memory map the arrays are views of (if loaded with use_mmap=True)
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_ranking_counts(
+        cls,
+        candidates: List[Candidate],
+        ranking_counts: Iterable[Tuple[Sequence[int], int]],
+        metadata: Optional[Dict] = None,
+    ) -> "EncodedBallots":
+        """
+        Creates EncodedBallots from (ranking, number of ballots) pairs, where rankings are candidate indexes.
+        If a number of ballots is a float (a weight), all counts are stored as floats.
+        """
+        offsets = array.array(OFFSET_TYPECODE, [0])
+        counts = array.array(COUNT_TYPECODE)
+        rankings = array.array(RANKING_TYPECODE)
+
+        for ranking, count in ranking_counts:
+            rankings.extend(ranking)
+            offsets.append(len(rankings))
+            if counts.typecode == COUNT_TYPECODE and not isinstance(count, int):
+                counts = array.array(WEIGHT_TYPECODE, counts)
+            counts.append(count)
+
+        return cls(candidates, offsets, counts, rankings, metadata)
+
+    @classmethod
+    def from_ballots(cls, candidates: List[Candidate], ballots: Iterable[Ballot]) -> "EncodedBallots":
+        candidate_indexes = {candidate: index for index, candidate in enumerate(candidates)}
+        ranking_counts: Dict[Tuple[int, ...], int] = {}
+
+        for ballot in ballots:
+            ranking = tuple(candidate_indexes[candidate] for candidate in ballot.ranked_candidates)
+            ranking_counts[ranking] = ranking_counts.get(ranking, 0) + 1
+
+        return cls.from_ranking_counts(candidates, ranking_counts.items())
+
+    def __repr__(self) -> str:
+        return "<EncodedBallots(%i ballots, %i distinct rankings)>" % (
+            self.get_number_of_ballots(),
+            len(self),
+        )
+
+    def __len__(self) -> int:
+        """Returns the number of distinct rankings"""
+        return len(self.offsets) - 1
+
+    def get_number_of_ballots(self) -> float:
+        return sum(self.counts)
+
+    def is_weighted(self) -> bool:
+        """Returns True if the counts are weights (floats) instead of numbers of ballots"""
+        return _get_count_typecode(self.counts) == WEIGHT_TYPECODE
+
+    def get_ranking(self, i: int) -> Tuple[int, ...]:
+        return tuple(self.rankings[self.offsets[i] : self.offsets[i + 1]])
+
+    def iter_rankings(self) -> Iterator[Tuple[Tuple[int, ...], int]]:
+        """Yields (ranking, number of ballots) for every distinct ranking"""
+        offsets, counts, rankings = self.offsets, self.counts, self.rankings
+        for i in range(len(self)):
+            yield tuple(rankings[offsets[i] : offsets[i + 1]]), counts[i]
+
+    def to_ballots(self) -> List[Ballot]:
+        """Returns a list of Ballot objects, with one object for every ballot"""
+        if self.is_weighted():
+            raise ValueError("Weighted ballots can not be converted to Ballot objects")
+
+        ballots = []
+        for ranking, count in self.iter_rankings():
+            ranked_candidates = [self.candidates[index] for index in ranking]
+            ballots.extend(Ballot(ranked_candidates=ranked_candidates) for _ in range(count))
+        return ballots
+
+    def to_trie(self) -> BallotTrie:
+        trie = BallotTrie(self.candidates)
+        for ranking, count in self.iter_rankings():
+            trie.add_ranking(ranking, count)
+        return trie
+
+    # FILE FORMAT
+
+    def save(self, file_path: str):
+        """
+        Saves the encoded ballots to a binary file: a JSON header with candidate names and
+        metadata, followed by the offsets, counts and rankings arrays.
+        """
+        with open(file_path, "wb") as f:
+            for section in self._get_file_sections():
+                f.write(section)
+
+    @classmethod
+    def load(cls, file_path: str, use_mmap: bool = True) -> "EncodedBallots":
+        """
+        Loads encoded ballots saved with EncodedBallots.save(..).
+
+        With use_mmap=True the arrays are read-only views of the memory-mapped file, so they are not
+        copied into memory before they are used.
+        """
+        with open(file_path, "rb") as f:
+            if use_mmap:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+
+        encoded_ballots = cls(*_parse_buffer(buffer, file_path))
+        if use_mmap:
+            encoded_ballots._mmap = buffer
+        return encoded_ballots
+
+    # INTERNAL METHODS
+
+    def _get_file_sections(self) -> List:
+        """Returns the file content as a list of bytes-like objects (the arrays are not copied)"""
+        header = {
+            "candidates": [candidate.name for candidate in self.candidates],
+            "number_of_rankings": len(self),
+            "ranking_length": len(self.rankings),
+            "count_typecode": _get_count_typecode(self.counts),
+            "byteorder": sys.byteorder,
+            "metadata": self.metadata,
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (-(struct.calcsize(HEADER_FORMAT) + len(header_bytes)) % ALIGNMENT)
+
+        sections = [struct.pack(HEADER_FORMAT, FILE_MAGIC, len(header_bytes)), header_bytes]
+        for typecode, values in [
+            (OFFSET_TYPECODE, self.offsets),
+            (header["count_typecode"], self.counts),
+            (RANKING_TYPECODE, self.rankings),
+        ]:
+            if not isinstance(values, (array.array, memoryview)) or _get_typecode(values) != typecode:
+                values = array.array(typecode, values)
+            data = memoryview(values).cast("B")
+            sections.append(data)
+            sections.append(b"\0" * (-len(data) % ALIGNMENT))
+        return sections
+
+
+def _get_typecode(values) -> str:
+    return values.typecode if isinstance(values, array.array) else values.format
+
+
+def _get_count_typecode(counts) -> str:
+    if isinstance(counts, (array.array, memoryview)):
+        return _get_typecode(counts)
+    return COUNT_TYPECODE if all(isinstance(count, int) for count in counts) else WEIGHT_TYPECODE
+
+
+def _parse_buffer(buffer, source_name: str) -> Tuple:
+    """Returns the EncodedBallots arguments from a buffer with the content of an encoded ballots file"""
+    header_size = struct.calcsize(HEADER_FORMAT)
+    magic, header_length = struct.unpack_from(HEADER_FORMAT, buffer)
+    if magic != FILE_MAGIC:
+        raise ValueError("%s is not an encoded ballots file" % source_name)
+
+    header = json.loads(bytes(buffer[header_size : header_size + header_length]).decode("utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("%s was saved with another byte order" % source_name)
+
+    view = memoryview(buffer)
+    position = header_size + header_length
+    arrays = []
+    for typecode, length in [
+        (OFFSET_TYPECODE, header["number_of_rankings"] + 1),
+        (header.get("count_typecode", COUNT_TYPECODE), header["number_of_rankings"]),
+        (RANKING_TYPECODE, header["ranking_length"]),
+    ]:
+        size = length * array.array(typecode).itemsize
+        arrays.append(view[position : position + size].cast(typecode))
+        position += size + (-size % ALIGNMENT)
+
+    offsets, counts, rankings = arrays
+    candidates = [Candidate(name) for name in header["candidates"]]
+    return candidates, offsets, counts, rankings, header["metadata"]
+
+
+def get_ballot_trie(candidates: List[Candidate], ballots) -> BallotTrie:
+    """
+    Returns the ballots as a BallotTrie, where ballots is a list of ballots, EncodedBallots, a BallotTrie or
+    a BallotProfile
+    """
+    # BallotProfile is built on EncodedBallots, so it can only be imported here
+    from pyrankvote.ballot_profile import BallotProfile
+
+    if isinstance(ballots, BallotProfile):
+        return ballots.get_trie()
+    if isinstance(ballots, BallotTrie):
+        return ballots
+    if isinstance(ballots, EncodedBallots):
+        return ballots.to_trie()
+    return BallotTrie.from_ballots(candidates, ballots)
@@ -3,10 +3,12 @@ Helper classes used by multiple_seat_ranking_methods.py
 
 """
 from pyrankvote.models import Candidate, Ballot
+from pyrankvote.audit_log import NO_CANDIDATE
 
+import array
 import random
 import functools
-from typing import List, NamedTuple
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
 from tabulate import tabulate
 
 
@@ -23,21 +25,114 @@ class CandidateStatus:
     Rejected = "Rejected"
 
 
+# Compact codes for the statuses, used when results are serialized
+STATUS_CODES = {
+    CandidateStatus.Elected: 0,
+    CandidateStatus.Hopeful: 1,
+    CandidateStatus.Rejected: 2,
+}
+STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+
 class CandidateResult(NamedTuple):
     candidate: Candidate
     number_of_votes: float
     status: CandidateStatus
 
 
+class TransferMatrix:
+    """
+    The votes transferred from each candidate to each other candidate (or to blank votes when ballots
+    are exhausted) between two rounds.
+
+    Only the candidates votes were transferred from get a row: with n candidates, rows[i][j] is the number
+    of votes transferred from candidates[i] to candidates[j], and rows[i][n] is the number of votes from
+    candidates[i] that were exhausted.
+    """
+
+    def __init__(self, candidates: List[Candidate], rows: Optional[Dict[int, array.array]] = None):
+        self.candidates: List[Candidate] = list(candidates)
+        self._candidate_indexes: Dict[Candidate, int] = {
+            candidate: index for index, candidate in enumerate(self.candidates)
+        }
+
+        number_of_columns = len(self.candidates) + 1
+        if rows is None:
+            rows = {}
+        for from_index, row in rows.items():
+            if not 0 <= from_index < len(self.candidates):
+                raise ValueError("Invalid candidate index %i" % from_index)
+            if len(row) != number_of_columns:
+                raise ValueError("Expected %i transferred votes, got %i" % (number_of_columns, len(row)))
+        self.rows: Dict[int, array.array] = rows
+
+    def __repr__(self) -> str:
+        return "<TransferMatrix(%i candidates, %.2f votes)>" % (
+            len(self.candidates),
+            sum(sum(row) for row in self.rows.values()),
+        )
+
+    def __str__(self) -> str:
+        rows = []
+        for from_candidate in self.candidates:
+            transfers = self.get_transfers_from(from_candidate)
+            for to_candidate, number_of_votes in transfers.items():
+                to_name = "Blank Votes" if to_candidate is None else str(to_candidate)
+                rows.append((str(from_candidate), to_name, number_of_votes))
+
+        return tabulate(rows, headers=["From", "To", "Votes"], floatfmt=".2f")
+
+    def get_row(self, from_index: int) -> array.array:
+        """Returns the row with the votes transferred from the candidate with index from_index"""
+        row = self.rows.get(from_index)
+        if row is None:
+            row = self.rows[from_index] = array.array("d", bytes(8 * (len(self.candidates) + 1)))
+        return row
+
+    def add_votes(self, from_index: int, to_index: Optional[int], number_of_votes: float):
+        """Adds transferred votes, with candidates given as indexes (to_index is None for exhausted votes)"""
+        if to_index is None:
+            to_index = len(self.candidates)
+        self.get_row(from_index)[to_index] += number_of_votes
+
+    def get_number_of_votes(
+        self, from_candidate: Candidate, to_candidate: Optional[Candidate]
+    ) -> float:
+        """Returns the votes transferred from from_candidate to to_candidate (or exhausted if None)"""
+        row = self.rows.get(self._candidate_indexes[from_candidate])
+        if row is None:
+            return 0.0
+        if to_candidate is None:
+            return row[len(self.candidates)]
+        return row[self._candidate_indexes[to_candidate]]
+
+    def get_transfers_from(self, candidate: Candidate) -> Dict[Optional[Candidate], float]:
+        """Returns the votes transferred from candidate to each receiving candidate (None for exhausted votes)"""
+        row = self.rows.get(self._candidate_indexes[candidate])
+        if row is None:
+            return {}
+        receivers = self.candidates + [None]
+        return {
+            receiver: number_of_votes
+            for receiver, number_of_votes in zip(receivers, row)
+            if number_of_votes != 0.0
+        }
+
+
 class RoundResult:
     candidate_results: List[CandidateResult]
     number_of_blank_votes: float
+    transfers: Optional[TransferMatrix]
 
     def __init__(
-        self, candidate_results: List[CandidateResult], number_of_blank_votes: float
+        self,
+        candidate_results: List[CandidateResult],
+        number_of_blank_votes: float,
+        transfers: Optional[TransferMatrix] = None,
     ):
         self.candidate_results = candidate_results
         self.number_of_blank_votes = number_of_blank_votes
+        self.transfers = transfers
 
     def __repr__(self) -> str:
         representation_string = "<RoundResult>"
@@ -80,6 +175,15 @@ class CandidateVoteCount:
         self.number_of_votes = 0.0
         self.votes: List[Ballot] = []
 
+        # The index of each ballot in votes in the list of ballots (only kept when the count has an audit log,
+        # since the same Ballot object can be in the list more than once)
+        self.ballot_indexes = array.array("q")
+
+        # The last parcel of votes is votes[last_parcel_start:], received with the value last_parcel_value
+        # per ballot (used by SurplusTransferMethod.LastParcel)
+        self.last_parcel_start = 0
+        self.last_parcel_value = 1.0
+
     @property
     def is_in_race(self) -> bool:
         return self.status == CandidateStatus.Hopeful
@@ -99,6 +203,66 @@ class CompareMethodIfEqual:
     MostSecondChoiceVotes = "MostSecondChoiceVotes"
 
 
+class SurplusTransferMethod:
+    """
+    How the surplus of an elected candidate is transferred in single transferable vote.
+
+     - AllBallots: all the ballots of the candidate are transferred, each with an equal share of the surplus
+     - LastParcel: only the ballots in the last parcel the candidate received are transferred (as in the
+       Irish and several Australian rules). A ballot is never transferred with a higher value than it was
+       received with, and the rest of the surplus is not transferable (it is counted as blank votes).
+    """
+
+    AllBallots = "AllBallots"
+    LastParcel = "LastParcel"
+
+
+class DrawnLots:
+    """
+    Lots drawn before the count, used to break ties. The candidates are ranked in the order the lots are
+    drawn, and when two candidates have the same number of votes, the candidate ranked first is ranked
+    before the other. Unlike CompareMethodIfEqual.Random, the comparisons are consistent, and each takes
+    constant time.
+
+    DrawnLots can be given as compare_method_if_equal to the ranking methods. With
+    after_most_second_choice_votes=True, ties are first broken by the most second choice votes (as with
+    CompareMethodIfEqual.MostSecondChoiceVotes), and the lots are only used if that is equal too.
+
+    > lots = DrawnLots.from_seed(candidates, seed=2019)
+    > election_result = pyrankvote.instant_runoff_voting(candidates, ballots, compare_method_if_equal=lots)
+    """
+
+    def __init__(
+        self, ranked_candidates: List[Candidate], after_most_second_choice_votes: bool = False
+    ):
+        self.ranked_candidates: List[Candidate] = list(ranked_candidates)
+        self.after_most_second_choice_votes = after_most_second_choice_votes
+
+        self._positions = {candidate: i for i, candidate in enumerate(self.ranked_candidates)}
+        if len(self._positions) != len(self.ranked_candidates):
+            raise ValueError("A candidate can only be drawn once")
+
+    @classmethod
+    def from_seed(
+        cls, candidates: List[Candidate], seed, after_most_second_choice_votes: bool = False
+    ) -> "DrawnLots":
+        """Draws the lots with a random number generator seeded with seed"""
+        ranked_candidates = random.Random(seed).sample(list(candidates), len(candidates))
+        return cls(ranked_candidates, after_most_second_choice_votes)
+
+    def __repr__(self) -> str:
+        return "<DrawnLots(%s, after_most_second_choice_votes=%s)>" % (
+            [candidate.name for candidate in self.ranked_candidates],
+            self.after_most_second_choice_votes,
+        )
+
+    def __contains__(self, candidate: Candidate) -> bool:
+        return candidate in self._positions
+
+    def is_ranked_before(self, candidate1: Candidate, candidate2: Candidate) -> bool:
+        return self._positions[candidate1] < self._positions[candidate2]
+
+
 class NoCandidatesLeftInRaceError(RuntimeError):
     pass
 
@@ -120,6 +284,9 @@ class ElectionManager:
     excess votes if a candidate gets more votes than necessary. That way even if many people voted for this
     candidate, the votes are still useful.
 
+    Candidates in withdrawn_candidates are skipped on every ballot, as if the ballots were rewritten without
+    them. Any other candidate on a ballot that is not in the list of candidates raises KeyError.
+
     transfer_votes(..) and other methods that effects the proper ranking of candidates, re-sorts
     the ranking of candidates, so _candidates_in_race should always be properly sorted.
     """
@@ -131,12 +298,18 @@ class ElectionManager:
         number_of_votes_pr_voter=1,
         compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
         pick_random_if_blank=False,
+        audit_log=None,
+        withdrawn_candidates: Iterable[Candidate] = (),
     ):
 
         self._ballots = ballots
         self._candidate_vote_counts: dict[Candidate:CandidateVoteCount] = {
             candidate: CandidateVoteCount(candidate) for candidate in candidates
         }
+        self._withdrawn_candidates: FrozenSet[Candidate] = frozenset(withdrawn_candidates)
+        for candidate in self._withdrawn_candidates:
+            if candidate in self._candidate_vote_counts:
+                raise ValueError("%s is both a candidate and withdrawn" % candidate)
 
         self._candidates_in_race: List[CandidateVoteCount] = list(
             self._candidate_vote_counts.values()
@@ -152,38 +325,30 @@ class ElectionManager:
         ] = []  # Blank and exhausted ballots (all alternatives used up)
         self._number_of_blank_votes = 0.0
 
+        # Votes transferred since the last get_results(), None if there are none
+        self._candidate_indexes: Dict[Candidate, int] = {
+            candidate: index for index, candidate in enumerate(candidates)
+        }
+        self._transfers: Optional[TransferMatrix] = None
+
         self._number_of_candidates = len(candidates)
         self._number_of_votes_pr_voter = number_of_votes_pr_voter
         self._compare_method_if_equal = compare_method_if_equal
-        self._pick_random_if_blank = pick_random_if_blank
 
-        # Distribute votes to the most preferred candidates (before any candidates are elected or rejected)
-        for ballot in ballots:
-            # If one vote per voter -> Voters vote goes to the first candidate on the ranked list
-            # If more than one vote per voter -> Voters votes goes to the x first candidates on the ranked list
-            candidates_that_should_be_voted_on = ballot.ranked_candidates[
-                0:number_of_votes_pr_voter
-            ]
+        if isinstance(compare_method_if_equal, DrawnLots):
+            for candidate in candidates:
+                if candidate not in compare_method_if_equal:
+                    raise ValueError("No lot is drawn for %s" % candidate)
+        self._pick_random_if_blank = pick_random_if_blank
 
-            number_of_blank_votes = number_of_votes_pr_voter - len(
-                ballot.ranked_candidates
-            )
-            if number_of_blank_votes > 0:
-                if self._pick_random_if_blank:
-                    candidates_that_should_be_voted_on = list(
-                        candidates_that_should_be_voted_on
-                    )
-                    for _ in range(number_of_blank_votes):
-                        new_candidate_choice = random.choice(candidates)
-                        candidates_that_should_be_voted_on.append(new_candidate_choice)
-                else:
-                    self._exhausted_ballots.append(ballot)
-                    self._number_of_blank_votes += number_of_blank_votes
+        # Optional AuditLog (see audit_log.py), where ballots are identified by their index in ballots
+        self._audit_log = audit_log
+        self._round_number = 0
+        if audit_log is not None:
+            audit_log.begin_count(candidates)
 
-            for candidate in candidates_that_should_be_voted_on:
-                candidate_vc = self._candidate_vote_counts[candidate]
-                candidate_vc.number_of_votes += 1
-                candidate_vc.votes.append(ballot)
+        # Distribute votes to the most preferred candidates (before any candidates are elected or rejected)
+        self._distribute_votes(candidates)
 
         # After votes are distributed -> sort candidates
         # This is also done each time transfer_votes(...) is called
@@ -220,7 +385,14 @@ class ElectionManager:
         self._rejected_candidates.append(candidate_cv)
         self._candidates_in_race.remove(candidate_cv)
 
-    def transfer_votes(self, candidate: Candidate, number_of_trans_votes: float):
+    def transfer_votes(
+        self, candidate: Candidate, number_of_trans_votes: float, last_parcel_only: bool = False
+    ):
+        """
+        Transfers number_of_trans_votes votes of an elected or rejected candidate to the next candidates
+        in race on the ballots. With last_parcel_only=True only the last parcel of ballots the candidate
+        received is transferred (see SurplusTransferMethod.LastParcel).
+        """
         if candidate not in self._candidate_vote_counts:
             raise RuntimeError("Candidate not found in electionManager")
         if round(number_of_trans_votes, 4) == 0.000:
@@ -234,12 +406,27 @@ class ElectionManager:
                 "that is still in the race (candidateStatus == Hopeful)"
             )
 
-        voters = len(candidate_cv.votes)  # Voters/ballots, not votes!
-        votes_pr_voter = number_of_trans_votes / float(
-            voters
+        # Row of the transfer matrix with the votes transferred from the candidate (the last column is
+        # exhausted votes)
+        transferred_votes = self._get_transfer_matrix().get_row(self._candidate_indexes[candidate])
+        exhausted_column = len(self._candidate_indexes)
+
+        kept_ballots, ballots = self._split_ballots_to_transfer(candidate_cv, last_parcel_only)
+        voters = len(ballots)  # Voters/ballots, not votes!
+        votes_pr_voter = self._get_transferred_votes_pr_voter(
+            candidate_cv, number_of_trans_votes, voters, last_parcel_only
         )  # This is a fractional number between 0 and 1
+        parcel_starts = self._start_parcels()
+
+        audit_log = self._audit_log
+        if audit_log is not None:
+            audit_ballot_indexes = array.array("q")
+            audit_to_indexes = array.array("i")
+            # The kept ballots are always the first ballots of the vote pile
+            kept_ballot_indexes = candidate_cv.ballot_indexes[: len(kept_ballots)]
+            transferred_ballot_indexes = candidate_cv.ballot_indexes[len(kept_ballots) :]
 
-        for ballot in candidate_cv.votes:
+        for i, ballot in enumerate(ballots):
             new_candidate_choice = self._get_ballot_candidate_nr_x_in_race_or_none(
                 ballot, self._number_of_votes_pr_voter - 1
             )
@@ -255,14 +442,44 @@ class ElectionManager:
                 new_candidate_cv = self._candidate_vote_counts[new_candidate_choice]
                 new_candidate_cv.number_of_votes += votes_pr_voter
                 new_candidate_cv.votes.append(ballot)
+                if audit_log is not None:
+                    new_candidate_cv.ballot_indexes.append(transferred_ballot_indexes[i])
+                to_column = self._candidate_indexes[new_candidate_choice]
 
             # Still "Blank ballot"
             else:
                 self._exhausted_ballots.append(ballot)
                 self._number_of_blank_votes += votes_pr_voter
-
+                to_column = exhausted_column
+
+            transferred_votes[to_column] += votes_pr_voter
+            if audit_log is not None:
+                audit_ballot_indexes.append(transferred_ballot_indexes[i])
+                audit_to_indexes.append(NO_CANDIDATE if to_column == exhausted_column else to_column)
+
+        if audit_log is not None:
+            audit_log.write_transfers(
+                self._round_number,
+                self._candidate_indexes[candidate],
+                votes_pr_voter,
+                audit_ballot_indexes,
+                audit_to_indexes,
+            )
+            if last_parcel_only and voters > 0 and number_of_trans_votes / float(voters) > votes_pr_voter:
+                # The rest of the surplus is not transferable (see _get_transferred_votes_pr_voter), and
+                # is logged as exhausted from the same ballots
+                audit_log.write_transfers(
+                    self._round_number,
+                    self._candidate_indexes[candidate],
+                    number_of_trans_votes / float(voters) - votes_pr_voter,
+                    transferred_ballot_indexes,
+                    array.array("i", [NO_CANDIDATE]) * len(transferred_ballot_indexes),
+                )
+            candidate_cv.ballot_indexes = kept_ballot_indexes
+
+        self._end_parcels(parcel_starts, votes_pr_voter)
         candidate_cv.number_of_votes -= number_of_trans_votes
-        candidate_cv.votes = []
+        candidate_cv.votes = kept_ballots
 
         self._sort_candidates_in_race()
 
@@ -325,17 +542,135 @@ class ElectionManager:
             candidate_vc.as_candidate_result() for candidate_vc in candidates_vc
         ]
 
-        round_result = RoundResult(candidate_results, self._number_of_blank_votes)
+        # The round result gets the votes transferred since the previous round
+        round_result = RoundResult(
+            candidate_results, self._number_of_blank_votes, self._transfers
+        )
+        self._transfers = None
+        self._round_number += 1
         return round_result
 
     # INTERNAL METHODS
+    def _get_transfer_matrix(self) -> TransferMatrix:
+        """Returns the matrix that votes transferred in this round are added to"""
+        if self._transfers is None:
+            self._transfers = TransferMatrix(list(self._candidate_indexes))
+        return self._transfers
+
+    def _split_ballots_to_transfer(self, candidate_cv: CandidateVoteCount, last_parcel_only: bool):
+        """Returns (the ballots (or trie nodes) the candidate keeps, the ballots that are transferred)"""
+        if not last_parcel_only:
+            return [], candidate_cv.votes
+        start = candidate_cv.last_parcel_start
+        return candidate_cv.votes[:start], candidate_cv.votes[start:]
+
+    def _get_transferred_votes_pr_voter(
+        self,
+        candidate_cv: CandidateVoteCount,
+        number_of_trans_votes: float,
+        voters: float,
+        last_parcel_only: bool,
+    ) -> float:
+        """
+        Returns the value each transferred ballot gets. With last_parcel_only, ballots are never worth more
+        than the value they were received with, and the rest of number_of_trans_votes is not transferable.
+        """
+        if voters == 0:
+            votes_pr_voter = 0.0
+        else:
+            votes_pr_voter = number_of_trans_votes / float(voters)
+        if not last_parcel_only or votes_pr_voter <= candidate_cv.last_parcel_value:
+            return votes_pr_voter
+
+        votes_pr_voter = candidate_cv.last_parcel_value
+        non_transferable_votes = number_of_trans_votes - votes_pr_voter * voters
+        self._number_of_blank_votes += non_transferable_votes
+        self._get_transfer_matrix().add_votes(
+            self._candidate_indexes[candidate_cv.candidate], None, non_transferable_votes
+        )
+        return votes_pr_voter
+
+    def _start_parcels(self) -> List[Tuple[CandidateVoteCount, int]]:
+        """Returns the number of votes of each candidate in race before a transfer"""
+        return [(candidate_vc, len(candidate_vc.votes)) for candidate_vc in self._candidates_in_race]
+
+    def _end_parcels(self, parcel_starts: List[Tuple[CandidateVoteCount, int]], votes_pr_voter: float):
+        """The ballots (or trie nodes) candidates received in a transfer become their last parcel"""
+        for candidate_vc, start in parcel_starts:
+            if len(candidate_vc.votes) > start:
+                candidate_vc.last_parcel_start = start
+                candidate_vc.last_parcel_value = votes_pr_voter
+
+    def _get_vote_count_or_none(self, candidate: Candidate) -> Optional[CandidateVoteCount]:
+        """Returns the vote count of a candidate, or None if the candidate is withdrawn"""
+        if candidate in self._withdrawn_candidates:
+            return None
+        return self._candidate_vote_counts[candidate]
+
+    def _distribute_votes(self, candidates: List[Candidate]):
+        number_of_votes_pr_voter = self._number_of_votes_pr_voter
+
+        audit_log = self._audit_log
+        if audit_log is not None:
+            audit_ballot_indexes = array.array("q")
+            audit_to_indexes = array.array("i")
+
+        for ballot_index, ballot in enumerate(self._ballots):
+            ranked_candidates = ballot.ranked_candidates
+            if self._withdrawn_candidates:
+                ranked_candidates = [
+                    candidate
+                    for candidate in ranked_candidates
+                    if candidate not in self._withdrawn_candidates
+                ]
+
+            # If one vote per voter -> Voters vote goes to the first candidate on the ranked list
+            # If more than one vote per voter -> Voters votes goes to the x first candidates on the ranked list
+            candidates_that_should_be_voted_on = ranked_candidates[
+                0:number_of_votes_pr_voter
+            ]
+
+            number_of_blank_votes = number_of_votes_pr_voter - len(
+                ranked_candidates
+            )
+            if number_of_blank_votes > 0:
+                if self._pick_random_if_blank:
+                    candidates_that_should_be_voted_on = list(
+                        candidates_that_should_be_voted_on
+                    )
+                    for _ in range(number_of_blank_votes):
+                        new_candidate_choice = random.choice(candidates)
+                        candidates_that_should_be_voted_on.append(new_candidate_choice)
+                else:
+                    self._exhausted_ballots.append(ballot)
+                    self._number_of_blank_votes += number_of_blank_votes
+                    if audit_log is not None:
+                        for _ in range(number_of_blank_votes):
+                            audit_ballot_indexes.append(ballot_index)
+                            audit_to_indexes.append(NO_CANDIDATE)
+
+            for candidate in candidates_that_should_be_voted_on:
+                candidate_vc = self._candidate_vote_counts[candidate]
+                candidate_vc.number_of_votes += 1
+                candidate_vc.votes.append(ballot)
+                if audit_log is not None:
+                    candidate_vc.ballot_indexes.append(ballot_index)
+                    audit_ballot_indexes.append(ballot_index)
+                    audit_to_indexes.append(self._candidate_indexes[candidate])
+
+        if audit_log is not None:
+            audit_log.write_transfers(
+                self._round_number, NO_CANDIDATE, 1.0, audit_ballot_indexes, audit_to_indexes
+            )
+
     def _get_ballot_candidate_nr_x_in_race_or_none(
         self, ballot: Ballot, x: int
     ) -> Candidate:
         ranked_candidates_in_race = [
             candidate
             for candidate in ballot.ranked_candidates
-            if self._candidate_vote_counts[candidate].is_in_race
+            if candidate not in self._withdrawn_candidates
+            and self._candidate_vote_counts[candidate].is_in_race
         ]
 
         if len(ranked_candidates_in_race) > x:
@@ -365,6 +700,23 @@ class ElectionManager:
 
         # If equal number of votes
         else:
+            if isinstance(self._compare_method_if_equal, DrawnLots):
+                lots = self._compare_method_if_equal
+                if lots.after_most_second_choice_votes:
+                    # Choose candidate with most second choices, and use the lots if that is equal
+                    if self._candidate1_has_most_second_choices(
+                        candidate1_vc, candidate2_vc, x=1
+                    ):
+                        return -1
+                    else:
+                        return 1
+
+                # Choose candidate ranked first by the lots
+                if lots.is_ranked_before(candidate1_vc.candidate, candidate2_vc.candidate):
+                    return -1
+                else:
+                    return 1
+
             if (
                 self._compare_method_if_equal
                 == CompareMethodIfEqual.MostSecondChoiceVotes
@@ -391,7 +743,7 @@ class ElectionManager:
         x: int,
     ) -> bool:
         if x >= self._number_of_candidates:
-            return random.choice([True, False])
+            return self._candidate1_wins_final_tie_break(candidate1_vc, candidate2_vc)
 
         votes_candidate1: int = 0
         votes_candidate2: int = 0
@@ -413,6 +765,16 @@ class ElectionManager:
         else:
             return votes_candidate1 > votes_candidate2
 
+    def _candidate1_wins_final_tie_break(
+        self, candidate1_vc: CandidateVoteCount, candidate2_vc: CandidateVoteCount
+    ) -> bool:
+        """Breaks ties that are equal on all choices: with the drawn lots if given, and otherwise randomly"""
+        if isinstance(self._compare_method_if_equal, DrawnLots):
+            return self._compare_method_if_equal.is_ranked_before(
+                candidate1_vc.candidate, candidate2_vc.candidate
+            )
+        return random.choice([True, False])
+
 
 class ElectionResults:
     """
@@ -421,6 +783,8 @@ class ElectionResults:
      - the ranking of candidates
      - how many votes they got
      - their election status (elected, hopeful, rejected)
+     - the votes transferred from each candidate to the others since the previous round
+       (RoundResult.transfers, a TransferMatrix, or None if no votes were transferred)
 
     ElectionResults.get_winners() makes it trivial to receive the elected candidates.
 
@@ -0,0 +1,843 @@
+"""
+Loaders that read ballots from files into EncodedBallots
+
+Parsing a large cast vote record file is often slower than counting it. The loaders therefore store
+the encoded ballots in a cache file next to the source file (in a .pyrankvote_cache folder, similar to
+how Python stores .pyc files in __pycache__). The cache file records the path, size, modification time
+and a SHA-256 hash of the source file, and is memory-mapped instead of parsing the source file again,
+as long as the source file is unchanged.
+
+> encoded_ballots = load_normalized_csv("us_vt_btv_2009_03_mayor.normalized.csv")
+> election_result = pyrankvote.instant_runoff_voting(encoded_ballots.candidates, encoded_ballots)
+
+Ballots can also be written to BLT files with write_blt(..), with each distinct ranking written once.
+
+Parquet files are read with pyarrow, which is an optional dependency (pip install pyarrow).
+"""
+
+import codecs
+import csv
+import functools
+import hashlib
+import json
+import os
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.models import Candidate, CandidateRegistry
+from pyrankvote.parallel import imap_with_shared_state
+
+
+CACHE_FOLDER_NAME = ".pyrankvote_cache"
+CACHE_FILE_EXTENSION = ".ballots"
+
+UNDERVOTE = "$UNDERVOTE"
+OVERVOTE = "$OVERVOTE"
+
+# Files smaller than this are always parsed by one process
+MIN_PART_SIZE = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 4 * 1024 * 1024
+JSON_CHUNK_SIZE = 1024 * 1024
+PARQUET_BATCH_SIZE = 1024 * 1024
+
+
+def get_file_hash(file_path: str) -> str:
+    hash_ = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+def get_cache_file_path(file_path: str, loader_name: str) -> str:
+    directory, file_name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(
+        directory, CACHE_FOLDER_NAME, "%s.%s%s" % (file_name, loader_name, CACHE_FILE_EXTENSION)
+    )
+
+
+def load_with_cache(
+    file_path: str,
+    loader_name: str,
+    parse: Callable[[str], EncodedBallots],
+    use_cache: bool = True,
+    check_hash: bool = False,
+) -> EncodedBallots:
+    """
+    Returns the encoded ballots from the cache file if the source file is unchanged, and otherwise
+    parses the source file with parse(file_path) and writes a new cache file.
+
+    The source file is considered unchanged if the path, size and modification time are the same.
+    If only the modification time has changed (or check_hash=True), the SHA-256 hash of the content is
+    compared as well, and if the content is the same, the new modification time is written to the cache
+    file. If the cache folder can not be written to, the cache is skipped.
+    """
+    if not use_cache:
+        return parse(file_path)
+
+    source_path = os.path.abspath(file_path)
+    stat = os.stat(source_path)
+    cache_file_path = get_cache_file_path(source_path, loader_name)
+    file_hash = None
+
+    try:
+        encoded_ballots = EncodedBallots.load(cache_file_path)
+    except (OSError, ValueError):
+        encoded_ballots = None
+
+    if encoded_ballots is not None:
+        source = encoded_ballots.metadata.get("source", {})
+        if source.get("path") == source_path and source.get("size") == stat.st_size:
+            if source.get("mtime_ns") == stat.st_mtime_ns and not check_hash:
+                return encoded_ballots
+
+            file_hash = get_file_hash(source_path)
+            if source.get("sha256") == file_hash:
+                if source.get("mtime_ns") != stat.st_mtime_ns:
+                    # Only the modification time has changed, so the next load can skip the hash
+                    source["mtime_ns"] = stat.st_mtime_ns
+                    _write_cache_file(encoded_ballots, cache_file_path)
+                return encoded_ballots
+
+    encoded_ballots = parse(source_path)
+    encoded_ballots.metadata["source"] = {
+        "path": source_path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_hash or get_file_hash(source_path),
+    }
+    _write_cache_file(encoded_ballots, cache_file_path)
+
+    return encoded_ballots
+
+
+def parse_normalized_csv(
+    file_path: str, jobs: Optional[int] = 1, progress: Optional[Callable[[int, int], None]] = None
+) -> EncodedBallots:
+    """
+    Parses a normalized cast vote record CSV file (as published by ranked.vote) with the columns
+    ballot_id, rank and choice, where consecutive rows with the same ballot_id make up one ballot.
+
+    Undervotes ($UNDERVOTE) and overvotes ($OVERVOTE) are skipped, and the ballot continues with the
+    next rank. If a candidate is ranked more than once, only the first ranking is used.
+
+    Large files are split in parts at ballot boundaries, and the parts are parsed by jobs worker
+    processes. progress(bytes parsed, file size) is called while the file is parsed.
+    """
+    file_size = os.path.getsize(file_path)
+    if jobs == 1 or file_size < MIN_PART_SIZE:
+        number_of_parts = 1
+    else:
+        number_of_parts = 4 * (jobs or os.cpu_count() or 1)
+    parts = _get_csv_parts(file_path, file_size, number_of_parts)
+
+    registry = CandidateRegistry()
+    ranking_counts: Dict[Tuple[int, ...], int] = {}
+    part_progress = progress if len(parts) == 1 else None
+    bytes_parsed = parts[0][0] if parts else file_size  # The header is parsed
+
+    for (start, end), (candidate_names, part_ranking_counts) in zip(
+        parts,
+        imap_with_shared_state(
+            _parse_normalized_csv_part, (file_path, part_progress), parts, jobs=jobs
+        ),
+    ):
+        candidate_ids = [registry.get_id(registry.get(name)) for name in candidate_names]
+        for part_ranking, count in part_ranking_counts.items():
+            ranking = tuple(candidate_ids[candidate_id] for candidate_id in part_ranking)
+            ranking_counts[ranking] = ranking_counts.get(ranking, 0) + count
+
+        bytes_parsed += end - start
+        if progress is not None and part_progress is None:
+            progress(bytes_parsed, file_size)
+
+    return EncodedBallots.from_ranking_counts(registry.get_candidates(), ranking_counts.items())
+
+
+def load_normalized_csv(
+    file_path: str,
+    use_cache: bool = True,
+    check_hash: bool = False,
+    jobs: Optional[int] = 1,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> EncodedBallots:
+    """Loads a normalized cast vote record CSV file (see parse_normalized_csv) with the ballot cache"""
+    return load_with_cache(
+        file_path,
+        "normalized_csv",
+        functools.partial(parse_normalized_csv, jobs=jobs, progress=progress),
+        use_cache,
+        check_hash,
+    )
+
+
+def parse_blt(file_path: str, progress: Optional[Callable[[int, int], None]] = None) -> EncodedBallots:
+    """
+    Parses a BLT file, the ballot format of OpenSTV and other STV counting programs:
+
+        4 2            <- number of candidates and number of seats
+        -2             <- withdrawn candidates (optional)
+        3 1 2 0        <- weight, the ranked candidates (numbered from 1) and 0
+        1 3 4 0
+        0              <- end of ballots
+        "Per"          <- candidate names
+        ...
+        "Title"
+
+    Candidates ranked equally (like 1=2) are skipped like overvotes, and "-" (a skipped rank) is
+    ignored. A ballot id in parentheses before the weight is ignored. The number of seats, the title
+    and the names of withdrawn candidates are stored in the metadata of the encoded ballots.
+
+    The weights are added up for every distinct ranking, so ballots are never expanded. If a weight is
+    not an integer (like 0.5), the encoded ballots are weighted (EncodedBallots.is_weighted()).
+    """
+    file_size = os.path.getsize(file_path)
+    ranking_counts: Dict[Tuple[int, ...], Union[int, float]] = {}
+
+    with open(file_path, "rb") as f:
+        lines = _iter_lines(f, progress, file_size)
+        header = _parse_blt_header(lines, file_path)
+        for ranking, weight in _iter_blt_ballots(lines, header[3]):
+            ranking_counts[ranking] = ranking_counts.get(ranking, 0) + weight
+        names = [_parse_blt_string(line) for line in lines if line.strip()]
+
+    candidates, metadata = _get_blt_candidates(names, header, file_path)
+    return EncodedBallots.from_ranking_counts(candidates, ranking_counts.items(), metadata)
+
+
+def iter_blt_rankings(file_path: str) -> Iterator[Tuple[Tuple[int, ...], Union[int, float]]]:
+    """
+    Yields (ranking, weight) for every ballot line of a BLT file (see parse_blt), with the candidates as
+    indexes. Equal rankings are not added up, so the file is read with constant memory.
+    """
+    with open(file_path, "rb") as f:
+        lines = _iter_lines(f, None, 0)
+        header = _parse_blt_header(lines, file_path)
+        for ranking, weight in _iter_blt_ballots(lines, header[3]):
+            yield ranking, weight
+
+
+def read_blt_candidates(file_path: str) -> Tuple[List[Candidate], Dict]:
+    """Returns the candidates and the metadata of a BLT file (see parse_blt), without storing the ballots"""
+    with open(file_path, "rb") as f:
+        lines = _iter_lines(f, None, 0)
+        header = _parse_blt_header(lines, file_path)
+        for _ in _iter_blt_ballots(lines, header[3]):
+            pass
+        names = [_parse_blt_string(line) for line in lines if line.strip()]
+
+    return _get_blt_candidates(names, header, file_path)
+
+
+def load_blt(
+    file_path: str,
+    use_cache: bool = True,
+    check_hash: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> EncodedBallots:
+    """Loads a BLT file (see parse_blt) with the ballot cache"""
+    return load_with_cache(
+        file_path, "blt", functools.partial(parse_blt, progress=progress), use_cache, check_hash
+    )
+
+
+def parse_nist_cvr_json(
+    file_path: str, contest: Optional[str] = None, progress: Optional[Callable[[int, int], None]] = None
+) -> EncodedBallots:
+    """
+    Parses a cast vote record report in the JSON format of NIST SP 1500-103, and returns the rankings of
+    one contest (given by its @id or Name, and only needed if the report has more than one contest).
+
+    The file is read in chunks, and one CVR is decoded at a time, so the memory use does not grow with
+    the size of the file, only with the number of distinct rankings. The ranks of a ballot are read from
+    the SelectionPositions with an indication (HasIndication is not "no") in the current snapshot of the
+    CVR. Like in parse_normalized_csv, a rank with more than one candidate (overvote) or no candidate
+    (undervote) is skipped, and the ballot continues with the next rank. If a candidate is ranked more
+    than once, only the first ranking is used.
+    """
+    file_size = os.path.getsize(file_path)
+    election: Optional[Dict] = None
+    contest_id: Optional[str] = None
+
+    # Rankings of contest selection ids for each contest (only for the selected contest once it is known)
+    selection_ids: Dict[str, int] = {}
+    contest_ranking_counts: Dict[str, Dict[Tuple[int, ...], int]] = {}
+
+    with open(file_path, "rb") as f:
+        stream = _JsonStream(f, progress, file_size)
+        stream.expect("{")
+        while stream.read_separator("}"):
+            key = stream.read_value()
+            stream.expect(":")
+
+            if key == "Election":
+                election = _get_nist_election(stream.read_value(), file_path)
+                contest_id = _get_nist_contest_id(election, contest, file_path)
+            elif key == "CVR":
+                stream.expect("[")
+                while stream.read_separator("]"):
+                    _add_nist_cvr_rankings(
+                        stream.read_value(), contest_id, selection_ids, contest_ranking_counts
+                    )
+            else:
+                stream.read_value()
+
+    if election is None:
+        raise ValueError("%s has no Election" % file_path)
+
+    # The candidates are in the order of the contest selections of the contest (write-ins without a
+    # candidate get the id of the selection as name)
+    registry = CandidateRegistry()
+    for selection_id in election["contest_selections"][contest_id]:
+        registry.get(election["selection_names"][selection_id])
+    candidate_ids = [
+        registry.get_id(registry.get(election["selection_names"].get(selection_id, selection_id)))
+        for selection_id in selection_ids
+    ]
+
+    ranking_counts: Dict[Tuple[int, ...], int] = {}
+    for selection_ranking, count in contest_ranking_counts.get(contest_id, {}).items():
+        ranking: List[int] = []
+        for selection_index in selection_ranking:
+            candidate_id = candidate_ids[selection_index]
+            if candidate_id not in ranking:
+                ranking.append(candidate_id)
+        ranking_key = tuple(ranking)
+        ranking_counts[ranking_key] = ranking_counts.get(ranking_key, 0) + count
+
+    metadata = {"contest": election["contest_names"][contest_id]}
+    return EncodedBallots.from_ranking_counts(registry.get_candidates(), ranking_counts.items(), metadata)
+
+
+def load_nist_cvr_json(
+    file_path: str,
+    contest: Optional[str] = None,
+    use_cache: bool = True,
+    check_hash: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> EncodedBallots:
+    """Loads a NIST cast vote record JSON file (see parse_nist_cvr_json) with the ballot cache"""
+    loader_name = "nist_cvr_json"
+    if contest is not None:
+        # Every contest has a cache file of its own
+        loader_name += "_" + hashlib.sha256(contest.encode("utf-8")).hexdigest()[:16]
+    return load_with_cache(
+        file_path,
+        loader_name,
+        functools.partial(parse_nist_cvr_json, contest=contest, progress=progress),
+        use_cache,
+        check_hash,
+    )
+
+
+def parse_parquet(
+    file_path: str,
+    rank_columns: Optional[List[str]] = None,
+    column_prefix: str = "rank",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> EncodedBallots:
+    """
+    Parses a Parquet file with one row per ballot and one column per rank, where the values are candidate
+    names. The rank columns are rank_columns, or else the columns that start with column_prefix (like
+    rank1, rank2 and so on, or mayor_rank1 and so on for one of several contests), in the order of the file.
+    Only the rank columns are read.
+
+    Like in parse_normalized_csv, empty ranks (null), undervotes ($UNDERVOTE) and overvotes ($OVERVOTE)
+    are skipped, and if a candidate is ranked more than once, only the first ranking is used.
+
+    The columns are read in batches of rows with pyarrow, and each batch is counted as distinct rankings
+    by pyarrow (Table.group_by), so no Python objects are created for the rows. progress(rows parsed,
+    number of rows) is called after each batch.
+    """
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("parse_parquet(..) requires pyarrow (pip install pyarrow)")
+
+    parquet_file = pyarrow.parquet.ParquetFile(file_path)
+    if rank_columns is None:
+        rank_columns = [name for name in parquet_file.schema_arrow.names if name.startswith(column_prefix)]
+    if len(rank_columns) == 0:
+        raise ValueError("%s has no rank columns" % file_path)
+
+    number_of_rows = parquet_file.metadata.num_rows
+    rows_parsed = 0
+    registry = CandidateRegistry()
+    ranking_counts: Dict[Tuple[int, ...], int] = {}
+    group_columns = ["rank_%i" % i for i in range(len(rank_columns))]
+
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=rank_columns):
+        # Candidate ids of each rank, with null for empty ranks, undervotes and overvotes
+        candidate_id_columns = []
+        for column in batch.columns:
+            if not pyarrow.types.is_dictionary(column.type):
+                column = pyarrow.compute.dictionary_encode(column)
+            candidate_ids = [
+                None
+                if name is None or name == UNDERVOTE or name == OVERVOTE
+                else registry.get_id(registry.get(name))
+                for name in column.dictionary.to_pylist()
+            ]
+            candidate_id_columns.append(
+                pyarrow.compute.take(pyarrow.array(candidate_ids, type=pyarrow.int32()), column.indices)
+            )
+
+        table = pyarrow.table(candidate_id_columns, names=group_columns)
+        grouped = table.group_by(group_columns).aggregate(
+            [(group_columns[0], "count", pyarrow.compute.CountOptions(mode="all"))]
+        )
+        counts = grouped.column(group_columns[0] + "_count").to_pylist()
+        rank_lists = [grouped.column(name).to_pylist() for name in group_columns]
+
+        for i, count in enumerate(counts):
+            ranking: List[int] = []
+            for rank_list in rank_lists:
+                candidate_id = rank_list[i]
+                if candidate_id is not None and candidate_id not in ranking:
+                    ranking.append(candidate_id)
+            ranking_key = tuple(ranking)
+            ranking_counts[ranking_key] = ranking_counts.get(ranking_key, 0) + count
+
+        rows_parsed += batch.num_rows
+        if progress is not None:
+            progress(rows_parsed, number_of_rows)
+
+    return EncodedBallots.from_ranking_counts(registry.get_candidates(), ranking_counts.items())
+
+
+def load_parquet(
+    file_path: str,
+    rank_columns: Optional[List[str]] = None,
+    column_prefix: str = "rank",
+    use_cache: bool = True,
+    check_hash: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> EncodedBallots:
+    """Loads a Parquet file (see parse_parquet) with the ballot cache"""
+    # Every selection of columns has a cache file of its own
+    columns_key = json.dumps([rank_columns, column_prefix]).encode("utf-8")
+    loader_name = "parquet_" + hashlib.sha256(columns_key).hexdigest()[:16]
+    return load_with_cache(
+        file_path,
+        loader_name,
+        functools.partial(
+            parse_parquet, rank_columns=rank_columns, column_prefix=column_prefix, progress=progress
+        ),
+        use_cache,
+        check_hash,
+    )
+
+
+def write_blt(
+    file_path: str,
+    candidates: List[Candidate],
+    ballots,
+    number_of_seats: int = 1,
+    title: str = "",
+    withdrawn_candidates: Iterable[Candidate] = (),
+):
+    """
+    Writes the ballots to a BLT file (see parse_blt), where ballots is a list of ballots, EncodedBallots,
+    a BallotTrie or a BallotProfile. Identical rankings are written once, with the number of ballots (or the
+    sum of the weights) as the weight.
+    """
+    candidate_numbers = {candidate: number for number, candidate in enumerate(candidates, start=1)}
+
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("%i %i\n" % (len(candidates), number_of_seats))
+        withdrawn_numbers = [candidate_numbers[candidate] for candidate in withdrawn_candidates]
+        if withdrawn_numbers:
+            f.write(" ".join("-%i" % number for number in withdrawn_numbers) + "\n")
+
+        for ranking, weight in _get_numbered_ranking_weights(candidate_numbers, ballots).items():
+            f.write("%s %s0\n" % (_format_blt_weight(weight), "".join("%i " % number for number in ranking)))
+        f.write("0\n")
+
+        for candidate in candidates:
+            f.write('"%s"\n' % candidate.name)
+        f.write('"%s"\n' % title)
+
+
+# INTERNAL FUNCTIONS
+
+
+def _write_cache_file(encoded_ballots: EncodedBallots, cache_file_path: str):
+    try:
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+        temporary_path = "%s.%i.tmp" % (cache_file_path, os.getpid())
+        encoded_ballots.save(temporary_path)
+        os.replace(temporary_path, cache_file_path)
+    except OSError:
+        pass  # Like .pyc files, the cache is skipped if it can not be written
+
+
+def _iter_lines(
+    f: IO[bytes],
+    progress: Optional[Callable[[int, int], None]],
+    file_size: int,
+    end: Optional[int] = None,
+) -> Iterator[str]:
+    """Yields the decoded lines of the binary file f (until position end), and reports the progress"""
+    position = f.tell()
+    next_progress = position + PROGRESS_INTERVAL
+    for line in f:
+        yield line.decode("utf-8")
+
+        position += len(line)
+        if end is not None and position >= end:
+            break
+        if progress is not None and position >= next_progress:
+            progress(position, file_size)
+            next_progress = position + PROGRESS_INTERVAL
+
+    if progress is not None:
+        progress(position, file_size)
+
+
+def _get_csv_parts(file_path: str, file_size: int, number_of_parts: int) -> List[Tuple[int, int]]:
+    """Splits the file (after the header) in parts of whole ballots, and returns the (start, end) positions"""
+    with open(file_path, "rb") as f:
+        f.readline()  # Header
+        boundaries = [f.tell()]
+
+        for i in range(1, number_of_parts):
+            split_position = max(file_size * i // number_of_parts, boundaries[-1])
+            f.seek(split_position - 1)
+            f.readline()
+
+            # Move on to the first row of the next ballot
+            line = f.readline()
+            ballot_id = _get_csv_ballot_id(line)
+            while line:
+                position = f.tell()
+                line = f.readline()
+                if not line or _get_csv_ballot_id(line) != ballot_id:
+                    if position > boundaries[-1]:
+                        boundaries.append(position)
+                    break
+
+    if boundaries[-1] < file_size:
+        boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _get_csv_ballot_id(line: bytes) -> str:
+    return next(csv.reader([line.decode("utf-8")]), [""])[0]
+
+
+def _parse_normalized_csv_part(parse_state, part: Tuple[int, int]):
+    """Returns (candidate names, ranking counts) for the ballots between the start and end positions"""
+    file_path, progress = parse_state
+    start, end = part
+
+    candidate_ids: Dict[str, int] = {}
+    ranking_counts: Dict[Tuple[int, ...], int] = {}
+
+    def add_ballot(ranking: List[int]):
+        ranking = tuple(ranking)
+        ranking_counts[ranking] = ranking_counts.get(ranking, 0) + 1
+
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        reader = csv.reader(_iter_lines(f, progress, end, end=end))
+
+        last_ballot_id: Optional[str] = None
+        ranking: List[int] = []
+        for ballot_id, _, candidate_name in reader:
+            if ballot_id != last_ballot_id:
+                if last_ballot_id is not None:
+                    add_ballot(ranking)
+                ranking = []
+                last_ballot_id = ballot_id
+
+            if candidate_name == UNDERVOTE or candidate_name == OVERVOTE:
+                continue
+
+            candidate_id = candidate_ids.get(candidate_name)
+            if candidate_id is None:
+                candidate_id = candidate_ids[candidate_name] = len(candidate_ids)
+            if candidate_id not in ranking:
+                ranking.append(candidate_id)
+
+        if last_ballot_id is not None:
+            add_ballot(ranking)
+
+    return list(candidate_ids), ranking_counts
+
+
+def _get_blt_tokens(lines: Iterator[str]) -> Optional[List[str]]:
+    """Returns the tokens of the next line (without comments), or None at the end of the file"""
+    line = next(lines, None)
+    if line is None:
+        return None
+    return line.split("#", 1)[0].split()
+
+
+def _parse_blt_header(lines: Iterator[str], file_path: str) -> Tuple[int, int, List[int], Optional[List[str]]]:
+    """Returns (number of candidates, number of seats, withdrawn candidate ids, tokens of the first ballot line)"""
+    tokens = _get_blt_tokens(lines)
+    while tokens is not None and len(tokens) == 0:
+        tokens = _get_blt_tokens(lines)
+    if tokens is None or len(tokens) < 2:
+        raise ValueError("%s is not a BLT file" % file_path)
+    number_of_candidates, number_of_seats = int(tokens[0]), int(tokens[1])
+
+    withdrawn_candidate_ids: List[int] = []
+    tokens = _get_blt_tokens(lines)
+    if tokens and tokens[0].startswith("-"):
+        withdrawn_candidate_ids = [-int(token) - 1 for token in tokens]
+        tokens = _get_blt_tokens(lines)
+
+    return number_of_candidates, number_of_seats, withdrawn_candidate_ids, tokens
+
+
+def _iter_blt_ballots(
+    lines: Iterator[str], tokens: Optional[List[str]]
+) -> Iterator[Tuple[Tuple[int, ...], Union[int, float]]]:
+    """Yields (ranking, weight) of the ballot lines, starting with the tokens of the first ballot line"""
+    while tokens is not None and tokens != ["0"]:
+        if len(tokens) > 0:
+            if tokens[0].startswith("("):
+                tokens = tokens[1:]
+            ranking: List[int] = []
+            for token in tokens[1:]:
+                if token == "0":
+                    break
+                if token == "-" or "=" in token:
+                    continue
+                candidate_id = int(token) - 1
+                if candidate_id not in ranking:
+                    ranking.append(candidate_id)
+            yield tuple(ranking), _parse_blt_weight(tokens[0])
+        tokens = _get_blt_tokens(lines)
+
+
+def _get_blt_candidates(
+    names: List[str], header: Tuple[int, int, List[int], Optional[List[str]]], file_path: str
+) -> Tuple[List[Candidate], Dict]:
+    """Returns the candidates and the metadata from the names at the end of a BLT file"""
+    number_of_candidates, number_of_seats, withdrawn_candidate_ids, _ = header
+    if len(names) < number_of_candidates:
+        raise ValueError("%s does not have names for all candidates" % file_path)
+
+    registry = CandidateRegistry()
+    candidates = [registry.get(name) for name in names[:number_of_candidates]]
+    metadata = {
+        "number_of_seats": number_of_seats,
+        "title": names[number_of_candidates] if len(names) > number_of_candidates else "",
+        "withdrawn_candidates": [
+            candidates[candidate_id].name for candidate_id in withdrawn_candidate_ids
+        ],
+    }
+    return candidates, metadata
+
+
+def _parse_blt_string(line: str) -> str:
+    line = line.strip()
+    if len(line) >= 2 and line[0] == line[-1] == '"':
+        return line[1:-1]
+    return line
+
+
+def _parse_blt_weight(token: str) -> Union[int, float]:
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _format_blt_weight(weight: Union[int, float]) -> str:
+    if float(weight).is_integer():
+        return "%i" % weight
+    return repr(float(weight))
+
+
+def _get_numbered_ranking_weights(
+    candidate_numbers: Dict[Candidate, int], ballots
+) -> Dict[Tuple[int, ...], Union[int, float]]:
+    """Returns the weight of every distinct ranking, with candidates as their numbers in the BLT file"""
+    if isinstance(ballots, BallotProfile):
+        ballots = ballots.get_encoded_ballots()
+
+    if isinstance(ballots, (EncodedBallots, BallotTrie)):
+        numbers = [candidate_numbers[candidate] for candidate in ballots.candidates]
+        ranking_weights = (
+            (tuple(numbers[index] for index in ranking), count) for ranking, count in ballots.iter_rankings()
+        )
+    else:
+        ranking_weights = (
+            (tuple(candidate_numbers[candidate] for candidate in ballot.ranked_candidates), 1)
+            for ballot in ballots
+        )
+
+    weights: Dict[Tuple[int, ...], Union[int, float]] = {}
+    for ranking, weight in ranking_weights:
+        weights[ranking] = weights.get(ranking, 0) + weight
+    return weights
+
+
+class _JsonStream:
+    """
+    Reads JSON values one at a time from a binary file, with json.JSONDecoder.raw_decode(..) on a buffer
+    that is refilled from the file. Only the values that are read are kept in memory.
+    """
+
+    def __init__(self, f: IO[bytes], progress: Optional[Callable[[int, int], None]], file_size: int):
+        self._f = f
+        self._progress = progress
+        self._file_size = file_size
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+        self._buffer = ""
+        self._position = 0
+        self._bytes_read = 0
+        self._next_progress = PROGRESS_INTERVAL
+        self._is_at_end = False
+
+    def expect(self, character: str):
+        if self._peek() != character:
+            raise ValueError("Expected %r at byte %i of the JSON file" % (character, self._bytes_read))
+        self._position += 1
+
+    def read_separator(self, end_character: str) -> bool:
+        """Skips a comma between values. Returns False (after skipping end_character) after the last value."""
+        character = self._peek()
+        if character == end_character:
+            self._position += 1
+            return False
+        if character == ",":
+            self._position += 1
+        return True
+
+    def read_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                value, end = None, None
+
+            # A number at the end of the buffer may continue in the next chunk
+            if end is not None and (end < len(self._buffer) or self._is_at_end):
+                self._position = end
+                return value
+            if self._is_at_end:
+                raise ValueError("Invalid JSON at byte %i of the JSON file" % self._bytes_read)
+            self._read_chunk(max(JSON_CHUNK_SIZE, len(self._buffer) - self._position))
+
+    def _peek(self) -> str:
+        """Returns the next character that is not whitespace (or "" at the end of the file)"""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in " \t\r\n":
+                self._position += 1
+            if self._position < len(self._buffer) or self._is_at_end:
+                return self._buffer[self._position : self._position + 1]
+            self._read_chunk(JSON_CHUNK_SIZE)
+
+    def _read_chunk(self, size: int):
+        data = self._f.read(size)
+        self._is_at_end = len(data) == 0
+        self._bytes_read += len(data)
+        self._buffer = self._buffer[self._position :] + self._text_decoder.decode(data, final=self._is_at_end)
+        self._position = 0
+
+        if self._progress is not None and (self._bytes_read >= self._next_progress or self._is_at_end):
+            self._progress(self._bytes_read, self._file_size)
+            self._next_progress = self._bytes_read + PROGRESS_INTERVAL
+
+
+def _get_nist_election(election_value, file_path: str) -> Dict:
+    """Returns the names of the contests, their contest selections and the candidate names of the selections"""
+    elections = election_value if isinstance(election_value, list) else [election_value]
+    if len(elections) == 0:
+        raise ValueError("%s has no Election" % file_path)
+
+    contest_names: Dict[str, str] = {}
+    contest_selections: Dict[str, List[str]] = {}
+    selection_names: Dict[str, str] = {}
+    for election in elections:
+        candidate_names = {
+            candidate["@id"]: candidate.get("Name", candidate["@id"])
+            for candidate in election.get("Candidate", [])
+        }
+        for contest in election.get("Contest", []):
+            contest_names[contest["@id"]] = contest.get("Name", contest["@id"])
+            contest_selections[contest["@id"]] = []
+            for selection in contest.get("ContestSelection", []):
+                contest_selections[contest["@id"]].append(selection["@id"])
+                candidate_ids = selection.get("CandidateIds") or [selection.get("CandidateId")]
+                selection_names[selection["@id"]] = candidate_names.get(candidate_ids[0], selection["@id"])
+
+    return {
+        "contest_names": contest_names,
+        "contest_selections": contest_selections,
+        "selection_names": selection_names,
+    }
+
+
+def _get_nist_contest_id(election: Dict, contest: Optional[str], file_path: str) -> str:
+    contest_names = election["contest_names"]
+    if contest is None:
+        if len(contest_names) != 1:
+            raise ValueError(
+                "%s has %i contests, select one of them: %s"
+                % (file_path, len(contest_names), ", ".join(sorted(contest_names)))
+            )
+        return next(iter(contest_names))
+
+    for contest_id, contest_name in contest_names.items():
+        if contest in (contest_id, contest_name):
+            return contest_id
+    raise ValueError("%s has no contest %s" % (file_path, contest))
+
+
+def _add_nist_cvr_rankings(
+    cvr: Dict,
+    contest_id: Optional[str],
+    selection_ids: Dict[str, int],
+    contest_ranking_counts: Dict[str, Dict[Tuple[int, ...], int]],
+):
+    """
+    Adds the rankings of the CVR to contest_ranking_counts, with selections numbered in selection_ids. If
+    the contest is not known yet (the Election comes after the CVRs), the rankings of all contests are added.
+    """
+    snapshots = cvr.get("CVRSnapshot", [])
+    current_snapshots = [
+        snapshot for snapshot in snapshots if snapshot.get("@id") == cvr.get("CurrentSnapshotId")
+    ]
+    for snapshot in current_snapshots or snapshots[:1]:
+        for cvr_contest in snapshot.get("CVRContest", []):
+            cvr_contest_id = cvr_contest.get("ContestId")
+            if contest_id is not None and cvr_contest_id != contest_id:
+                continue
+
+            rank_selections: Dict[int, List[str]] = {}
+            for cvr_selection in cvr_contest.get("CVRContestSelection", []):
+                selection_id = cvr_selection.get("ContestSelectionId")
+                for position in cvr_selection.get("SelectionPosition", []):
+                    if position.get("HasIndication", "yes") == "no":
+                        continue
+                    rank = position.get("Rank", cvr_selection.get("Rank"))
+                    if rank is not None and selection_id is not None:
+                        rank_selections.setdefault(rank, []).append(selection_id)
+
+            # Overvotes (more than one selection with the same rank) and undervotes (ranks without a
+            # selection) are skipped
+            ranking = []
+            for rank in sorted(rank_selections):
+                if len(set(rank_selections[rank])) == 1:
+                    selection_id = rank_selections[rank][0]
+                    selection_index = selection_ids.get(selection_id)
+                    if selection_index is None:
+                        selection_index = selection_ids[selection_id] = len(selection_ids)
+                    if selection_index not in ranking:
+                        ranking.append(selection_index)
+
+            ranking_counts = contest_ranking_counts.setdefault(cvr_contest_id, {})
+            ranking_key = tuple(ranking)
+            ranking_counts[ranking_key] = ranking_counts.get(ranking_key, 0) + 1
@@ -0,0 +1,374 @@
+"""
+Margin of victory for instant runoff voting
+
+The margin of victory is the smallest number of ballots that must be changed to change the winner of an
+instant runoff vote. Auditors use it to decide how many ballots to check.
+
+An instant runoff count is decided by the order the candidates are eliminated in, and the winner is the
+candidate that is left. The margin is therefore found by searching the elimination orders that end with
+another winner, the same way as in Blom, Stuckey and Teague, "Efficient computation of exact IRV margins"
+(2016). The orders are built backwards from the winner, so the set of candidates that are left in a round
+is known for every round that is added to the order:
+
+ - Lower bounds: if the candidate eliminated in a round has d more votes than another candidate in the
+   round, every changed ballot can at most take one vote from the eliminated candidate and give one vote to
+   one of the others. The number of changed ballots needed for the round is a lower bound for every order
+   that contains the round, so orders that can't do better than the best manipulation found are pruned.
+ - Upper bounds: for complete orders, ballots are changed round by round until the order is followed, and
+   the changed ballots are counted with instant_runoff_voting to check that the winner is changed.
+
+The search stops when the lower and upper bounds meet, or when the time budget is used. The orders that end
+with each of the other candidates are searched by separate worker processes.
+
+> margin = get_margin_of_victory(candidates, ballots, time_budget=10, jobs=4)
+> margin.lower_bound, margin.upper_bound
+"""
+
+import heapq
+import math
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.models import Candidate
+from pyrankvote.parallel import map_with_shared_state
+from pyrankvote.single_seat_ranking_methods import instant_runoff_voting
+
+
+class BallotChange(NamedTuple):
+    """number_of_ballots ballots with from_candidate as first choice are changed to only rank to_candidate"""
+
+    from_candidate: Candidate
+    to_candidate: Candidate
+    number_of_ballots: int
+
+
+class MarginOfVictory(NamedTuple):
+    """
+    The margin of victory is between lower_bound and upper_bound (inclusive). changes is a set of ballot
+    changes with upper_bound changed ballots that changes the winner.
+    """
+
+    winner: Candidate
+    lower_bound: int
+    upper_bound: int
+    changes: List[BallotChange]
+
+    def is_exact(self) -> bool:
+        return self.lower_bound == self.upper_bound
+
+
+def get_margin_of_victory(
+    candidates: List[Candidate],
+    ballots,
+    time_budget: Optional[float] = None,
+    jobs: Optional[int] = 1,
+) -> MarginOfVictory:
+    """
+    Returns bounds for the margin of victory of the instant runoff vote. Ballots can be a list of ballots,
+    EncodedBallots or a BallotTrie.
+
+    The search for the exact margin takes exponential time in the worst case. If time_budget (in seconds)
+    is given, the search is stopped after time_budget seconds, and the bounds found so far are returned.
+    """
+    if len(candidates) < 2:
+        raise ValueError("The margin of victory requires at least two candidates")
+
+    margin_search = _MarginSearch(candidates, ballots)
+    winner = margin_search.winner
+    upper_bound, changes = margin_search.get_round_upper_bound()
+
+    deadline = time.time() + time_budget if time_budget is not None else None
+    other_candidates = [label for label in range(len(candidates)) if label != winner]
+    search_results = map_with_shared_state(
+        _search_orders_with_winner,
+        (margin_search, upper_bound, deadline),
+        other_candidates,
+        jobs=jobs,
+    )
+
+    lower_bound = upper_bound
+    for search_lower_bound, search_upper_bound, search_changes in search_results:
+        lower_bound = min(lower_bound, search_lower_bound)
+        if search_upper_bound < upper_bound:
+            upper_bound, changes = search_upper_bound, search_changes
+
+    return MarginOfVictory(
+        candidates[winner],
+        lower_bound,
+        upper_bound,
+        [
+            BallotChange(candidates[from_label], candidates[to_label], number_of_ballots)
+            for from_label, to_label, number_of_ballots in changes
+        ],
+    )
+
+
+def _get_minimum_changes(deficits: Sequence[float]) -> int:
+    """
+    Returns the smallest k where k changed ballots can make every deficit zero or less, when each ballot
+    can lower every deficit by one, and one of the deficits by one more.
+    """
+    def is_enough(k: int) -> bool:
+        return sum(max(0.0, deficit - k) for deficit in deficits) <= k
+
+    low, high = 0, int(math.ceil(max([0.0] + list(deficits))))
+    while low < high:
+        middle = (low + high) // 2
+        if is_enough(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class _MarginSearch:
+    """
+    The distinct rankings of the election (with candidates as indexes in candidates, called labels),
+    and the searches for the margin of victory.
+    """
+
+    def __init__(self, candidates: List[Candidate], ballots):
+        self.candidates: List[Candidate] = list(candidates)
+        if isinstance(ballots, BallotProfile):
+            ballots = ballots.get_encoded_ballots()
+        elif not isinstance(ballots, (BallotTrie, EncodedBallots)):
+            ballots = EncodedBallots.from_ballots(candidates, ballots)
+
+        # Candidates that are not in candidates are left out of the rankings (they are withdrawn)
+        labels = {candidate: label for label, candidate in enumerate(self.candidates)}
+        source_labels = [labels.get(candidate) for candidate in ballots.candidates]
+        ranking_counts: Dict[Tuple[int, ...], float] = {}
+        for source_ranking, count in ballots.iter_rankings():
+            ranking = tuple(
+                source_labels[label] for label in source_ranking if source_labels[label] is not None
+            )
+            ranking_counts[ranking] = ranking_counts.get(ranking, 0) + count
+
+        # Every candidate also gets a ranking with only the candidate, used for changed ballots
+        for label in range(len(self.candidates)):
+            ranking_counts.setdefault((label,), 0)
+
+        self.rankings: List[Tuple[int, ...]] = list(ranking_counts)
+        self.weights: List[float] = list(ranking_counts.values())
+        self.single_rankings: List[int] = [
+            self.rankings.index((label,)) for label in range(len(self.candidates))
+        ]
+
+        self.trie = BallotTrie(self.candidates)
+        self.ranking_nodes: List[int] = [
+            self.trie.add_ranking(ranking, weight)
+            for ranking, weight in zip(self.rankings, self.weights)
+        ]
+
+        winners = self.count(self.weights)
+        self.winner: int = winners[0]
+        self.elimination_order: List[int] = self._get_elimination_order()
+
+        self._tallies_cache: Dict[FrozenSet[int], List[float]] = {}
+
+    def count(self, weights: List[float]) -> List[int]:
+        """Counts the rankings with the given weights, and returns the labels of the winners"""
+        trie = self.trie.copy_with_counts(self.trie.get_node_counts(self.ranking_nodes, weights))
+        election_results = instant_runoff_voting(self.candidates, trie)
+        return [self.candidates.index(candidate) for candidate in election_results.get_winners()]
+
+    def get_tallies(self, labels: FrozenSet[int], weights: Optional[List[float]] = None) -> List[float]:
+        """Returns the votes of each candidate when only the candidates in labels are left"""
+        if weights is None and labels in self._tallies_cache:
+            return self._tallies_cache[labels]
+
+        tallies = [0.0] * len(self.candidates)
+        for ranking, weight in zip(self.rankings, weights or self.weights):
+            for label in ranking:
+                if label in labels:
+                    tallies[label] += weight
+                    break
+
+        if weights is None:
+            self._tallies_cache[labels] = tallies
+        return tallies
+
+    def get_round_lower_bound(self, labels: FrozenSet[int], eliminated: int) -> int:
+        """Returns the minimum number of changed ballots so eliminated has the fewest votes of labels"""
+        tallies = self.get_tallies(labels)
+        deficits = [tallies[eliminated] - tallies[label] for label in labels if label != eliminated]
+        return _get_minimum_changes(deficits)
+
+    def get_round_upper_bound(self) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """
+        Cheap upper bound from the rounds of the count: in every round, the winner's first choice ballots are
+        changed to the candidate with fewest votes, until the winner has fewest votes.
+        """
+        upper_bound = int(math.ceil(sum(self.weights)))
+        best_changes: List[Tuple[int, int, int]] = []
+
+        for i in range(len(self.elimination_order) - 1):
+            labels = frozenset(self.elimination_order[i:])
+            tallies = self.get_tallies(labels)
+            others = sorted((tallies[label], label) for label in labels if label != self.winner)
+            lowest_votes, lowest = others[0]
+            deficits = [tallies[self.winner] - lowest_votes + 1] + [
+                tallies[self.winner] - votes + 1 for votes, _ in others[1:]
+            ]
+            # Changed ballots only go to the lowest candidate, so the other deficits must be removed directly
+            number_of_changes = max(
+                _get_minimum_changes(deficits[:1]), int(math.ceil(max(deficits[1:] + [0])))
+            )
+            if number_of_changes >= upper_bound:
+                continue
+
+            changes = [(self.winner, lowest, number_of_changes)]
+            weights = self.apply_changes(changes)
+            if weights is not None and self.count(weights) != [self.winner]:
+                upper_bound, best_changes = number_of_changes, changes
+
+        return upper_bound, best_changes
+
+    def apply_changes(self, changes: List[Tuple[int, int, int]]) -> Optional[List[float]]:
+        """
+        Returns the weights of the rankings after the changes, or None if there are not enough ballots.
+        Ballots that rank few candidates are changed first, since they affect fewer later rounds.
+        """
+        weights = list(self.weights)
+        for from_label, to_label, number_of_ballots in changes:
+            weights = self._change_ballots(weights, from_label, to_label, number_of_ballots)
+            if weights is None:
+                return None
+        return weights
+
+    def construct_changes(
+        self, order: Sequence[int], upper_bound: int
+    ) -> Optional[Tuple[int, List[Tuple[int, int, int]]]]:
+        """
+        Changes ballots round by round until the candidates are eliminated in order, and returns the
+        number of changed ballots and the changes, or None if the changes do not change the winner.
+        """
+        weights = list(self.weights)
+        final_candidate = order[-1]
+        number_of_changed_ballots = 0
+        changes: List[Tuple[int, int, int]] = []
+
+        for i in range(len(order) - 1):
+            labels = frozenset(order[i:])
+            eliminated = order[i]
+            tallies = self.get_tallies(labels, weights)
+            others = [label for label in labels if label != eliminated]
+            deficits = [tallies[eliminated] - tallies[label] + 1 for label in others]
+
+            number_of_changes = _get_minimum_changes(deficits)
+            if number_of_changes == 0:
+                continue
+            number_of_changed_ballots += number_of_changes
+            if number_of_changed_ballots >= upper_bound:
+                return None
+
+            round_changes = []
+            rest = number_of_changes
+            for label, deficit in zip(others, deficits):
+                number_of_ballots = int(math.ceil(max(0.0, deficit - number_of_changes)))
+                if number_of_ballots > 0:
+                    round_changes.append((eliminated, label, number_of_ballots))
+                    rest -= number_of_ballots
+            if rest > 0:
+                round_changes.append((eliminated, final_candidate, rest))
+
+            for from_label, to_label, number_of_ballots in round_changes:
+                weights = self._change_ballots(weights, from_label, to_label, number_of_ballots)
+                if weights is None:
+                    return None
+            changes.extend(round_changes)
+
+        if self.count(weights) == [self.winner]:
+            return None
+        return number_of_changed_ballots, changes
+
+    def search_orders_with_winner(
+        self, final_candidate: int, upper_bound: int, deadline: Optional[float]
+    ) -> Tuple[int, int, List[Tuple[int, int, int]]]:
+        """
+        Searches the elimination orders that end with final_candidate, and returns (lower bound,
+        upper bound, changes) for the number of changed ballots that makes final_candidate win.
+        Only upper bounds lower than the given upper_bound are searched for.
+        """
+        number_of_candidates = len(self.candidates)
+        best_changes: List[Tuple[int, int, int]] = []
+        unresolved_lower_bound = upper_bound
+
+        # Orders are built backwards from the final candidate. Deeper orders are tried first when
+        # the lower bounds are equal, so complete orders (and upper bounds) are found early.
+        queue = [(0, -1, (final_candidate,))]
+        while queue:
+            lower_bound, _, order = queue[0]
+            if lower_bound >= upper_bound:
+                break
+            if deadline is not None and time.time() > deadline:
+                break
+            heapq.heappop(queue)
+
+            if len(order) == number_of_candidates:
+                result = self.construct_changes(order, upper_bound)
+                if result is not None:
+                    number_of_changed_ballots, changes = result
+                    upper_bound, best_changes = number_of_changed_ballots, changes
+                if result is None or result[0] > lower_bound:
+                    unresolved_lower_bound = min(unresolved_lower_bound, lower_bound)
+                continue
+
+            for label in range(number_of_candidates):
+                if label in order:
+                    continue
+                new_order = (label,) + order
+                new_lower_bound = max(
+                    lower_bound, self.get_round_lower_bound(frozenset(new_order), label)
+                )
+                if new_lower_bound < upper_bound:
+                    heapq.heappush(queue, (new_lower_bound, -len(new_order), new_order))
+
+        lower_bound = min(unresolved_lower_bound, upper_bound)
+        if queue:
+            lower_bound = min(lower_bound, queue[0][0])
+        return lower_bound, upper_bound, best_changes
+
+    # INTERNAL METHODS
+
+    def _get_elimination_order(self) -> List[int]:
+        """Returns the labels in the order they are eliminated in the count, ending with the winner"""
+        election_results = instant_runoff_voting(self.candidates, self.trie)
+        final_results = election_results.rounds[-1].candidate_results
+        order = [self.candidates.index(candidate) for candidate, _, _ in final_results[::-1]]
+        order.remove(self.winner)
+        return order + [self.winner]
+
+    def _change_ballots(
+        self, weights: List[float], from_label: int, to_label: int, number_of_ballots: int
+    ) -> Optional[List[float]]:
+        weights = list(weights)
+        ranking_indexes = sorted(
+            (
+                i
+                for i, ranking in enumerate(self.rankings)
+                if len(ranking) > 0 and ranking[0] == from_label and weights[i] > 0
+            ),
+            key=lambda i: len(self.rankings[i]),
+        )
+
+        rest = number_of_ballots
+        for i in ranking_indexes:
+            number_of_changed_ballots = min(weights[i], rest)
+            weights[i] -= number_of_changed_ballots
+            rest -= number_of_changed_ballots
+            if rest <= 0:
+                break
+
+        if rest > 0:
+            return None
+        weights[self.single_rankings[to_label]] += number_of_ballots
+        return weights
+
+
+def _search_orders_with_winner(search_state, final_candidate: int):
+    margin_search, upper_bound, deadline = search_state
+    return margin_search.search_orders_with_winner(final_candidate, upper_bound, deadline)
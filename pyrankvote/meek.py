@@ -0,0 +1,164 @@
+"""
+Meek single transferable vote
+
+In Meek's method every elected candidate has a keep factor: the share of the value of each ballot that
+reaches the candidate that the candidate keeps. The rest of the value goes on to the next candidate on the
+ballot, also when that candidate is already elected. Hopeful candidates keep everything (keep factor 1),
+and excluded candidates nothing (keep factor 0). The keep factors of the elected candidates are recalculated
+until every elected candidate has the quota, so a count needs many iterations per round.
+
+MeekCount counts the ballots as a BallotTrie: ballots that share a ranking prefix get the same value at every
+candidate on the prefix, so each iteration only visits the distinct prefixes, not the ballots. The trie is
+flattened into arrays once, and each iteration only descends below a node while some value passes it, so
+prefixes below hopeful candidates are never visited.
+
+> meek_count = MeekCount(candidates, trie, number_of_seats=3)
+> votes, exhausted_votes, quota, number_of_iterations = meek_count.iterate()
+"""
+
+import array
+from typing import Dict, List, Optional, Tuple
+
+from pyrankvote.ballot_trie import ROOT_NODE, BallotTrie
+from pyrankvote.models import Candidate
+
+
+DEFAULT_TOLERANCE = 1e-6
+DEFAULT_MAX_ITERATIONS = 1000
+
+
+class MeekCount:
+    """
+    Keep factors of the candidates in a Meek count of the ballots in trie, with votes distributed to the
+    candidates in candidates. Candidates in the trie that are not in candidates are withdrawn (they keep
+    nothing).
+
+    iterate() recalculates the keep factors of the elected candidates until the votes of every elected
+    candidate are within tolerance * quota of the quota, or for at most max_iterations iterations. The keep
+    factors are kept between calls, so each round starts from the keep factors of the previous round.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        trie: BallotTrie,
+        number_of_seats: int,
+        tolerance: float = DEFAULT_TOLERANCE,
+        max_iterations: int = DEFAULT_MAX_ITERATIONS,
+    ):
+        if tolerance <= 0.0:
+            raise ValueError("The tolerance must be positive")
+        if max_iterations < 1:
+            raise ValueError("Max iterations must be at least 1")
+
+        self.candidates: List[Candidate] = trie.candidates
+        self.number_of_seats = number_of_seats
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+        included = set(candidates)
+        self.keep_factors = array.array(
+            "d", [1.0 if candidate in included else 0.0 for candidate in self.candidates]
+        )
+        self.elected_labels: List[int] = []
+        self._number_of_ballots = trie.get_number_of_ballots()
+        self._flatten(trie)
+
+    def __repr__(self) -> str:
+        return "<MeekCount(%i candidates, %i elected)>" % (
+            len(self.candidates),
+            len(self.elected_labels),
+        )
+
+    def elect(self, label: int):
+        """Elects the candidate with the label. Its keep factor is lowered by the next iteration."""
+        self.elected_labels.append(label)
+
+    def exclude(self, label: int):
+        """Excludes the candidate with the label: the value of its ballots goes on to the next candidates"""
+        self.keep_factors[label] = 0.0
+
+    def reset_keep_factors(self):
+        """Sets the keep factors of the elected candidates back to 1 (a cold start of the next round)"""
+        for label in self.elected_labels:
+            self.keep_factors[label] = 1.0
+
+    def get_keep_factors(self) -> Dict[Candidate, float]:
+        return dict(zip(self.candidates, self.keep_factors))
+
+    def iterate(self, hopeful_labels: Optional[List[int]] = None) -> Tuple[List[float], float, float, int]:
+        """
+        Recalculates the keep factors until they converge. Stops early if one of hopeful_labels reaches the
+        quota, since that candidate is elected anyway.
+
+        Returns (votes of each label, exhausted votes, quota, number of iterations), with the votes and quota
+        of the last distribution of the votes.
+        """
+        hopeful_labels = hopeful_labels or []
+        keep_factors = self.keep_factors
+
+        iteration = 0
+        while True:
+            iteration += 1
+            votes, exhausted_votes = self.distribute_votes()
+            quota = (self._number_of_ballots - exhausted_votes) / float(self.number_of_seats + 1)
+            if quota <= 0.0:
+                return votes, exhausted_votes, quota, iteration
+
+            max_difference = self.tolerance * quota
+            converged = all(
+                abs(votes[label] - quota) <= max_difference for label in self.elected_labels
+            )
+            if converged or iteration >= self.max_iterations:
+                return votes, exhausted_votes, quota, iteration
+            if any(votes[label] >= quota for label in hopeful_labels):
+                return votes, exhausted_votes, quota, iteration
+
+            for label in self.elected_labels:
+                if votes[label] > 0.0:
+                    keep_factors[label] = min(1.0, keep_factors[label] * quota / votes[label])
+
+    def distribute_votes(self) -> Tuple[List[float], float]:
+        """Returns (votes of each label, exhausted votes) with the current keep factors"""
+        keep_factors = self.keep_factors
+        child_offsets, child_labels = self._child_offsets, self._child_labels
+        child_nodes, child_counts = self._child_nodes, self._child_counts
+        terminal_counts = self._terminal_counts
+
+        votes = [0.0] * len(self.candidates)
+        exhausted_votes = 0.0
+
+        # Value left on each ballot in the subtree of the node, after the candidates on the prefix
+        stack = [(ROOT_NODE, 1.0)]
+        while stack:
+            node, value = stack.pop()
+            exhausted_votes += terminal_counts[node] * value
+
+            for i in range(child_offsets[node], child_offsets[node + 1]):
+                label = child_labels[i]
+                keep_factor = keep_factors[label]
+                votes[label] += child_counts[i] * value * keep_factor
+                if keep_factor < 1.0:
+                    stack.append((child_nodes[i], value * (1.0 - keep_factor)))
+
+        return votes, exhausted_votes
+
+    # INTERNAL METHODS
+
+    def _flatten(self, trie: BallotTrie):
+        """Stores the children of every node back to back, like the rankings of EncodedBallots"""
+        self._child_offsets = array.array("q", [0])
+        self._child_labels = array.array("i")
+        self._child_nodes = array.array("q")
+        self._child_counts = array.array("d")
+        self._terminal_counts = array.array("d")
+
+        counts = trie.counts
+        for node in range(trie.get_number_of_nodes()):
+            children = trie.children[node]
+            for label, child in children.items():
+                self._child_labels.append(label)
+                self._child_nodes.append(child)
+                self._child_counts.append(counts[child])
+            self._child_offsets.append(len(self._child_labels))
+            self._terminal_counts.append(counts[node] - sum(counts[child] for child in children.values()))
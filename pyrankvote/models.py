@@ -3,7 +3,7 @@ Models that are used by multiple_seat_ranking_methods.py
 
 You can create and use your own Candidate and Ballot models as long as they implement the same properties and methods.
 """
-from typing import List
+from typing import Dict, Iterator, List
 
 
 class Candidate:
@@ -22,12 +22,89 @@ class Candidate:
         return hash(self.name)
 
     def __eq__(self, other) -> bool:
+        if self is other:
+            # Fast path for interned candidates (see CandidateRegistry)
+            return True
         if other is None:
             return False
 
         return self.name == other.name
 
 
+class CandidateRegistry:
+    """
+    An interning pool of candidates that guarantees one canonical candidate object per name.
+
+    Loaders that see the same candidate name on many ballots can use the registry instead of creating
+    new Candidate objects, so that the counting can compare candidates by identity instead of by name.
+    Every candidate gets a stable integer id (in the order they are registered), that can be used as an
+    index into lists and arrays.
+
+    > registry = CandidateRegistry()
+    > registry.get("Per") is registry.get("Per")
+    True
+    """
+
+    def __init__(self, candidates: List[Candidate] = ()):
+        self._candidates: List[Candidate] = []
+        self._ids_by_name: Dict[str, int] = {}
+
+        for candidate in candidates:
+            self.add(candidate)
+
+    def __repr__(self) -> str:
+        return "<CandidateRegistry(%i candidates)>" % len(self._candidates)
+
+    def __len__(self) -> int:
+        return len(self._candidates)
+
+    def __iter__(self) -> Iterator[Candidate]:
+        return iter(self._candidates)
+
+    def __contains__(self, candidate) -> bool:
+        return getattr(candidate, "name", None) in self._ids_by_name
+
+    def add(self, candidate: Candidate) -> Candidate:
+        """
+        Registers a candidate (or a candidate-like object) and returns the canonical object for its name.
+
+        The first object registered with a name becomes the canonical one.
+        """
+        candidate_id = self._ids_by_name.get(candidate.name)
+        if candidate_id is not None:
+            return self._candidates[candidate_id]
+
+        self._ids_by_name[candidate.name] = len(self._candidates)
+        self._candidates.append(candidate)
+        return candidate
+
+    def get(self, name: str) -> Candidate:
+        """Returns the canonical candidate with this name, and creates it if it is not registered yet"""
+        candidate_id = self._ids_by_name.get(name)
+        if candidate_id is not None:
+            return self._candidates[candidate_id]
+
+        return self.add(Candidate(name))
+
+    def get_id(self, candidate: Candidate) -> int:
+        """Returns the integer id of a registered candidate (or any equal candidate-like object)"""
+        try:
+            return self._ids_by_name[candidate.name]
+        except KeyError:
+            raise KeyError("Candidate %r is not registered" % candidate)
+
+    def get_candidate(self, candidate_id: int) -> Candidate:
+        return self._candidates[candidate_id]
+
+    def get_candidates(self) -> List[Candidate]:
+        """Returns all registered candidates sorted by id"""
+        return list(self._candidates)
+
+    def intern_ballot(self, ranked_candidates: List[Candidate]) -> List[Candidate]:
+        """Replaces every candidate in a ranked list with the canonical object"""
+        return [self.add(candidate) for candidate in ranked_candidates]
+
+
 class DuplicateCandidatesError(RuntimeError):
     pass
 
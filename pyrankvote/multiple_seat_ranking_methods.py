@@ -3,21 +3,60 @@ Multiple seat ranking methods
 
 Implemented methods:
  - Single transferable vote
+ - Meek single transferable vote
  - Preferential block voting
 """
 
-from typing import List
-from pyrankvote.helpers import CompareMethodIfEqual, ElectionManager, ElectionResults
+from typing import Callable, Iterable, List, Optional
+from pyrankvote.helpers import (
+    CandidateResult,
+    CandidateStatus,
+    CompareMethodIfEqual,
+    ElectionManager,
+    ElectionResults,
+    RoundResult,
+    SurplusTransferMethod,
+)
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.ballot_trie import BallotTrie, TrieElectionManager
+from pyrankvote.encoded_ballots import EncodedBallots, get_ballot_trie
+from pyrankvote.meek import DEFAULT_MAX_ITERATIONS, DEFAULT_TOLERANCE, MeekCount
 from pyrankvote.models import Candidate, Ballot
+from pyrankvote.sqlite_store import SQLiteBallotStore, SQLiteElectionManager
+from pyrankvote.streaming import BallotStream, StreamingElectionManager
 import math
 
 
+def _create_election_manager(
+    candidates: List[Candidate], ballots, **kwargs
+) -> ElectionManager:
+    """
+    Creates the ElectionManager that fits the ballots: a list of Ballot objects is counted ballot by
+    ballot, and a BallotTrie (or EncodedBallots) is counted with whole subtrees of ballots at a time.
+    A BallotProfile is counted on its cached trie and first votes, a SQLiteBallotStore with the vote
+    piles in the database, and a BallotStream by reading the ballots again in every round.
+    """
+    if isinstance(ballots, SQLiteBallotStore):
+        return SQLiteElectionManager(candidates, ballots, **kwargs)
+    if isinstance(ballots, BallotStream):
+        return StreamingElectionManager(candidates, ballots, **kwargs)
+    if isinstance(ballots, BallotProfile):
+        return TrieElectionManager(candidates, ballots, **kwargs)
+    if isinstance(ballots, (BallotTrie, EncodedBallots)):
+        return TrieElectionManager(candidates, get_ballot_trie(candidates, ballots), **kwargs)
+
+    return ElectionManager(candidates, ballots, **kwargs)
+
+
 def preferential_block_voting(
     candidates: List[Candidate],
     ballots: List[Ballot],
     number_of_seats: int,
     compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
     pick_random_if_blank=False,
+    audit_log=None,
+    round_callback: Optional[Callable[[RoundResult], None]] = None,
+    withdrawn_candidates: Iterable[Candidate] = (),
 ) -> ElectionResults:
     """
     Preferential block voting (PBV) is a multiple candidate election method, that elected the candidate that can
@@ -33,17 +72,31 @@ def preferential_block_voting(
     This is the prefered method in Robers rules of order. The only between difference between IRV/PBV and exhaustive ballout,
     is that in exhaustive ballout voters can adjust votes according to partial results.
 
+    Ballots can also be given as a BallotTrie or EncodedBallots, which counts ballots that share a ranking prefix together
+    and is much faster for large elections, or as a BallotProfile that is reused between counts. Ballots that do not
+    fit in memory can be counted in a SQLiteBallotStore (see sqlite_store.py), or streamed from a file in every round
+    as a BallotStream (see streaming.py).
+
+    If an AuditLog is given as audit_log, the transfers of every ballot are written to it (only supported for a list
+    of ballots).
+
+    Candidates in withdrawn_candidates are skipped on every ballot, as if the ballots were rewritten without them.
+
+    If round_callback is given, it is called with the RoundResult of each round as soon as the round is counted.
+
     For more info see Wikipedia.
     """
 
     rounding_error = 1e-6
 
-    manager = ElectionManager(
+    manager = _create_election_manager(
         candidates,
         ballots,
         number_of_votes_pr_voter=number_of_seats,
         compare_method_if_equal=compare_method_if_equal,
         pick_random_if_blank=pick_random_if_blank,
+        audit_log=audit_log,
+        withdrawn_candidates=withdrawn_candidates,
     )
     election_results = ElectionResults()
 
@@ -103,7 +156,10 @@ def preferential_block_voting(
                 manager.reject_candidate(candidate)
 
         # Register round result
-        election_results.register_round_results(manager.get_results())
+        round_result = manager.get_results()
+        election_results.register_round_results(round_result)
+        if round_callback is not None:
+            round_callback(round_result)
 
         # If all seats filled
         if manager.get_number_of_candidates_in_race() == 0:
@@ -128,6 +184,10 @@ def single_transferable_vote(
     number_of_seats: int,
     compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
     pick_random_if_blank=False,
+    audit_log=None,
+    surplus_transfer_method=SurplusTransferMethod.AllBallots,
+    round_callback: Optional[Callable[[RoundResult], None]] = None,
+    withdrawn_candidates: Iterable[Candidate] = (),
 ) -> ElectionResults:
     """
     Single transferable vote (STV) is a multiple candidate election method, that elected the candidate that can
@@ -144,17 +204,30 @@ def single_transferable_vote(
     candidate's 2nd (or 3rd, 4th etc) alternative. If no candidate get over the threshold, the candidate with fewest votes
     are removed. Votes for this candidate is then transfered to voters 2nd (or 3rd, 4th etc) alternative.
 
+    By default the excess votes are shared by all the ballots of the elected candidate. With
+    surplus_transfer_method=SurplusTransferMethod.LastParcel only the last parcel of ballots the candidate received is
+    transferred, with at most the value each ballot was received with (see SurplusTransferMethod).
+
+    If an AuditLog is given as audit_log, the transfers of every ballot are written to it (only supported for a list
+    of ballots).
+
+    Candidates in withdrawn_candidates are skipped on every ballot, as if the ballots were rewritten without them.
+
+    If round_callback is given, it is called with the RoundResult of each round as soon as the round is counted.
+
     For more info see Wikipedia.
     """
 
     rounding_error = 1e-6
 
-    manager = ElectionManager(
+    manager = _create_election_manager(
         candidates,
         ballots,
         number_of_votes_pr_voter=1,
         compare_method_if_equal=compare_method_if_equal,
         pick_random_if_blank=pick_random_if_blank,
+        audit_log=audit_log,
+        withdrawn_candidates=withdrawn_candidates,
     )
     election_results = ElectionResults()
 
@@ -220,7 +293,10 @@ def single_transferable_vote(
                 manager.reject_candidate(candidate)
 
         # Register round result
-        election_results.register_round_results(manager.get_results())
+        round_result = manager.get_results()
+        election_results.register_round_results(round_result)
+        if round_callback is not None:
+            round_callback(round_result)
 
         # If all seats filled
         if manager.get_number_of_candidates_in_race() == 0:
@@ -232,7 +308,11 @@ def single_transferable_vote(
             for candidate in candidates_to_elect:
                 votes_for_candidate = manager.get_number_of_votes(candidate)
                 excess_votes: float = votes_for_candidate - votes_needed_to_win
-                manager.transfer_votes(candidate, excess_votes)
+                manager.transfer_votes(
+                    candidate,
+                    excess_votes,
+                    last_parcel_only=surplus_transfer_method == SurplusTransferMethod.LastParcel,
+                )
 
             # For votes who votes on rejected candidates,
             # transfer all votes to 2nd choice (or 3rd, 4th etc.)
@@ -244,3 +324,106 @@ def single_transferable_vote(
             continue
 
     return election_results
+
+
+def meek_single_transferable_vote(
+    candidates: List[Candidate],
+    ballots: List[Ballot],
+    number_of_seats: int,
+    tolerance: float = DEFAULT_TOLERANCE,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS,
+    warm_start: bool = True,
+    withdrawn_candidates: Iterable[Candidate] = (),
+) -> ElectionResults:
+    """
+    Meek single transferable vote is single transferable vote where surpluses are transferred by keep factors.
+    Every elected candidate keeps the same share of the value of each ballot that reaches it, and the rest goes on
+    to the next candidate on the ballot, also to candidates that are already elected. Ballots are therefore never
+    stuck at an elected candidate, and the quota is lowered as ballots are exhausted:
+
+        quota = (ballots - exhausted votes)/(seats+1)
+
+    In every round the keep factors are recalculated until all elected candidates have the quota (within
+    tolerance * quota), or max_iterations iterations. Then all hopeful candidates with the quota are elected, or if
+    no one has it, the hopeful candidate with fewest votes is excluded (ties are broken by fewest first votes).
+    With warm_start=True each round starts from the keep factors of the previous round, which needs far fewer
+    iterations than starting from 1.
+
+    The ballots are counted as a BallotTrie (see meek.py), so ballots can also be given as a BallotTrie,
+    EncodedBallots or a BallotProfile. Candidates in withdrawn_candidates are skipped on every ballot, as if the
+    ballots were rewritten without them.
+
+    For more info see Wikipedia.
+    """
+
+    rounding_error = 1e-6
+
+    withdrawn_candidates = list(withdrawn_candidates)
+    trie = get_ballot_trie(list(candidates) + withdrawn_candidates, ballots)
+    included_candidates = set(candidates) | set(withdrawn_candidates)
+    for candidate in trie.candidates:
+        if candidate not in included_candidates:
+            raise KeyError(candidate)
+    trie_candidates = set(trie.candidates)
+    for candidate in candidates:
+        if candidate not in trie_candidates:
+            raise ValueError("%s is not one of the candidates of the ballots" % candidate)
+    meek_count = MeekCount(
+        candidates, trie, number_of_seats, tolerance=tolerance, max_iterations=max_iterations
+    )
+    election_results = ElectionResults()
+
+    labels = {candidate: label for label, candidate in enumerate(trie.candidates)}
+    hopeful_labels = [labels[candidate] for candidate in candidates]
+    rejected_labels: List[int] = []
+    first_votes = None
+
+    while True:
+        if not warm_start:
+            meek_count.reset_keep_factors()
+        votes, exhausted_votes, quota, _ = meek_count.iterate(hopeful_labels)
+        if first_votes is None:
+            first_votes = votes
+
+        seats_left = number_of_seats - len(meek_count.elected_labels)
+        labels_to_elect = [label for label in hopeful_labels if (votes[label] + rounding_error) >= quota]
+        labels_to_elect.sort(key=lambda label: -votes[label])
+        labels_to_elect = labels_to_elect[:seats_left]
+
+        if len(hopeful_labels) <= seats_left:
+            labels_to_elect = sorted(hopeful_labels, key=lambda label: -votes[label])
+        elif len(labels_to_elect) == 0:
+            label_to_reject = min(hopeful_labels, key=lambda label: (votes[label], first_votes[label]))
+            meek_count.exclude(label_to_reject)
+            hopeful_labels.remove(label_to_reject)
+            rejected_labels.append(label_to_reject)
+
+        for label in labels_to_elect:
+            meek_count.elect(label)
+            hopeful_labels.remove(label)
+
+        # If no seats left, reject the rest of the candidates
+        if len(meek_count.elected_labels) == number_of_seats:
+            for label in sorted(hopeful_labels, key=lambda label: votes[label]):
+                meek_count.exclude(label)
+                rejected_labels.append(label)
+            hopeful_labels = []
+
+        # Register round result
+        hopeful_labels.sort(key=lambda label: -votes[label])
+        candidate_results = [
+            CandidateResult(trie.candidates[label], votes[label], status)
+            for label_list, status in [
+                (meek_count.elected_labels, CandidateStatus.Elected),
+                (hopeful_labels, CandidateStatus.Hopeful),
+                (rejected_labels[::-1], CandidateStatus.Rejected),
+            ]
+            for label in label_list
+        ]
+        election_results.register_round_results(RoundResult(candidate_results, exhausted_votes))
+
+        # If all seats filled
+        if len(hopeful_labels) == 0:
+            break
+
+    return election_results
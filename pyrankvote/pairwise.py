@@ -0,0 +1,280 @@
+"""
+Pairwise preferences and Condorcet methods
+
+A pairwise matrix holds, for every pair of candidates a and b, the number of ballots that rank a before b
+(a candidate that is ranked is before all candidates that are not). It is built in one pass over the nodes of
+a BallotTrie: every ballot below a node ranks the candidate of the node before all candidates except the ones
+on the path from the root. So each node adds its count to the row of its candidate, and subtracts it for the
+candidates on the path, and the work scales with the number of distinct ranking prefixes, not the number of
+ballots times the number of candidate pairs.
+
+The subtrees of the first choices are independent shards, so the matrix can be built by several worker
+processes. Condorcet winner detection, Schulze and ranked pairs all use the same matrix, and a BallotProfile
+caches it between them:
+
+> profile = BallotProfile(candidates, ballots)
+> get_condorcet_winner(candidates, profile)
+> schulze(candidates, profile)
+> ranked_pairs(candidates, profile)
+"""
+
+import array
+import multiprocessing
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tabulate import tabulate
+
+from pyrankvote.ballot_trie import ROOT_NODE, BallotTrie
+from pyrankvote.models import Candidate
+from pyrankvote.parallel import map_with_shared_state
+
+
+class PairwiseMatrix:
+    """
+    The number of ballots that rank each candidate before each other candidate. With n candidates,
+    preferences[i * n + j] is the number of ballots that rank candidates[i] before candidates[j].
+    """
+
+    def __init__(self, candidates: List[Candidate], preferences: Optional[array.array] = None):
+        self.candidates: List[Candidate] = list(candidates)
+        self._candidate_indexes: Dict[Candidate, int] = {
+            candidate: index for index, candidate in enumerate(self.candidates)
+        }
+
+        number_of_candidates = len(self.candidates)
+        if preferences is None:
+            preferences = array.array("d", bytes(8 * number_of_candidates * number_of_candidates))
+        if len(preferences) != number_of_candidates * number_of_candidates:
+            raise ValueError("Expected %i preferences" % (number_of_candidates * number_of_candidates))
+        self.preferences = preferences
+
+    @classmethod
+    def from_trie(cls, trie: BallotTrie, jobs: Optional[int] = 1) -> "PairwiseMatrix":
+        """
+        Builds the matrix of all candidates in the trie. With jobs > 1 (or None for one per CPU) the subtrees
+        of the first choices are split into shards that are counted by worker processes.
+        """
+        first_nodes = sorted(trie.children[ROOT_NODE].values(), key=lambda node: -trie.counts[node])
+        if jobs == 1:
+            shards = [first_nodes]
+        else:
+            # Largest subtrees first, each to the shard with the fewest ballots so far
+            number_of_shards = min(len(first_nodes), 4 * (jobs or multiprocessing.cpu_count()))
+            shards = [[] for _ in range(number_of_shards)]
+            shard_counts = [0.0] * number_of_shards
+            for node in first_nodes:
+                shard = shard_counts.index(min(shard_counts))
+                shards[shard].append(node)
+                shard_counts[shard] += trie.counts[node]
+
+        matrix = cls(trie.candidates)
+        preferences = matrix.preferences
+        for shard_preferences in map_with_shared_state(_get_shard_preferences, trie, shards, jobs=jobs):
+            for i, number_of_ballots in enumerate(shard_preferences):
+                preferences[i] += number_of_ballots
+        return matrix
+
+    def __repr__(self) -> str:
+        return "<PairwiseMatrix(%i candidates)>" % len(self.candidates)
+
+    def __str__(self) -> str:
+        rows = [
+            [str(candidate)]
+            + [
+                "" if candidate is other_candidate else self.get_number_of_ballots(candidate, other_candidate)
+                for other_candidate in self.candidates
+            ]
+            for candidate in self.candidates
+        ]
+        headers = ["Before"] + [str(candidate) for candidate in self.candidates]
+        return tabulate(rows, headers=headers)
+
+    def get_number_of_ballots(self, candidate: Candidate, other_candidate: Candidate) -> float:
+        """Returns the number of ballots that rank candidate before other_candidate"""
+        index = self._candidate_indexes[candidate]
+        other_index = self._candidate_indexes[other_candidate]
+        return self.preferences[index * len(self.candidates) + other_index]
+
+    def get_margin(self, candidate: Candidate, other_candidate: Candidate) -> float:
+        """Returns how many more ballots rank candidate before other_candidate than the other way around"""
+        return self.get_number_of_ballots(candidate, other_candidate) - self.get_number_of_ballots(
+            other_candidate, candidate
+        )
+
+    def get_submatrix(self, candidates: Sequence[Candidate]) -> "PairwiseMatrix":
+        """
+        Returns the matrix of some of the candidates. The preferences between two candidates do not depend on
+        the other candidates, so this is the matrix of the ballots with the other candidates withdrawn.
+        """
+        if list(candidates) == self.candidates:
+            return self
+
+        number_of_candidates = len(self.candidates)
+        indexes = [self._candidate_indexes[candidate] for candidate in candidates]
+        preferences = array.array(
+            "d",
+            [self.preferences[i * number_of_candidates + j] for i in indexes for j in indexes],
+        )
+        return PairwiseMatrix(candidates, preferences)
+
+    def get_condorcet_winner(self) -> Optional[Candidate]:
+        """Returns the candidate that is ranked before every other candidate by a majority, or None"""
+        for candidate in self.candidates:
+            if all(
+                self.get_margin(candidate, other_candidate) > 0
+                for other_candidate in self.candidates
+                if other_candidate is not candidate
+            ):
+                return candidate
+        return None
+
+    def get_schulze_ranking(self) -> List[Candidate]:
+        """
+        Returns the candidates ranked by the Schulze method, with the strength of a pairwise win measured in
+        winning votes. Candidates that tie are ranked in the order of candidates.
+        """
+        number_of_candidates = len(self.candidates)
+        preferences = self.preferences
+
+        # Strongest paths (Floyd-Warshall on the widest path)
+        strengths = [
+            [
+                preferences[i * number_of_candidates + j]
+                if preferences[i * number_of_candidates + j] > preferences[j * number_of_candidates + i]
+                else 0.0
+                for j in range(number_of_candidates)
+            ]
+            for i in range(number_of_candidates)
+        ]
+        for k in range(number_of_candidates):
+            strengths_k = strengths[k]
+            for i in range(number_of_candidates):
+                strength_ik = strengths[i][k]
+                if i == k or strength_ik == 0.0:
+                    continue
+                strengths_i = strengths[i]
+                for j in range(number_of_candidates):
+                    if j != i and j != k:
+                        strength = min(strength_ik, strengths_k[j])
+                        if strength > strengths_i[j]:
+                            strengths_i[j] = strength
+
+        # The Schulze relation is transitive, so the candidates can be ranked by how many they beat
+        number_of_wins = [
+            sum(1 for j in range(number_of_candidates) if strengths[i][j] > strengths[j][i])
+            for i in range(number_of_candidates)
+        ]
+        indexes = sorted(range(number_of_candidates), key=lambda i: -number_of_wins[i])
+        return [self.candidates[i] for i in indexes]
+
+    def get_ranked_pairs_ranking(self) -> List[Candidate]:
+        """
+        Returns the candidates ranked by ranked pairs (Tideman). The pairwise wins are locked in order of
+        winning votes (then smallest opposition, then the order of candidates), unless they make a cycle.
+        """
+        number_of_candidates = len(self.candidates)
+        preferences = self.preferences
+
+        pairs: List[Tuple[float, float, int, int]] = []
+        for i in range(number_of_candidates):
+            for j in range(number_of_candidates):
+                votes_for = preferences[i * number_of_candidates + j]
+                votes_against = preferences[j * number_of_candidates + i]
+                if votes_for > votes_against:
+                    pairs.append((-votes_for, votes_against, i, j))
+        pairs.sort()
+
+        locked: List[List[int]] = [[] for _ in range(number_of_candidates)]
+        for _, _, winner, loser in pairs:
+            if not _has_path(locked, loser, winner):
+                locked[winner].append(loser)
+
+        # The locked graph is acyclic: rank by the number of candidates each candidate has a path to
+        number_of_beaten = [
+            sum(1 for j in range(number_of_candidates) if j != i and _has_path(locked, i, j))
+            for i in range(number_of_candidates)
+        ]
+        indexes = sorted(range(number_of_candidates), key=lambda i: -number_of_beaten[i])
+        return [self.candidates[i] for i in indexes]
+
+
+def get_pairwise_matrix(candidates: List[Candidate], ballots, jobs: Optional[int] = 1) -> PairwiseMatrix:
+    """
+    Returns the pairwise matrix of the candidates, where ballots is a list of ballots, EncodedBallots, a
+    BallotTrie or a BallotProfile (which caches the matrix)
+    """
+    # BallotProfile caches a PairwiseMatrix, so it can only be imported here
+    from pyrankvote.ballot_profile import BallotProfile
+    from pyrankvote.encoded_ballots import get_ballot_trie
+
+    if isinstance(ballots, BallotProfile):
+        matrix = ballots.get_pairwise_matrix(jobs=jobs)
+    else:
+        matrix = PairwiseMatrix.from_trie(get_ballot_trie(candidates, ballots), jobs=jobs)
+    return matrix.get_submatrix(candidates)
+
+
+def get_condorcet_winner(candidates: List[Candidate], ballots, jobs: Optional[int] = 1) -> Optional[Candidate]:
+    """Returns the candidate that a majority prefers to every other candidate, or None if there is none"""
+    return get_pairwise_matrix(candidates, ballots, jobs=jobs).get_condorcet_winner()
+
+
+def schulze(candidates: List[Candidate], ballots, jobs: Optional[int] = 1) -> List[Candidate]:
+    """Returns the candidates ranked by the Schulze method (the winner first)"""
+    return get_pairwise_matrix(candidates, ballots, jobs=jobs).get_schulze_ranking()
+
+
+def ranked_pairs(candidates: List[Candidate], ballots, jobs: Optional[int] = 1) -> List[Candidate]:
+    """Returns the candidates ranked by ranked pairs (the winner first)"""
+    return get_pairwise_matrix(candidates, ballots, jobs=jobs).get_ranked_pairs_ranking()
+
+
+# INTERNAL FUNCTIONS
+
+
+def _get_shard_preferences(trie: BallotTrie, first_nodes: List[int]) -> array.array:
+    """Returns the flat preferences of the ballots in the subtrees of first_nodes"""
+    number_of_candidates = len(trie.candidates)
+    labels, parents, counts, children = trie.labels, trie.parents, trie.counts, trie.children
+
+    preferences = array.array("d", bytes(8 * number_of_candidates * number_of_candidates))
+    label_counts = [0.0] * number_of_candidates
+
+    stack = list(first_nodes)
+    while stack:
+        node = stack.pop()
+        label = labels[node]
+        count = counts[node]
+        row = label * number_of_candidates
+
+        # The ballots rank the label before everyone, except the candidates before it on the path
+        label_counts[label] += count
+        ancestor = parents[node]
+        while ancestor != ROOT_NODE:
+            preferences[row + labels[ancestor]] -= count
+            ancestor = parents[ancestor]
+
+        stack.extend(children[node].values())
+
+    for label, count in enumerate(label_counts):
+        if count == 0.0:
+            continue
+        row = label * number_of_candidates
+        for other_label in range(number_of_candidates):
+            if other_label != label:
+                preferences[row + other_label] += count
+    return preferences
+
+
+def _has_path(graph: List[List[int]], start: int, end: int) -> bool:
+    stack = [start]
+    visited = {start}
+    while stack:
+        node = stack.pop()
+        if node == end:
+            return True
+        for next_node in graph[node]:
+            if next_node not in visited:
+                visited.add(next_node)
+                stack.append(next_node)
+    return False
@@ -0,0 +1,64 @@
+"""
+Helper for running many counts on the same ballots in parallel
+
+Worker processes get the shared state (typically encoded ballots) once when they are started, instead of
+once per task, so only the small task arguments and results are sent between processes.
+"""
+
+import multiprocessing
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+
+_shared_state: Any = None
+
+
+def _init_worker(shared_state: Any):
+    global _shared_state
+    _shared_state = shared_state
+
+
+def _call_with_shared_state(function_and_item):
+    function, item = function_and_item
+    return function(_shared_state, item)
+
+
+def map_with_shared_state(
+    function: Callable[[Any, Any], Any],
+    shared_state: Any,
+    items: Iterable[Any],
+    jobs: Optional[int] = 1,
+) -> List[Any]:
+    """
+    Returns [function(shared_state, item) for item in items], computed by jobs worker processes.
+
+    With jobs=1 everything runs in the current process, and with jobs=None one worker process is
+    started for each CPU. function must be a module level function, so that it can be pickled.
+    """
+    items = list(items)
+    if jobs == 1 or len(items) <= 1:
+        return [function(shared_state, item) for item in items]
+
+    with multiprocessing.Pool(
+        processes=jobs, initializer=_init_worker, initargs=(shared_state,)
+    ) as pool:
+        return pool.map(_call_with_shared_state, [(function, item) for item in items])
+
+
+def imap_with_shared_state(
+    function: Callable[[Any, Any], Any],
+    shared_state: Any,
+    items: Iterable[Any],
+    jobs: Optional[int] = 1,
+) -> Iterator[Any]:
+    """Same as map_with_shared_state(..), but yields the results (in order) as soon as they are ready"""
+    items = list(items)
+    if jobs == 1 or len(items) <= 1:
+        for item in items:
+            yield function(shared_state, item)
+        return
+
+    with multiprocessing.Pool(
+        processes=jobs, initializer=_init_worker, initargs=(shared_state,)
+    ) as pool:
+        for result in pool.imap(_call_with_shared_state, [(function, item) for item in items]):
+            yield result
@@ -0,0 +1,242 @@
+"""
+Provisional results from a sample of the ballots
+
+On election night the ballots arrive as a stream, long before all of them are loaded. ProvisionalCount keeps
+a uniform random sample of the ballots seen so far (reservoir sampling), so it only holds sample_size
+rankings no matter how long the stream is, and the sample is never biased towards the ballots that were
+scanned first. At any time the sample can be counted with one of the ranking methods, and bootstrap
+resampling of the sample (see bootstrap.py) gives the probability that each candidate is elected and
+confidence bounds for the share of first choices.
+
+> provisional_count = ProvisionalCount(candidates, sample_size=10000, seed=1)
+> for ballots in scanned_batches:
+>     provisional_count.add_ballots(ballots)
+>     print(provisional_count.get_results())
+"""
+
+import math
+import random
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tabulate import tabulate
+
+from pyrankvote import single_seat_ranking_methods
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.bootstrap import BootstrapAnalysis
+from pyrankvote.helpers import ElectionResults
+from pyrankvote.models import Ballot, Candidate
+
+
+DEFAULT_SAMPLE_SIZE = 10000
+DEFAULT_NUMBER_OF_RESAMPLES = 200
+DEFAULT_CONFIDENCE = 0.95
+
+
+class ProvisionalResults:
+    """
+    Provisional results counted from a sample of sample_size ballots out of number_of_ballots_seen.
+
+     - election_results: the results of counting the sample
+     - winner_probabilities: the share of bootstrap resamples of the sample each candidate is elected in
+     - first_choice_bounds: the lower and upper confidence bound of each candidate's share of first choices
+    """
+
+    def __init__(
+        self,
+        number_of_ballots_seen: int,
+        sample_size: int,
+        confidence: float,
+        election_results: ElectionResults,
+        winner_probabilities: Dict[Candidate, float],
+        first_choice_bounds: Dict[Candidate, Tuple[float, float]],
+    ):
+        self.number_of_ballots_seen = number_of_ballots_seen
+        self.sample_size = sample_size
+        self.confidence = confidence
+        self.election_results = election_results
+        self.winner_probabilities = winner_probabilities
+        self.first_choice_bounds = first_choice_bounds
+
+    def __repr__(self) -> str:
+        return "<ProvisionalResults(%i of %i ballots)>" % (
+            self.sample_size,
+            self.number_of_ballots_seen,
+        )
+
+    def __str__(self) -> str:
+        winners = self.get_winners()
+        rows = [
+            (
+                str(candidate),
+                self.first_choice_bounds[candidate][0],
+                self.first_choice_bounds[candidate][1],
+                self.winner_probabilities[candidate],
+                "Yes" if candidate in winners else "",
+            )
+            for candidate in sorted(
+                self.winner_probabilities, key=lambda c: -self.winner_probabilities[c]
+            )
+        ]
+        headers = [
+            "Candidate",
+            "First choices (lower)",
+            "First choices (upper)",
+            "Elected",
+            "Projected",
+        ]
+        lines = [
+            "Sample of %i of %i ballots, %.0f%% confidence bounds"
+            % (self.sample_size, self.number_of_ballots_seen, self.confidence * 100),
+            tabulate(rows, headers=headers, floatfmt=".1%"),
+        ]
+        return "\n".join(lines)
+
+    def get_winners(self) -> List[Candidate]:
+        """Returns the projected winners: the winners of the sample"""
+        return self.election_results.get_winners()
+
+    def get_confident_winners(self) -> List[Candidate]:
+        """Returns the projected winners that are elected in at least the confidence share of the resamples"""
+        return [
+            candidate
+            for candidate in self.get_winners()
+            if self.winner_probabilities[candidate] >= self.confidence
+        ]
+
+
+class ProvisionalCount:
+    """
+    Keeps a uniform sample of at most sample_size of the ballots added, and counts it with method (one of
+    the ranking methods, with kwargs like number_of_seats passed on to it).
+
+    The sample is drawn with reservoir sampling (algorithm L), which only draws random numbers for the
+    ballots that enter the sample, so adding ballots that are skipped is cheap.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        method: Callable[..., ElectionResults] = single_seat_ranking_methods.instant_runoff_voting,
+        seed: Optional[int] = None,
+        **kwargs
+    ):
+        if sample_size < 1:
+            raise ValueError("The sample size must be at least 1")
+
+        self.candidates: List[Candidate] = list(candidates)
+        self.sample_size = sample_size
+        self.method = method
+        self.kwargs = kwargs
+        self.number_of_ballots_seen = 0
+
+        self._candidate_indexes: Dict[Candidate, int] = {
+            candidate: index for index, candidate in enumerate(self.candidates)
+        }
+        self._rng = random.Random(seed)
+        self._sample: List[Tuple[int, ...]] = []
+
+        # Algorithm L: the index of the next ballot to enter the full sample, and the weight it is drawn with
+        self._weight = 0.0
+        self._next_index = sample_size - 1
+
+    def __repr__(self) -> str:
+        return "<ProvisionalCount(%i of %i ballots)>" % (
+            len(self._sample),
+            self.number_of_ballots_seen,
+        )
+
+    def add_ballot(self, ballot: Ballot):
+        self.add_ballots([ballot])
+
+    def add_ballots(self, ballots: Iterable[Ballot]):
+        """Adds ballots from the stream. Only the ballots that enter the sample are kept."""
+        sample = self._sample
+        sample_size = self.sample_size
+
+        for ballot in ballots:
+            index = self.number_of_ballots_seen
+            self.number_of_ballots_seen += 1
+
+            if index < sample_size:
+                sample.append(self._encode(ballot))
+                if index == sample_size - 1:
+                    self._weight = 1.0
+                    self._draw_next_index()
+            elif index == self._next_index:
+                sample[self._rng.randrange(sample_size)] = self._encode(ballot)
+                self._draw_next_index()
+
+    def get_sample(self) -> BallotTrie:
+        """Returns the sampled ballots as a BallotTrie"""
+        trie = BallotTrie(self.candidates)
+        for ranking in self._sample:
+            trie.add_ranking(ranking)
+        return trie
+
+    def get_results(
+        self,
+        number_of_resamples: int = DEFAULT_NUMBER_OF_RESAMPLES,
+        confidence: float = DEFAULT_CONFIDENCE,
+        seed: Optional[int] = None,
+        jobs: Optional[int] = 1,
+    ) -> ProvisionalResults:
+        """
+        Counts the sample, and bootstraps number_of_resamples resamples of it (with jobs worker processes)
+        for the winner probabilities and the confidence bounds.
+        """
+        if len(self._sample) == 0:
+            raise ValueError("No ballots are added")
+
+        trie = self.get_sample()
+        election_results = self.method(self.candidates, trie, **self.kwargs)
+
+        analysis = BootstrapAnalysis(self.candidates, trie, self.method, **self.kwargs)
+        bootstrap_results = analysis.resample(number_of_resamples, seed=seed, jobs=jobs)
+
+        # The first round always has the first choices of every candidate
+        tail = (1.0 - confidence) / 2.0
+        first_choice_bounds = {}
+        for candidate, votes in bootstrap_results.get_round_vote_distribution(0).items():
+            shares = sorted(number_of_votes / len(self._sample) for number_of_votes in votes)
+            first_choice_bounds[candidate] = (
+                _get_percentile(shares, tail),
+                _get_percentile(shares, 1.0 - tail),
+            )
+
+        return ProvisionalResults(
+            self.number_of_ballots_seen,
+            len(self._sample),
+            confidence,
+            election_results,
+            bootstrap_results.get_winner_frequencies(),
+            first_choice_bounds,
+        )
+
+    # INTERNAL METHODS
+
+    def _encode(self, ballot: Ballot) -> Tuple[int, ...]:
+        return tuple(self._candidate_indexes[candidate] for candidate in ballot.ranked_candidates)
+
+    def _draw_next_index(self):
+        """Draws the next ballot that enters the full sample, skipping a geometric number of ballots"""
+        self._weight *= math.exp(math.log(_random_open(self._rng)) / self.sample_size)
+        if self._weight >= 1.0:
+            self._next_index += 1
+            return
+        skip = math.floor(math.log(_random_open(self._rng)) / math.log1p(-self._weight))
+        self._next_index += skip + 1
+
+
+def _random_open(rng: random.Random) -> float:
+    """Returns a random number in the open interval (0, 1)"""
+    while True:
+        value = rng.random()
+        if value > 0.0:
+            return value
+
+
+def _get_percentile(sorted_values: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of sorted values"""
+    index = min(len(sorted_values) - 1, max(0, int(math.ceil(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
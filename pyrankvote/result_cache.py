@@ -0,0 +1,336 @@
+"""
+Opt-in on-disk cache of election results
+
+ResultCache stores ElectionResults on local disk, keyed by a stable hash of the canonicalized input
+(candidate names, ballot rankings, ranking method and options). A cache hit returns the stored results
+without counting the votes again.
+
+> cache = ResultCache("/tmp/pyrankvote-cache", max_size_bytes=50 * 1024 * 1024)
+> election_result = cache.count(pyrankvote.single_transferable_vote, candidates, ballots, number_of_seats=3)
+
+The results of counts that use random numbers (CompareMethodIfEqual.Random or pick_random_if_blank=True)
+are only cached if a seed is given, since the results are not reproducible otherwise. Other counts can
+still break a tie that is equal on all choices randomly (unless compare_method_if_equal is DrawnLots),
+so when no seed is given, they are seeded from the cache key.
+
+Counts of a SQLiteBallotStore or a BallotStream are not cached, since their ballots are not in memory.
+"""
+
+import array
+import collections
+import hashlib
+import inspect
+import json
+import os
+import random
+import tempfile
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.helpers import (
+    STATUS_CODES,
+    STATUSES,
+    CandidateResult,
+    CompareMethodIfEqual,
+    ElectionResults,
+    RoundResult,
+    TransferMatrix,
+)
+from pyrankvote.models import Candidate
+from pyrankvote.sqlite_store import SQLiteBallotStore
+from pyrankvote.streaming import BallotStream
+
+
+CACHE_FILE_EXTENSION = ".result"
+SERIALIZATION_VERSION = 2
+
+
+class ResultCache:
+    """
+    Cache of ElectionResults stored as compressed files in a local directory.
+
+    When the files in the directory take up more than max_size_bytes, the least recently used
+    results are evicted.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return "<ResultCache('%s')>" % self.directory
+
+    def count(
+        self,
+        method: Callable[..., ElectionResults],
+        candidates: List[Candidate],
+        ballots,
+        seed: Optional[int] = None,
+        **kwargs
+    ) -> ElectionResults:
+        """
+        Returns the results of method(candidates, ballots, **kwargs) from the cache, or counts the
+        votes and stores the results if they are not in the cache.
+
+        The random number generator is seeded with seed before counting, or with the cache key if seed
+        is not given, so that the cached results are reproducible. A round_callback in kwargs is not part
+        of the key, and is called with the cached rounds on a cache hit.
+        """
+        uses_random = kwargs.get("pick_random_if_blank", False) or (
+            kwargs.get("compare_method_if_equal") == CompareMethodIfEqual.Random
+        )
+        if uses_random and seed is None:
+            # Not reproducible, so don't cache
+            return method(candidates, ballots, **kwargs)
+        if kwargs.get("audit_log") is not None:
+            # The audit log is only written when the votes are counted
+            return method(candidates, ballots, **kwargs)
+        if isinstance(ballots, (SQLiteBallotStore, BallotStream)):
+            # The ballots are not in memory, so hashing them would read them all once more
+            return method(candidates, ballots, **kwargs)
+
+        round_callback = kwargs.pop("round_callback", None)
+        key = get_cache_key(method, candidates, ballots, seed=seed, **kwargs)
+        election_results = self.get(key, candidates)
+        if election_results is not None:
+            if round_callback is not None:
+                for round_ in election_results.rounds:
+                    round_callback(round_)
+            return election_results
+
+        if round_callback is not None:
+            kwargs["round_callback"] = round_callback
+        random_state = random.getstate()
+        random.seed(key if seed is None else seed)
+        try:
+            election_results = method(candidates, ballots, **kwargs)
+        finally:
+            random.setstate(random_state)
+
+        self.put(key, election_results)
+        return election_results
+
+    def get(self, key: str, candidates: List[Candidate]) -> Optional[ElectionResults]:
+        """Returns the cached results (using the given candidate objects), or None if not cached"""
+        file_path = self._get_file_path(key)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            election_results = deserialize_election_results(data, candidates)
+        except (zlib.error, ValueError, KeyError, IndexError, TypeError):
+            # A truncated or corrupt file (or an older version) is removed and counted again
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            pass  # Removed by another process
+        return election_results
+
+    def put(self, key: str, election_results: ElectionResults):
+        data = serialize_election_results(election_results)
+
+        # Write to a temporary file and rename, so readers never see a half written file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, self._get_file_path(key))
+
+        self._evict()
+
+    def clear(self):
+        for file_path in self._get_cache_files():
+            os.remove(file_path)
+
+    def get_size(self) -> int:
+        """Returns the number of bytes used by the cached results"""
+        return sum(os.path.getsize(file_path) for file_path in self._get_cache_files())
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._get_file_path(key))
+
+    # INTERNAL METHODS
+
+    def _get_file_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_FILE_EXTENSION)
+
+    def _get_cache_files(self) -> List[str]:
+        return [
+            os.path.join(self.directory, file_name)
+            for file_name in os.listdir(self.directory)
+            if file_name.endswith(CACHE_FILE_EXTENSION)
+        ]
+
+    def _evict(self):
+        """Removes the least recently used results until the cache is below max_size_bytes"""
+        files = []
+        for file_path in self._get_cache_files():
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue  # Removed by another process
+            files.append((stat.st_mtime, stat.st_size, file_path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file_path in sorted(files):
+            if size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+
+def get_cache_key(
+    method: Callable[..., ElectionResults],
+    candidates: List[Candidate],
+    ballots,
+    seed: Optional[int] = None,
+    **kwargs
+) -> str:
+    """
+    Returns a stable hash of the count.
+
+    The ballots are canonicalized as the number of ballots with each distinct ranking, so the same
+    ballots in a different order (or in a BallotTrie, EncodedBallots or a BallotProfile) give the same key.
+    If seed is given, the results depend on the order of the ballots, and a list of ballots is hashed in
+    order. A SQLiteBallotStore or BallotStream raises ValueError, since its ballots are not in memory.
+    """
+    candidate_indexes: Dict[Candidate, int] = {
+        candidate: index for index, candidate in enumerate(candidates)
+    }
+    # Withdrawn candidates are still on the ballots (and in the options, so they are part of the key)
+    for candidate in kwargs.get("withdrawn_candidates", ()):
+        candidate_indexes.setdefault(candidate, len(candidate_indexes))
+
+    if isinstance(ballots, (SQLiteBallotStore, BallotStream)):
+        raise ValueError("The results of counting a %s can not be cached" % type(ballots).__name__)
+    if isinstance(ballots, BallotProfile):
+        ballots = ballots.get_trie()
+    if isinstance(ballots, (BallotTrie, EncodedBallots)):
+        label_indexes = [candidate_indexes[candidate] for candidate in ballots.candidates]
+        ranking_counts = collections.Counter()
+        for ranking, count in ballots.iter_rankings():
+            ranking_counts[tuple(label_indexes[label] for label in ranking)] += count
+        rankings = sorted(ranking_counts.items())
+
+    else:
+        encoded_ballots = (
+            tuple(candidate_indexes[candidate] for candidate in ballot.ranked_candidates)
+            for ballot in ballots
+        )
+        if seed is not None:
+            rankings = [(ranking, 1) for ranking in encoded_ballots]
+        else:
+            rankings = sorted(collections.Counter(encoded_ballots).items())
+
+    # Bind the options to the signature of the method, so that leaving out an option
+    # and giving its default value give the same key
+    signature = inspect.signature(method)
+    bound_arguments = signature.bind_partial(**kwargs)
+    bound_arguments.apply_defaults()
+    options = {
+        key: value
+        for key, value in bound_arguments.arguments.items()
+        if key not in ("candidates", "ballots")
+    }
+    options["seed"] = seed
+
+    hash_ = hashlib.sha256()
+    header = {
+        "version": SERIALIZATION_VERSION,
+        "method": "%s.%s" % (method.__module__, method.__name__),
+        "candidates": [candidate.name for candidate in candidates],
+        "options": sorted((key, repr(value)) for key, value in options.items()),
+    }
+    hash_.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+    for ranking, count in rankings:
+        hash_.update(("%s:%r;" % (",".join(map(str, ranking)), float(count))).encode("ascii"))
+
+    return hash_.hexdigest()
+
+
+def serialize_election_results(election_results: ElectionResults) -> bytes:
+    """
+    Serializes ElectionResults compactly: candidates are stored by name once, and each round as
+    rows of (candidate index, number of votes, status code), with the transfer matrix of the round.
+    """
+    candidate_indexes: Dict[str, int] = {}
+    candidate_names: List[str] = []
+    rounds = []
+
+    def get_index(candidate: Candidate) -> int:
+        index = candidate_indexes.get(candidate.name)
+        if index is None:
+            index = candidate_indexes[candidate.name] = len(candidate_names)
+            candidate_names.append(candidate.name)
+        return index
+
+    for round_ in election_results.rounds:
+        rows = []
+        for candidate, number_of_votes, status in round_.candidate_results:
+            rows.append([get_index(candidate), number_of_votes, STATUS_CODES[status]])
+
+        transfers = None
+        if round_.transfers is not None:
+            transfers = [
+                [get_index(candidate) for candidate in round_.transfers.candidates],
+                [[from_index, row.tolist()] for from_index, row in sorted(round_.transfers.rows.items())],
+            ]
+        rounds.append([round_.number_of_blank_votes, rows, transfers])
+
+    data = {
+        "version": SERIALIZATION_VERSION,
+        "candidates": candidate_names,
+        "rounds": rounds,
+    }
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def deserialize_election_results(
+    data: bytes, candidates: List[Candidate] = ()
+) -> ElectionResults:
+    """
+    Deserializes ElectionResults. Candidates with the same name as one of the given candidate objects
+    are replaced by that object, other candidates are created as new Candidate objects.
+    """
+    data = json.loads(zlib.decompress(data).decode("utf-8"))
+    if data["version"] != SERIALIZATION_VERSION:
+        raise ValueError("Unknown serialization version %r" % data["version"])
+
+    candidates_by_name = {candidate.name: candidate for candidate in candidates}
+    result_candidates = [
+        candidates_by_name.get(name) or Candidate(name) for name in data["candidates"]
+    ]
+
+    election_results = ElectionResults()
+    for number_of_blank_votes, rows, transfers in data["rounds"]:
+        candidate_results = [
+            CandidateResult(result_candidates[index], number_of_votes, STATUSES[status_code])
+            for index, number_of_votes, status_code in rows
+        ]
+        if transfers is not None:
+            transfer_indexes, transfer_rows = transfers
+            transfers = TransferMatrix(
+                [result_candidates[index] for index in transfer_indexes],
+                {from_index: array.array("d", row) for from_index, row in transfer_rows},
+            )
+        election_results.register_round_results(
+            RoundResult(candidate_results, number_of_blank_votes, transfers)
+        )
+
+    return election_results
@@ -0,0 +1,56 @@
+"""
+Results for a range of numbers of seats
+
+Deciding how many seats a committee should have means counting the same ballots once for every number of
+seats. count_seat_range(..) encodes the ballots once, in a BallotProfile (see ballot_profile.py), and
+distributes the first votes once for all counts that give voters the same number of votes (all STV counts
+do). The counts themselves are independent, and run in parallel with jobs worker processes.
+
+> results = count_seat_range(candidates, ballots, range(1, 16), jobs=4)
+> results[5].get_winners()
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pyrankvote import multiple_seat_ranking_methods
+from pyrankvote.ballot_profile import BallotProfile
+from pyrankvote.helpers import ElectionResults
+from pyrankvote.models import Candidate
+from pyrankvote.parallel import map_with_shared_state
+
+
+def count_seat_range(
+    candidates: List[Candidate],
+    ballots,
+    numbers_of_seats: Iterable[int],
+    method: Callable[..., ElectionResults] = multiple_seat_ranking_methods.single_transferable_vote,
+    jobs: Optional[int] = 1,
+    **kwargs
+) -> Dict[int, ElectionResults]:
+    """
+    Returns the results of method(candidates, ballots, number_of_seats, **kwargs) for every number of seats
+    in numbers_of_seats. Method is single_transferable_vote or preferential_block_voting.
+    """
+    numbers_of_seats = list(numbers_of_seats)
+    profile = ballots if isinstance(ballots, BallotProfile) else BallotProfile(candidates, ballots)
+
+    # Distribute the first votes before the profile is sent to the worker processes, so they get them too.
+    # Every STV count gives voters one vote, and PBV gives them one vote for every seat.
+    if method is multiple_seat_ranking_methods.single_transferable_vote:
+        votes_pr_voter = {1}
+    else:
+        votes_pr_voter = set(numbers_of_seats)
+    trie = profile.get_trie()
+    included_labels = [candidate in candidates for candidate in trie.candidates]
+    for number_of_votes_pr_voter in sorted(votes_pr_voter):
+        profile.get_first_votes(included_labels, number_of_votes_pr_voter)
+
+    results = map_with_shared_state(
+        _count_with_seats, (method, candidates, profile, kwargs), numbers_of_seats, jobs=jobs
+    )
+    return dict(zip(numbers_of_seats, results))
+
+
+def _count_with_seats(count_state, number_of_seats: int) -> ElectionResults:
+    method, candidates, profile, kwargs = count_state
+    return method(candidates, profile, number_of_seats=number_of_seats, **kwargs)
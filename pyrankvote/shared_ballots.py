@@ -0,0 +1,168 @@
+"""
+Encoded ballots in shared memory
+
+Sending ballots to worker processes normally means pickling them to every worker, which can cost more
+than counting them. SharedEncodedBallots stores EncodedBallots in shared memory (or in a memory-mapped
+file), in the same format as EncodedBallots.save(..). Other processes attach to it by name, and read the
+rankings directly from the shared memory, without copying them.
+
+SharedEncodedBallots is pickled as its name, so it can be given to process pools (like parallel.py) and
+every worker attaches to the same copy of the ballots:
+
+> with SharedEncodedBallots.create(encoded_ballots) as shared_ballots:
+>     results = map_with_shared_state(count, shared_ballots, items, jobs=4)
+
+multiprocessing.shared_memory requires Python 3.8 or later. On earlier versions (or with
+storage="file"), the ballots are stored in a memory-mapped temporary file, and the name is the file path.
+"""
+
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+from typing import Optional
+
+from pyrankvote.encoded_ballots import EncodedBallots, _parse_buffer
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    resource_tracker = shared_memory = None
+
+
+SHARED_MEMORY = "shared_memory"
+FILE = "file"
+
+# Names of the shared memory blocks created by this process
+_created_names = set()
+
+
+class SharedEncodedBallots(EncodedBallots):
+    """
+    EncodedBallots stored in shared memory (storage="shared_memory") or a memory-mapped file
+    (storage="file"), that other processes can attach to by name.
+
+    The process that creates the shared ballots owns them, and must call unlink() (or use it as a context
+    manager) when no process needs them any more. Attached processes only call close().
+    """
+
+    def __init__(
+        self, name: str, storage: str, buffer, shared_memory_block=None, is_owner: bool = False
+    ):
+        super().__init__(*_parse_buffer(buffer, name))
+        self.name = name
+        self.storage = storage
+        self.is_owner = is_owner
+
+        self._buffer = buffer
+        self._shared_memory_block = shared_memory_block
+
+    @classmethod
+    def create(
+        cls,
+        encoded_ballots: EncodedBallots,
+        storage: Optional[str] = None,
+        directory: Optional[str] = None,
+    ) -> "SharedEncodedBallots":
+        """
+        Copies the encoded ballots to shared memory, or to a memory-mapped file in directory (the
+        temporary directory by default). Shared memory is used by default if it is available.
+        """
+        if storage is None:
+            storage = SHARED_MEMORY if shared_memory is not None else FILE
+
+        sections = encoded_ballots._get_file_sections()
+        size = sum(len(section) for section in sections)
+
+        if storage == SHARED_MEMORY:
+            if shared_memory is None:
+                raise ValueError("Shared memory requires Python 3.8 or later, use storage='file'")
+            shared_memory_block = shared_memory.SharedMemory(create=True, size=size)
+            buffer = shared_memory_block.buf
+            name = shared_memory_block.name
+            _created_names.add(name)
+        elif storage == FILE:
+            shared_memory_block = None
+            file_descriptor, name = tempfile.mkstemp(suffix=".ballots", dir=directory)
+            with os.fdopen(file_descriptor, "r+b") as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+        else:
+            raise ValueError("Unknown storage %r" % storage)
+
+        position = 0
+        for section in sections:
+            buffer[position : position + len(section)] = section
+            position += len(section)
+
+        return cls(name, storage, buffer, shared_memory_block, is_owner=True)
+
+    @classmethod
+    def attach(cls, name: str, storage: str = SHARED_MEMORY) -> "SharedEncodedBallots":
+        """Attaches to shared ballots created by another process"""
+        if storage == SHARED_MEMORY:
+            if shared_memory is None:
+                raise ValueError("Shared memory requires Python 3.8 or later")
+            if sys.version_info >= (3, 13):
+                shared_memory_block = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                shared_memory_block = shared_memory.SharedMemory(name=name)
+                if name not in _created_names and multiprocessing.parent_process() is None:
+                    # Processes not started by multiprocessing have a resource tracker of their own, that
+                    # would remove the shared memory when this process exits
+                    resource_tracker.unregister(shared_memory_block._name, "shared_memory")
+            return cls(name, storage, shared_memory_block.buf, shared_memory_block)
+
+        if storage == FILE:
+            with open(name, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(name, storage, buffer)
+
+        raise ValueError("Unknown storage %r" % storage)
+
+    def __repr__(self) -> str:
+        return "<SharedEncodedBallots('%s', %i ballots, %i distinct rankings)>" % (
+            self.name,
+            self.get_number_of_ballots(),
+            len(self),
+        )
+
+    def __reduce__(self):
+        # Other processes attach to the shared ballots instead of getting a copy
+        return SharedEncodedBallots.attach, (self.name, self.storage)
+
+    def __enter__(self) -> "SharedEncodedBallots":
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.is_owner:
+            self.unlink()
+        else:
+            self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Closes the access to the shared ballots from this process (the arrays can't be used afterwards)"""
+        if getattr(self, "_buffer", None) is None:
+            return
+
+        # The views of the buffer must be released before the buffer can be closed
+        for values in [self.offsets, self.counts, self.rankings]:
+            values.release()
+        if self._shared_memory_block is not None:
+            self._shared_memory_block.close()
+        else:
+            self._buffer.close()
+        self._buffer = None
+
+    def unlink(self):
+        """Closes and removes the shared ballots (only called by the process that created them)"""
+        self.close()
+        if self.storage == SHARED_MEMORY:
+            self._shared_memory_block.unlink()
+            _created_names.discard(self.name)
+        else:
+            os.remove(self.name)
@@ -4,8 +4,8 @@ Single seat ranking methods
 Instant runoff voting is the only implemented ranking method so far.
 """
 
-from typing import List
-from pyrankvote.helpers import CompareMethodIfEqual, ElectionResults
+from typing import Callable, Iterable, List, Optional
+from pyrankvote.helpers import CompareMethodIfEqual, ElectionResults, RoundResult
 from pyrankvote.models import Candidate, Ballot
 from pyrankvote import multiple_seat_ranking_methods
 
@@ -15,6 +15,9 @@ def instant_runoff_voting(
     ballots: List[Ballot],
     compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
     pick_random_if_blank=False,
+    audit_log=None,
+    round_callback: Optional[Callable[[RoundResult], None]] = None,
+    withdrawn_candidates: Iterable[Candidate] = (),
 ) -> ElectionResults:
     """
     Instant runoff voting (IRV), often known as the alternative vote, is a singe candidate election method,
@@ -30,6 +33,18 @@ def instant_runoff_voting(
     that should be filled. This is the prefered method in Robers rules of order. The only between difference between
     IRV/PBV and exhaustive ballout, is that in exhaustive ballout voters can adjust votes according to partial results.
 
+    Ballots can also be given as a BallotTrie or EncodedBallots, which counts ballots that share a ranking prefix together
+    and is much faster for large elections, or as a BallotProfile that is reused between counts. Ballots that do not
+    fit in memory can be counted in a SQLiteBallotStore (see sqlite_store.py), or streamed from a file in every round
+    as a BallotStream (see streaming.py).
+
+    If an AuditLog is given as audit_log, the transfers of every ballot are written to it (only supported for a list
+    of ballots).
+
+    Candidates in withdrawn_candidates are skipped on every ballot, as if the ballots were rewritten without them.
+
+    If round_callback is given, it is called with the RoundResult of each round as soon as the round is counted.
+
     For more info see Wikipedia.
     """
 
@@ -39,4 +54,7 @@ def instant_runoff_voting(
         number_of_seats=1,
         compare_method_if_equal=compare_method_if_equal,
         pick_random_if_blank=pick_random_if_blank,
+        audit_log=audit_log,
+        round_callback=round_callback,
+        withdrawn_candidates=withdrawn_candidates,
     )
@@ -0,0 +1,685 @@
+"""
+Ballot store in a SQLite database, for counts that should not hold the ballots in memory
+
+SQLiteBallotStore stores every distinct ranking once with its number of ballots (like EncodedBallots), in
+a local SQLite database. A count keeps its vote piles in the database too: the votes table has a row for
+every ranking and candidate it currently votes for (the live preference of the ranking), indexed by the
+candidate. Tallies are aggregate queries over the index, and transferring the votes of a candidate only
+reads and updates the rows of that candidate, in batches. Only the numbers of votes of the candidates are
+held in memory, so the memory used does not grow with the number of ballots.
+
+> store = SQLiteBallotStore.from_ballots("ballots.sqlite", candidates, ballots)
+> election_result = pyrankvote.single_transferable_vote(store.candidates, store, number_of_seats=3)
+
+Every change of the count (the first distribution, and each election, rejection and transfer) is one
+transaction, which is logged together with the vote numbers after it. If a count is interrupted (even by
+a crash), running the same count on the store again replays the logged changes without counting them
+again, and continues where the count stopped. A count that has finished is replayed completely, so it
+returns the results without counting. reset_count() removes the count from the store, to start a
+new count.
+
+Counts can only be resumed if they make the same choices as before, so ties must be broken by lots drawn
+before the count (give DrawnLots as compare_method_if_equal, with after_most_second_choice_votes=True to
+compare second choice votes first). CompareMethodIfEqual.MostSecondChoiceVotes is not enough, since ties
+in the second choice votes are still broken randomly.
+"""
+
+import array
+import json
+import sqlite3
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pyrankvote.helpers import (
+    CandidateStatus,
+    CandidateVoteCount,
+    CompareMethodIfEqual,
+    ElectionManager,
+    TransferMatrix,
+)
+from pyrankvote.models import Candidate, Ballot
+
+
+FORMAT_VERSION = 1
+RANKING_TYPECODE = "i"
+BATCH_SIZE = 10000  # Rankings read or written by each query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS candidates (label INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rankings (
+    id INTEGER PRIMARY KEY,
+    ranking BLOB NOT NULL UNIQUE,
+    first_choice INTEGER,
+    count REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rankings_by_first_choice ON rankings (first_choice);
+CREATE TABLE IF NOT EXISTS votes (
+    ranking_id INTEGER NOT NULL,
+    candidate INTEGER NOT NULL,
+    parcel INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS votes_by_candidate ON votes (candidate, parcel);
+CREATE TABLE IF NOT EXISTS operations (
+    number INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    candidate INTEGER,
+    value REAL,
+    state TEXT NOT NULL
+);
+"""
+
+
+class SQLiteBallotStore:
+    """
+    Ballots stored in a SQLite database at database_path. Candidates are stored as integer labels (the
+    index in SQLiteBallotStore.candidates).
+
+    A new database is created with the given candidates. An existing database is opened with the
+    candidates it was created with, and candidates can then be left out.
+    """
+
+    def __init__(self, database_path: str, candidates: Optional[List[Candidate]] = None):
+        self.database_path = database_path
+
+        # Transactions are started explicitly (see transaction())
+        self._connection = sqlite3.connect(database_path, isolation_level=None)
+        self._connection.executescript(SCHEMA)
+
+        metadata = dict(self._connection.execute("SELECT key, value FROM metadata"))
+        if len(metadata) == 0:
+            if candidates is None:
+                raise ValueError("%s is not a ballot store, and no candidates are given" % database_path)
+            with self.transaction():
+                self._connection.executemany(
+                    "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                    [("format_version", str(FORMAT_VERSION)), ("byteorder", sys.byteorder)],
+                )
+                self._connection.executemany(
+                    "INSERT INTO candidates (label, name) VALUES (?, ?)",
+                    [(label, candidate.name) for label, candidate in enumerate(candidates)],
+                )
+            metadata = dict(self._connection.execute("SELECT key, value FROM metadata"))
+
+        if int(metadata["format_version"]) != FORMAT_VERSION:
+            raise ValueError("%s has an unsupported format version" % database_path)
+        if metadata["byteorder"] != sys.byteorder:
+            raise ValueError("%s was saved with another byte order" % database_path)
+
+        names = [name for name, in self._connection.execute("SELECT name FROM candidates ORDER BY label")]
+        if candidates is None:
+            candidates = [Candidate(name) for name in names]
+        elif [candidate.name for candidate in candidates] != names:
+            raise ValueError("%s is a ballot store of other candidates" % database_path)
+        self.candidates: List[Candidate] = list(candidates)
+
+    @classmethod
+    def from_ranking_counts(
+        cls,
+        database_path: str,
+        candidates: List[Candidate],
+        ranking_counts: Iterable[Tuple[Sequence[int], float]],
+    ) -> "SQLiteBallotStore":
+        """Creates a store from (ranking, number of ballots) pairs, with rankings as candidate indexes"""
+        store = cls(database_path, candidates)
+        store.add_ranking_counts(ranking_counts)
+        return store
+
+    @classmethod
+    def from_ballots(
+        cls, database_path: str, candidates: List[Candidate], ballots: Iterable[Ballot]
+    ) -> "SQLiteBallotStore":
+        store = cls(database_path, candidates)
+        store.add_ballots(ballots)
+        return store
+
+    def __repr__(self) -> str:
+        return "<SQLiteBallotStore(%s, %i candidates)>" % (self.database_path, len(self.candidates))
+
+    def __enter__(self) -> "SQLiteBallotStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def transaction(self) -> "_Transaction":
+        """Returns a context manager that runs the statements in it as one transaction"""
+        return _Transaction(self._connection)
+
+    # BALLOTS
+
+    def add_ranking_counts(self, ranking_counts: Iterable[Tuple[Sequence[int], float]]):
+        """
+        Adds (ranking, number of ballots) pairs, with rankings as candidate indexes. Rankings that are
+        already in the store get their number of ballots increased, so the rankings do not need to be
+        distinct. The pairs are added in batches, so they can be streamed from a file.
+        """
+        if self.get_number_of_operations() > 0:
+            raise RuntimeError("Ballots can not be added while the store has a count (see reset_count())")
+
+        batch: List[Tuple[bytes, Optional[int], float]] = []
+        for ranking, count in ranking_counts:
+            first_choice = ranking[0] if len(ranking) > 0 else None
+            batch.append((_encode_ranking(ranking), first_choice, count))
+            if len(batch) == BATCH_SIZE:
+                self._add_encoded_rankings(batch)
+                batch = []
+        self._add_encoded_rankings(batch)
+
+    def add_ballots(self, ballots: Iterable[Ballot]):
+        labels = {candidate: label for label, candidate in enumerate(self.candidates)}
+        self.add_ranking_counts(
+            ([labels[candidate] for candidate in ballot.ranked_candidates], 1) for ballot in ballots
+        )
+
+    def get_number_of_ballots(self) -> float:
+        (number_of_ballots,) = self._connection.execute("SELECT TOTAL(count) FROM rankings").fetchone()
+        return number_of_ballots
+
+    def get_number_of_rankings(self) -> int:
+        (number_of_rankings,) = self._connection.execute("SELECT COUNT(*) FROM rankings").fetchone()
+        return number_of_rankings
+
+    def iter_rankings(self) -> Iterator[Tuple[Tuple[int, ...], float]]:
+        """Yields (ranking, number of ballots) for every distinct ranking, reading BATCH_SIZE rankings at a time"""
+        for _, ranking, count in self._iter_ranking_rows():
+            yield ranking, count
+
+    def get_first_preference_tallies(self) -> Dict[Candidate, float]:
+        """Returns the number of ballots that rank each candidate first"""
+        tallies = {candidate: 0.0 for candidate in self.candidates}
+        for label, number_of_ballots in self._connection.execute(
+            "SELECT first_choice, TOTAL(count) FROM rankings WHERE first_choice IS NOT NULL GROUP BY first_choice"
+        ):
+            tallies[self.candidates[label]] = number_of_ballots
+        return tallies
+
+    # THE COUNT IN THE STORE
+
+    def get_tallies(self) -> Dict[Candidate, float]:
+        """Returns the number of ballots in the vote pile of each candidate in the count (not their value)"""
+        tallies = {candidate: 0.0 for candidate in self.candidates}
+        for label, number_of_ballots in self.get_label_tallies().items():
+            tallies[self.candidates[label]] = number_of_ballots
+        return tallies
+
+    def get_label_tallies(self) -> Dict[int, float]:
+        return dict(
+            self._connection.execute(
+                "SELECT votes.candidate, TOTAL(rankings.count) FROM votes "
+                "JOIN rankings ON rankings.id = votes.ranking_id GROUP BY votes.candidate"
+            )
+        )
+
+    def get_number_of_ballots_in_pile(self, label: int, parcel: Optional[int] = None) -> float:
+        """Returns the number of ballots that vote for the candidate (only in the parcel if not None)"""
+        condition, parameters = _get_pile_condition(label, parcel)
+        (number_of_ballots,) = self._connection.execute(
+            "SELECT TOTAL(rankings.count) FROM votes JOIN rankings ON rankings.id = votes.ranking_id "
+            "WHERE %s" % condition,
+            parameters,
+        ).fetchone()
+        return number_of_ballots
+
+    def distribute_first_votes(
+        self, included_labels: Sequence[bool], number_of_votes_pr_voter: int = 1
+    ) -> Tuple[float, float]:
+        """
+        Distributes the first votes: every ranking votes for its first number_of_votes_pr_voter candidates with
+        included_labels[label] == True (the others are skipped). The votes are in parcel 0.
+
+        Returns (number of ballots with fewer candidates than votes, blank votes of those ballots)
+        """
+        number_of_short_ballots = 0.0
+        number_of_blank_votes = 0.0
+
+        batch: List[Tuple[int, int, int]] = []
+        for ranking_id, ranking, count in self._iter_ranking_rows():
+            first_labels = [label for label in ranking if included_labels[label]][:number_of_votes_pr_voter]
+            batch.extend((ranking_id, label, 0) for label in first_labels)
+
+            if len(first_labels) < number_of_votes_pr_voter:
+                number_of_short_ballots += count
+                number_of_blank_votes += count * (number_of_votes_pr_voter - len(first_labels))
+
+            if len(batch) >= BATCH_SIZE:
+                self._insert_votes(batch)
+                batch = []
+        self._insert_votes(batch)
+
+        return number_of_short_ballots, number_of_blank_votes
+
+    def move_votes(
+        self,
+        label: int,
+        parcel: Optional[int],
+        get_new_label: Callable[[Tuple[int, ...]], Optional[int]],
+        new_parcel: int,
+    ) -> Dict[Optional[int], float]:
+        """
+        Moves the votes of the candidate (only the parcel if not None) to get_new_label(ranking), in parcel
+        new_parcel. Votes where get_new_label(..) returns None are exhausted and removed. The new label must
+        not be label.
+
+        Returns the number of ballots moved to each label (None for exhausted ballots).
+        """
+        condition, parameters = _get_pile_condition(label, parcel)
+        query = (
+            "SELECT votes.rowid, rankings.ranking, rankings.count FROM votes "
+            "JOIN rankings ON rankings.id = votes.ranking_id WHERE %s LIMIT ?" % condition
+        )
+
+        moved: Dict[Optional[int], float] = {}
+        while True:
+            # Moved votes leave the pile, so every batch starts from the beginning of the pile
+            rows = self._connection.execute(query, parameters + [BATCH_SIZE]).fetchall()
+            if len(rows) == 0:
+                return moved
+
+            updates = []
+            deletes = []
+            for rowid, ranking, count in rows:
+                new_label = get_new_label(_decode_ranking(ranking))
+                moved[new_label] = moved.get(new_label, 0.0) + count
+                if new_label is None:
+                    deletes.append((rowid,))
+                else:
+                    updates.append((new_label, new_parcel, rowid))
+
+            self._connection.executemany(
+                "UPDATE votes SET candidate = ?, parcel = ? WHERE rowid = ?", updates
+            )
+            self._connection.executemany("DELETE FROM votes WHERE rowid = ?", deletes)
+
+    def get_number_of_operations(self) -> int:
+        (number_of_operations,) = self._connection.execute("SELECT COUNT(*) FROM operations").fetchone()
+        return number_of_operations
+
+    def get_operation(self, number: int) -> Optional[Tuple[str, Optional[int], Optional[float], Dict]]:
+        """Returns (operation, candidate label, value, state after the operation) of a logged operation, or None"""
+        row = self._connection.execute(
+            "SELECT operation, candidate, value, state FROM operations WHERE number = ?", (number,)
+        ).fetchone()
+        if row is None:
+            return None
+        operation, label, value, state = row
+        return operation, label, value, json.loads(state)
+
+    def add_operation(
+        self, number: int, operation: str, label: Optional[int], value: Optional[float], state: Dict
+    ):
+        self._connection.execute(
+            "INSERT INTO operations (number, operation, candidate, value, state) VALUES (?, ?, ?, ?, ?)",
+            (number, operation, label, value, json.dumps(state)),
+        )
+
+    def reset_count(self):
+        """Removes the vote piles and the log of the count, so a new count can be started"""
+        with self.transaction():
+            self._connection.execute("DELETE FROM votes")
+            self._connection.execute("DELETE FROM operations")
+
+    # INTERNAL METHODS
+
+    def _add_encoded_rankings(self, batch: List[Tuple[bytes, Optional[int], float]]):
+        with self.transaction():
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO rankings (ranking, first_choice, count) VALUES (?, ?, 0)",
+                [(ranking, first_choice) for ranking, first_choice, _ in batch],
+            )
+            self._connection.executemany(
+                "UPDATE rankings SET count = count + ? WHERE ranking = ?",
+                [(count, ranking) for ranking, _, count in batch],
+            )
+
+    def _insert_votes(self, batch: List[Tuple[int, int, int]]):
+        self._connection.executemany(
+            "INSERT INTO votes (ranking_id, candidate, parcel) VALUES (?, ?, ?)", batch
+        )
+
+    def _iter_ranking_rows(self) -> Iterator[Tuple[int, Tuple[int, ...], float]]:
+        """Yields (id, ranking, number of ballots) of the rankings, ordered by id"""
+        last_id = -1
+        while True:
+            rows = self._connection.execute(
+                "SELECT id, ranking, count FROM rankings WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, BATCH_SIZE),
+            ).fetchall()
+            if len(rows) == 0:
+                return
+            for ranking_id, ranking, count in rows:
+                yield ranking_id, _decode_ranking(ranking), count
+            last_id = rows[-1][0]
+
+
+class SQLiteElectionManager(ElectionManager):
+    """
+    ElectionManager that counts the ballots in a SQLiteBallotStore. The vote piles are kept in the store,
+    and the counting rules are exactly the same as in ElectionManager, except that pick_random_if_blank and
+    audit_log are not supported, since they require every ballot to be handled by itself.
+
+    Candidates in the store must be in the list of candidates or in withdrawn_candidates (see
+    ElectionManager), otherwise KeyError is raised.
+
+    If the store already has a count, the logged operations are replayed instead of counted (see the
+    module docstring).
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        ballots: SQLiteBallotStore,
+        number_of_votes_pr_voter=1,
+        compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
+        pick_random_if_blank=False,
+        audit_log=None,
+        withdrawn_candidates: Iterable[Candidate] = (),
+    ):
+        if pick_random_if_blank:
+            raise ValueError("pick_random_if_blank is not supported when counting a SQLiteBallotStore")
+        if audit_log is not None:
+            raise ValueError("An audit log of single ballots is not supported when counting a SQLiteBallotStore")
+
+        self._store = ballots
+        self._number_of_ballots = ballots.get_number_of_ballots()
+        self._number_of_exhausted_ballots = 0.0
+        self._number_of_operations = 0
+        self._number_of_transfers = 0
+
+        # The parcel of the votes each candidate received last (see SurplusTransferMethod.LastParcel)
+        self._last_parcels: List[int] = [0] * len(ballots.candidates)
+        self._most_second_choices_cache: Dict[int, List[float]] = {}
+        self._candidate_labels: Dict[Candidate, int] = {
+            candidate: label for label, candidate in enumerate(ballots.candidates)
+        }
+
+        super().__init__(
+            candidates,
+            [],
+            number_of_votes_pr_voter=number_of_votes_pr_voter,
+            compare_method_if_equal=compare_method_if_equal,
+            pick_random_if_blank=pick_random_if_blank,
+            withdrawn_candidates=withdrawn_candidates,
+        )
+
+    # METHODS WITH SIDE-EFFECTS
+
+    def elect_candidate(self, candidate: Candidate):
+        super().elect_candidate(candidate)
+        self._most_second_choices_cache.clear()
+        self._run_operation("elect", self._candidate_labels[candidate], None, lambda: None)
+
+    def reject_candidate(self, candidate: Candidate):
+        super().reject_candidate(candidate)
+        self._most_second_choices_cache.clear()
+        self._run_operation("reject", self._candidate_labels[candidate], None, lambda: None)
+
+    def transfer_votes(
+        self, candidate: Candidate, number_of_trans_votes: float, last_parcel_only: bool = False
+    ):
+        if candidate not in self._candidate_vote_counts:
+            raise RuntimeError("Candidate not found in electionManager")
+        if round(number_of_trans_votes, 4) == 0.000:
+            # Do nothing
+            return
+
+        candidate_cv = self._candidate_vote_counts[candidate]
+        if candidate_cv.status == CandidateStatus.Hopeful:
+            raise RuntimeError(
+                "ElectionManager can not transfer votes from a candidate "
+                "that is still in the race (candidateStatus == Hopeful)"
+            )
+
+        label = self._candidate_labels[candidate]
+        operation = "transfer_last_parcel" if last_parcel_only else "transfer"
+        self._run_operation(
+            operation,
+            label,
+            number_of_trans_votes,
+            lambda: self._move_votes(candidate_cv, label, number_of_trans_votes, last_parcel_only),
+        )
+        self._sort_candidates_in_race()
+
+    # METHODS WITHOUT SIDE-EFFECTS
+
+    def get_number_of_non_exhausted_votes(self):
+        """Returns number of votes excluding blank and exhausted ballots"""
+        return self._number_of_ballots * self._number_of_votes_pr_voter - self._number_of_blank_votes
+
+    def get_number_of_non_exhausted_ballots(self):
+        """Returns number of ballots excluding blank and exhausted ballots"""
+        return self._number_of_ballots - self._number_of_exhausted_ballots
+
+    # INTERNAL METHODS
+
+    def _distribute_votes(self, candidates: List[Candidate]):
+        # None for withdrawn candidates
+        self._label_vote_counts: List[Optional[CandidateVoteCount]] = [
+            self._get_vote_count_or_none(candidate) for candidate in self._store.candidates
+        ]
+        included_labels = [candidate_vc is not None for candidate_vc in self._label_vote_counts]
+
+        settings = {
+            "included_labels": included_labels,
+            "number_of_votes_pr_voter": self._number_of_votes_pr_voter,
+        }
+        logged_operation = self._store.get_operation(0)
+        if logged_operation is not None and logged_operation[3]["settings"] != settings:
+            raise ValueError(
+                "The store has a count of other candidates or votes per voter (see reset_count())"
+            )
+
+        def distribute():
+            number_of_short_ballots, number_of_blank_votes = self._store.distribute_first_votes(
+                included_labels, self._number_of_votes_pr_voter
+            )
+            for label, number_of_ballots in self._store.get_label_tallies().items():
+                self._label_vote_counts[label].number_of_votes += number_of_ballots
+            self._number_of_exhausted_ballots += number_of_short_ballots
+            self._number_of_blank_votes += number_of_blank_votes
+
+        self._run_operation("distribute", None, None, distribute, settings)
+
+    def _move_votes(
+        self,
+        candidate_cv: CandidateVoteCount,
+        label: int,
+        number_of_trans_votes: float,
+        last_parcel_only: bool,
+    ):
+        """Transfers the votes like ElectionManager.transfer_votes(..), with the vote piles in the store"""
+        parcel = self._last_parcels[label] if last_parcel_only else None
+        voters = self._store.get_number_of_ballots_in_pile(label, parcel)
+        votes_pr_voter = self._get_transferred_votes_pr_voter(
+            candidate_cv, number_of_trans_votes, voters, last_parcel_only
+        )
+
+        self._number_of_transfers += 1
+        x = self._number_of_votes_pr_voter - 1
+        moved = self._store.move_votes(
+            label,
+            parcel,
+            lambda ranking: self._find_label_nr_x_in_race(ranking, x),
+            self._number_of_transfers,
+        )
+
+        transfers = self._get_transfer_matrix()
+        candidate_index = self._candidate_indexes[candidate_cv.candidate]
+        for new_label, number_of_ballots in moved.items():
+            if new_label is None:
+                # Blank or exhausted ballots
+                self._number_of_exhausted_ballots += number_of_ballots
+                self._number_of_blank_votes += number_of_ballots * votes_pr_voter
+                transfers.add_votes(candidate_index, None, number_of_ballots * votes_pr_voter)
+            else:
+                new_candidate_cv = self._label_vote_counts[new_label]
+                new_candidate_cv.number_of_votes += number_of_ballots * votes_pr_voter
+                transfers.add_votes(
+                    candidate_index,
+                    self._candidate_indexes[new_candidate_cv.candidate],
+                    number_of_ballots * votes_pr_voter,
+                )
+                # The received votes are the last parcel of the candidate
+                self._last_parcels[new_label] = self._number_of_transfers
+                new_candidate_cv.last_parcel_value = votes_pr_voter
+
+        candidate_cv.number_of_votes -= number_of_trans_votes
+
+    def _run_operation(
+        self,
+        operation: str,
+        label: Optional[int],
+        value: Optional[float],
+        run: Callable[[], None],
+        settings: Optional[Dict] = None,
+    ):
+        """
+        Runs a change of the count, and logs it with the vote numbers after it, in one transaction. Changes
+        that are already logged (by a count that was interrupted or has finished) are replayed from the log.
+        """
+        number = self._number_of_operations
+        self._number_of_operations += 1
+
+        logged_operation = self._store.get_operation(number)
+        if logged_operation is not None:
+            logged_name, logged_label, logged_value, state = logged_operation
+            if (logged_name, logged_label, logged_value) != (operation, label, value):
+                raise RuntimeError(
+                    "The count differs from the count in the store at operation %i (see reset_count())"
+                    % number
+                )
+            self._set_state(state)
+            return
+
+        with self._store.transaction():
+            run()
+            state = self._get_state()
+            if settings is not None:
+                state["settings"] = settings
+            self._store.add_operation(number, operation, label, value, state)
+
+    def _get_state(self) -> Dict:
+        """Returns the vote numbers of the count, which the log stores after every change"""
+        return {
+            "votes": [
+                None if candidate_vc is None else candidate_vc.number_of_votes
+                for candidate_vc in self._label_vote_counts
+            ],
+            "last_parcel_values": [
+                None if candidate_vc is None else candidate_vc.last_parcel_value
+                for candidate_vc in self._label_vote_counts
+            ],
+            "last_parcels": self._last_parcels,
+            "number_of_transfers": self._number_of_transfers,
+            "number_of_blank_votes": self._number_of_blank_votes,
+            "number_of_exhausted_ballots": self._number_of_exhausted_ballots,
+            "transfers": None if self._transfers is None else [
+                [from_index, row.tolist()] for from_index, row in sorted(self._transfers.rows.items())
+            ],
+        }
+
+    def _set_state(self, state: Dict):
+        for candidate_vc, number_of_votes, last_parcel_value in zip(
+            self._label_vote_counts, state["votes"], state["last_parcel_values"]
+        ):
+            if candidate_vc is not None:
+                candidate_vc.number_of_votes = number_of_votes
+                candidate_vc.last_parcel_value = last_parcel_value
+
+        self._last_parcels = state["last_parcels"]
+        self._number_of_transfers = state["number_of_transfers"]
+        self._number_of_blank_votes = state["number_of_blank_votes"]
+        self._number_of_exhausted_ballots = state["number_of_exhausted_ballots"]
+        if state["transfers"] is None:
+            self._transfers = None
+        else:
+            self._transfers = TransferMatrix(
+                list(self._candidate_indexes),
+                {from_index: array.array("d", row) for from_index, row in state["transfers"]},
+            )
+
+    def _is_label_in_race(self, label: int) -> bool:
+        candidate_vc = self._label_vote_counts[label]
+        return candidate_vc is not None and candidate_vc.is_in_race
+
+    def _find_label_nr_x_in_race(self, ranking: Sequence[int], x: int) -> Optional[int]:
+        """Returns the x-th candidate in race (zero indexed) on the ranking, or None"""
+        number_in_race = 0
+        for label in ranking:
+            if self._is_label_in_race(label):
+                if number_in_race == x:
+                    return label
+                number_in_race += 1
+        return None
+
+    def _get_most_second_choices_votes(self, x: int) -> List[float]:
+        """Returns the number of ballots that has each candidate as x-th choice of candidates in race"""
+        if x in self._most_second_choices_cache:
+            return self._most_second_choices_cache[x]
+
+        votes = [0.0] * len(self._label_vote_counts)
+        for ranking, count in self._store.iter_rankings():
+            label = self._find_label_nr_x_in_race(ranking, x)
+            if label is not None:
+                votes[label] += count
+
+        self._most_second_choices_cache[x] = votes
+        return votes
+
+    def _candidate1_has_most_second_choices(
+        self,
+        candidate1_vc: CandidateVoteCount,
+        candidate2_vc: CandidateVoteCount,
+        x: int,
+    ) -> bool:
+        if x >= self._number_of_candidates:
+            return self._candidate1_wins_final_tie_break(candidate1_vc, candidate2_vc)
+
+        votes = self._get_most_second_choices_votes(x)
+        label1 = self._candidate_labels.get(candidate1_vc.candidate)
+        label2 = self._candidate_labels.get(candidate2_vc.candidate)
+        votes_candidate1 = votes[label1] if label1 is not None else 0.0
+        votes_candidate2 = votes[label2] if label2 is not None else 0.0
+
+        if votes_candidate1 == votes_candidate2:
+            return self._candidate1_has_most_second_choices(
+                candidate1_vc, candidate2_vc, x + 1
+            )
+        else:
+            return votes_candidate1 > votes_candidate2
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._connection.execute("COMMIT")
+        else:
+            self._connection.execute("ROLLBACK")
+
+
+# INTERNAL FUNCTIONS
+
+
+def _encode_ranking(ranking: Sequence[int]) -> bytes:
+    return array.array(RANKING_TYPECODE, ranking).tobytes()
+
+
+def _decode_ranking(ranking: bytes) -> Tuple[int, ...]:
+    labels = array.array(RANKING_TYPECODE)
+    labels.frombytes(ranking)
+    return tuple(labels)
+
+
+def _get_pile_condition(label: int, parcel: Optional[int]) -> Tuple[str, List]:
+    if parcel is None:
+        return "votes.candidate = ?", [label]
+    return "votes.candidate = ? AND votes.parcel = ?", [label, parcel]
@@ -0,0 +1,361 @@
+"""
+Counting ballots that are streamed from disk in every round
+
+Instant runoff voting and preferential block voting only transfer all the votes of rejected candidates,
+so where the votes of a ballot are in a round only depends on its ranking and the candidates rejected
+before. A BallotStream is a ballot source that can be read again and again (like a file), and
+StreamingElectionManager keeps only the number of votes of each candidate in memory. It reads the
+ballots once to distribute the first votes, and once more after every round of transfers, where each
+ballot is followed through all the transfers so far. The transfers of all candidates rejected in a round
+are counted in the same pass, and ties broken by most second choice votes need at most one pass after
+every change of the candidates in race.
+
+> stream = BallotStream.from_file("election.blt")
+> election_result = pyrankvote.instant_runoff_voting(stream.candidates, stream)
+
+The ballots are never stored, so counts can be much larger than the memory, as long as each pass can
+read the source sequentially: a BLT file, an encoded ballots file (which is memory-mapped), or any
+function that returns a new iterator of the rankings.
+"""
+
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pyrankvote.encoded_ballots import EncodedBallots
+from pyrankvote.helpers import (
+    CandidateStatus,
+    CandidateVoteCount,
+    CompareMethodIfEqual,
+    ElectionManager,
+    RoundResult,
+    almost_equal,
+)
+from pyrankvote.models import Candidate, Ballot
+
+
+class BallotStream:
+    """
+    A source of ballots that is read from the beginning every time iter_rankings() is called.
+    open_rankings() must return a new iterable of (ranking, number of ballots) every time it is called, with
+    rankings as candidate indexes (the index in BallotStream.candidates). Equal rankings do not need to be
+    added up.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        open_rankings: Callable[[], Iterable[Tuple[Sequence[int], float]]],
+        metadata: Optional[Dict] = None,
+    ):
+        self.candidates: List[Candidate] = list(candidates)
+        self.metadata: Dict = metadata or {}
+        self._open_rankings = open_rankings
+
+    @classmethod
+    def from_ballot_factory(
+        cls, candidates: List[Candidate], open_ballots: Callable[[], Iterable[Ballot]]
+    ) -> "BallotStream":
+        """Streams the ballots returned by open_ballots(), which must return a new iterable of ballots every time"""
+        labels = {candidate: label for label, candidate in enumerate(candidates)}
+
+        def open_rankings():
+            for ballot in open_ballots():
+                yield [labels[candidate] for candidate in ballot.ranked_candidates], 1
+
+        return cls(candidates, open_rankings)
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "BallotStream":
+        """
+        Streams a BLT file (.blt) or an encoded ballots file (saved with EncodedBallots.save(..)). The candidates
+        and metadata of a BLT file are at the end of the file, so the file is read once to get them.
+        """
+        # The loaders build on BallotProfile, so they can only be imported here
+        from pyrankvote import loaders
+
+        if os.path.splitext(file_path)[1].lower() == ".blt":
+            candidates, metadata = loaders.read_blt_candidates(file_path)
+            return cls(candidates, lambda: loaders.iter_blt_rankings(file_path), metadata)
+
+        # The arrays are memory-mapped, so the rankings are read from the file in every pass
+        encoded_ballots = EncodedBallots.load(file_path, use_mmap=True)
+        return cls(encoded_ballots.candidates, encoded_ballots.iter_rankings, encoded_ballots.metadata)
+
+    def __repr__(self) -> str:
+        return "<BallotStream(%i candidates)>" % len(self.candidates)
+
+    def iter_rankings(self) -> Iterator[Tuple[Sequence[int], float]]:
+        for ranking, count in self._open_rankings():
+            yield ranking, count
+
+
+class StreamingElectionManager(ElectionManager):
+    """
+    ElectionManager that reads the ballots from a BallotStream in every round, instead of keeping vote piles.
+    The counting rules are exactly the same as in ElectionManager, but only transfers of all the votes of
+    a candidate are supported (as in instant runoff voting and preferential block voting, but not the
+    surplus transfers of single transferable vote). pick_random_if_blank and audit_log are not supported,
+    since they require every ballot to be handled by itself.
+
+    Transfers are counted when the votes are needed, so all the transfers of a round are counted in one
+    pass over the ballots. Candidates in the stream must be in the list of candidates or in
+    withdrawn_candidates (see ElectionManager), otherwise KeyError is raised.
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        ballots: BallotStream,
+        number_of_votes_pr_voter=1,
+        compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes,
+        pick_random_if_blank=False,
+        audit_log=None,
+        withdrawn_candidates: Iterable[Candidate] = (),
+    ):
+        if pick_random_if_blank:
+            raise ValueError("pick_random_if_blank is not supported when counting a BallotStream")
+        if audit_log is not None:
+            raise ValueError("An audit log of single ballots is not supported when counting a BallotStream")
+
+        self._stream = ballots
+        self._candidate_labels: Dict[Candidate, int] = {
+            candidate: label for label, candidate in enumerate(ballots.candidates)
+        }
+        self._number_of_ballots = 0.0
+        self._number_of_exhausted_ballots = 0.0
+
+        # Every transfer so far: (label of the rejected candidate, which labels were in race at the time)
+        self._transfer_log: List[Tuple[int, List[bool]]] = []
+        self._number_of_counted_transfers = 0
+        self._most_second_choices_votes: Optional[List[List[float]]] = None
+
+        super().__init__(
+            candidates,
+            [],
+            number_of_votes_pr_voter=number_of_votes_pr_voter,
+            compare_method_if_equal=compare_method_if_equal,
+            pick_random_if_blank=pick_random_if_blank,
+            withdrawn_candidates=withdrawn_candidates,
+        )
+
+    def __repr__(self) -> str:
+        self._count_transfers()
+        return super().__repr__()
+
+    # METHODS WITH SIDE-EFFECTS
+
+    def elect_candidate(self, candidate: Candidate):
+        self._count_transfers()
+        super().elect_candidate(candidate)
+        self._most_second_choices_votes = None
+
+    def reject_candidate(self, candidate: Candidate):
+        self._count_transfers()
+        super().reject_candidate(candidate)
+        self._most_second_choices_votes = None
+
+    def transfer_votes(
+        self, candidate: Candidate, number_of_trans_votes: float, last_parcel_only: bool = False
+    ):
+        if candidate not in self._candidate_vote_counts:
+            raise RuntimeError("Candidate not found in electionManager")
+        if round(number_of_trans_votes, 4) == 0.000:
+            # Do nothing
+            return
+
+        candidate_cv = self._candidate_vote_counts[candidate]
+        if candidate_cv.status == CandidateStatus.Hopeful:
+            raise RuntimeError(
+                "ElectionManager can not transfer votes from a candidate "
+                "that is still in the race (candidateStatus == Hopeful)"
+            )
+        # Candidates that are not in race never receive votes, so the number of votes is already counted
+        if last_parcel_only or not almost_equal(number_of_trans_votes, candidate_cv.number_of_votes):
+            raise ValueError(
+                "Only transfers of all the votes of a candidate are supported when counting a BallotStream"
+            )
+
+        in_race_labels = [self._is_label_in_race(label) for label in self._get_labels()]
+        self._transfer_log.append((self._candidate_labels[candidate], in_race_labels))
+
+    # METHODS WITHOUT SIDE-EFFECTS
+
+    def get_number_of_non_exhausted_votes(self):
+        """Returns number of votes excluding blank and exhausted ballots"""
+        self._count_transfers()
+        return self._number_of_ballots * self._number_of_votes_pr_voter - self._number_of_blank_votes
+
+    def get_number_of_non_exhausted_ballots(self):
+        """Returns number of ballots excluding blank and exhausted ballots"""
+        self._count_transfers()
+        return self._number_of_ballots - self._number_of_exhausted_ballots
+
+    def get_number_of_votes(self, candidate: Candidate) -> float:
+        self._count_transfers()
+        return super().get_number_of_votes(candidate)
+
+    def get_candidates_in_race(self) -> List[Candidate]:
+        self._count_transfers()
+        return super().get_candidates_in_race()
+
+    def get_candidate_with_least_votes_in_race(self) -> Candidate:
+        self._count_transfers()
+        return super().get_candidate_with_least_votes_in_race()
+
+    def get_candidates_with_more_than_x_votes(self, x: int) -> List[Candidate]:
+        self._count_transfers()
+        return super().get_candidates_with_more_than_x_votes(x)
+
+    def get_results(self) -> RoundResult:
+        self._count_transfers()
+        return super().get_results()
+
+    # INTERNAL METHODS
+
+    def _get_labels(self) -> range:
+        return range(len(self._stream.candidates))
+
+    def _distribute_votes(self, candidates: List[Candidate]):
+        # None for withdrawn candidates
+        self._label_vote_counts: List[Optional[CandidateVoteCount]] = [
+            self._get_vote_count_or_none(candidate) for candidate in self._stream.candidates
+        ]
+        self._included_labels = [candidate_vc is not None for candidate_vc in self._label_vote_counts]
+        self._count_ballots()
+
+    def _count_transfers(self):
+        """Counts the transfers that are not yet counted (with one pass over the ballots)"""
+        if self._number_of_counted_transfers < len(self._transfer_log):
+            self._count_ballots()
+            self._sort_candidates_in_race()
+
+    def _count_ballots(self):
+        """
+        Reads the ballots, and sets the votes of every candidate to the number of ballots that vote for it
+        after all the transfers in the transfer log
+        """
+        number_of_votes_pr_voter = self._number_of_votes_pr_voter
+        x = number_of_votes_pr_voter - 1
+        included_labels = self._included_labels
+        transfer_log = self._transfer_log
+        first_new_transfer = self._number_of_counted_transfers
+
+        label_votes = [0.0] * len(included_labels)
+        number_of_ballots = 0.0
+        number_of_blank_votes = 0.0
+        number_of_exhausted_ballots = 0.0
+
+        # Ballots moved to each label (None for exhausted ballots) in each transfer that is not yet counted
+        moved_ballots: List[Dict[Optional[int], float]] = [{} for _ in transfer_log[first_new_transfer:]]
+
+        for ranking, count in self._stream.iter_rankings():
+            number_of_ballots += count
+
+            # The first votes
+            voted_labels = []
+            for label in ranking:
+                if included_labels[label]:
+                    voted_labels.append(label)
+                    if len(voted_labels) == number_of_votes_pr_voter:
+                        break
+            number_of_exhaustions = 1 if len(voted_labels) < number_of_votes_pr_voter else 0
+
+            # Follow the ballot through the transfers, like ElectionManager moves it between vote piles
+            for i, (transferred_label, in_race_labels) in enumerate(transfer_log):
+                if transferred_label not in voted_labels:
+                    continue
+
+                new_voted_labels = []
+                for label in voted_labels:
+                    if label != transferred_label:
+                        new_voted_labels.append(label)
+                        continue
+
+                    new_label = _find_label_nr_x_in_race(ranking, in_race_labels, x)
+                    if new_label is None:
+                        number_of_exhaustions += 1
+                    else:
+                        new_voted_labels.append(new_label)
+                    if i >= first_new_transfer:
+                        moved = moved_ballots[i - first_new_transfer]
+                        moved[new_label] = moved.get(new_label, 0.0) + count
+                voted_labels = new_voted_labels
+
+            for label in voted_labels:
+                label_votes[label] += count
+            number_of_blank_votes += count * (number_of_votes_pr_voter - len(voted_labels))
+            number_of_exhausted_ballots += count * number_of_exhaustions
+
+        for candidate_vc, number_of_votes in zip(self._label_vote_counts, label_votes):
+            if candidate_vc is not None:
+                candidate_vc.number_of_votes = number_of_votes
+        self._number_of_ballots = number_of_ballots
+        self._number_of_blank_votes = number_of_blank_votes
+        self._number_of_exhausted_ballots = number_of_exhausted_ballots
+
+        candidates = self._stream.candidates
+        for (transferred_label, _), moved in zip(transfer_log[first_new_transfer:], moved_ballots):
+            transfers = self._get_transfer_matrix()
+            from_index = self._candidate_indexes[candidates[transferred_label]]
+            for new_label, number_of_votes in moved.items():
+                to_index = None if new_label is None else self._candidate_indexes[candidates[new_label]]
+                transfers.add_votes(from_index, to_index, number_of_votes)
+        self._number_of_counted_transfers = len(transfer_log)
+
+    def _is_label_in_race(self, label: int) -> bool:
+        candidate_vc = self._label_vote_counts[label]
+        return candidate_vc is not None and candidate_vc.is_in_race
+
+    def _get_most_second_choices_votes(self, x: int) -> List[float]:
+        """Returns the number of ballots that has each candidate as x-th choice of candidates in race"""
+        if self._most_second_choices_votes is None:
+            # Every choice is counted in the same pass
+            in_race_labels = [self._is_label_in_race(label) for label in self._get_labels()]
+            votes = [[0.0] * len(in_race_labels) for _ in in_race_labels]
+            for ranking, count in self._stream.iter_rankings():
+                number_in_race = 0
+                for label in ranking:
+                    if in_race_labels[label]:
+                        votes[number_in_race][label] += count
+                        number_in_race += 1
+            self._most_second_choices_votes = votes
+
+        if x >= len(self._most_second_choices_votes):
+            return [0.0] * len(self._label_vote_counts)
+        return self._most_second_choices_votes[x]
+
+    def _candidate1_has_most_second_choices(
+        self,
+        candidate1_vc: CandidateVoteCount,
+        candidate2_vc: CandidateVoteCount,
+        x: int,
+    ) -> bool:
+        if x >= self._number_of_candidates:
+            return self._candidate1_wins_final_tie_break(candidate1_vc, candidate2_vc)
+
+        votes = self._get_most_second_choices_votes(x)
+        label1 = self._candidate_labels.get(candidate1_vc.candidate)
+        label2 = self._candidate_labels.get(candidate2_vc.candidate)
+        votes_candidate1 = votes[label1] if label1 is not None else 0.0
+        votes_candidate2 = votes[label2] if label2 is not None else 0.0
+
+        if votes_candidate1 == votes_candidate2:
+            return self._candidate1_has_most_second_choices(
+                candidate1_vc, candidate2_vc, x + 1
+            )
+        else:
+            return votes_candidate1 > votes_candidate2
+
+
+# INTERNAL FUNCTIONS
+
+
+def _find_label_nr_x_in_race(ranking: Sequence[int], in_race_labels: List[bool], x: int) -> Optional[int]:
+    """Returns the x-th candidate in race (zero indexed) on the ranking, or None"""
+    number_in_race = 0
+    for label in ranking:
+        if in_race_labels[label]:
+            if number_in_race == x:
+                return label
+            number_in_race += 1
+    return None
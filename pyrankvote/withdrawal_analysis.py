@@ -0,0 +1,168 @@
+"""
+What-if analysis of candidate withdrawals
+
+Answers "what would the result have been if candidate X had withdrawn?" without rewriting the ballots.
+The ballots are encoded once in a BallotTrie that is shared by all the counts, and withdrawn candidates
+are given to the ranking method as withdrawn_candidates, so the counting skips them on every ballot.
+
+> analysis = WithdrawalAnalysis(candidates, ballots)
+> results = analysis.count_single_withdrawals(jobs=4)
+> results[nader].get_winners()
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pyrankvote import multiple_seat_ranking_methods, single_seat_ranking_methods
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.encoded_ballots import get_ballot_trie
+from pyrankvote.helpers import CandidateStatus, ElectionResults, RoundResult
+from pyrankvote.models import Candidate
+from pyrankvote.parallel import map_with_shared_state
+
+
+class WithdrawalAnalysis:
+    """
+    Counts the same election with different sets of withdrawn candidates.
+
+    method is one of the ranking methods, and kwargs are passed on to it (like number_of_seats).
+    """
+
+    def __init__(
+        self,
+        candidates: List[Candidate],
+        ballots,
+        method: Callable[..., ElectionResults] = single_seat_ranking_methods.instant_runoff_voting,
+        **kwargs
+    ):
+        self.candidates: List[Candidate] = list(candidates)
+        self.method = method
+        self.kwargs = kwargs
+
+        self._trie: BallotTrie = get_ballot_trie(candidates, ballots)
+        self._base_results: Optional[ElectionResults] = None
+
+    def __repr__(self) -> str:
+        return "<WithdrawalAnalysis(%s, %i candidates)>" % (
+            self.method.__name__,
+            len(self.candidates),
+        )
+
+    def get_base_results(self) -> ElectionResults:
+        """Returns the results without any withdrawn candidates"""
+        if self._base_results is None:
+            self._base_results = self.method(self.candidates, self._trie, **self.kwargs)
+        return self._base_results
+
+    def count_without(self, withdrawn_candidates: Iterable[Candidate]) -> ElectionResults:
+        """Returns the results if the withdrawn candidates had not been on the ballots"""
+        withdrawn_candidates = list(withdrawn_candidates)
+        if len(withdrawn_candidates) == 0:
+            return self.get_base_results()
+
+        if len(withdrawn_candidates) == 1 and self._can_reuse_base_rounds():
+            election_results = self._reuse_base_rounds(withdrawn_candidates[0])
+            if election_results is not None:
+                return election_results
+
+        return _count_without(
+            (self.method, self.candidates, self._trie, self.kwargs), withdrawn_candidates
+        )
+
+    def count_single_withdrawals(
+        self, candidates: Optional[List[Candidate]] = None, jobs: Optional[int] = 1
+    ) -> Dict[Candidate, ElectionResults]:
+        """
+        Returns the results for every single candidate withdrawal, as a dict from the withdrawn candidate
+        to the results. The counts are run by jobs worker processes (see parallel.map_with_shared_state).
+        """
+        if candidates is None:
+            candidates = self.candidates
+
+        results: Dict[Candidate, ElectionResults] = {}
+        candidates_to_count = []
+        for candidate in candidates:
+            election_results = None
+            if self._can_reuse_base_rounds():
+                election_results = self._reuse_base_rounds(candidate)
+
+            if election_results is not None:
+                results[candidate] = election_results
+            else:
+                candidates_to_count.append(candidate)
+
+        counted_results = map_with_shared_state(
+            _count_without,
+            (self.method, self.candidates, self._trie, self.kwargs),
+            [[candidate] for candidate in candidates_to_count],
+            jobs=jobs,
+        )
+        results.update(zip(candidates_to_count, counted_results))
+
+        return {candidate: results[candidate] for candidate in candidates}
+
+    # INTERNAL METHODS
+
+    def _can_reuse_base_rounds(self) -> bool:
+        """
+        Base rounds can only be reused for instant runoff voting (and preferential block voting with one
+        seat), where the majority limit is recalculated every round. STV uses a quota calculated before
+        the first round, and with more than one vote per voter, a ballot with a withdrawn candidate is not
+        counted the same way as the rewritten ballot would be.
+        """
+        if self.method is single_seat_ranking_methods.instant_runoff_voting:
+            return True
+        return (
+            self.method is multiple_seat_ranking_methods.preferential_block_voting
+            and self.kwargs.get("number_of_seats") == 1
+        )
+
+    def _reuse_base_rounds(self, withdrawn_candidate: Candidate) -> Optional[ElectionResults]:
+        """
+        If the withdrawn candidate is the only candidate that is rejected in the first round of the base
+        count, and no candidates are elected, the votes are transferred as if the candidate had not been on
+        the ballots. The rest of the base count is then the same as the count without the candidate.
+
+        Returns None if the base rounds can not be reused.
+        """
+        base_rounds = self.get_base_results().rounds
+        if len(base_rounds) < 2:
+            return None
+
+        first_round_statuses = {
+            candidate: status for candidate, _, status in base_rounds[0].candidate_results
+        }
+        rejected_candidates = [
+            candidate
+            for candidate, status in first_round_statuses.items()
+            if status == CandidateStatus.Rejected
+        ]
+        if rejected_candidates != [withdrawn_candidate]:
+            return None
+        if CandidateStatus.Elected in first_round_statuses.values():
+            return None
+
+        election_results = ElectionResults()
+        for i, round_ in enumerate(base_rounds[1:]):
+            candidate_results = [
+                candidate_result
+                for candidate_result in round_.candidate_results
+                if candidate_result.candidate != withdrawn_candidate
+            ]
+            # The votes of the withdrawn candidate are transferred before the first round of the count
+            # without the candidate, and later transfers never involve the candidate
+            transfers = round_.transfers if i > 0 else None
+            election_results.register_round_results(
+                RoundResult(candidate_results, round_.number_of_blank_votes, transfers)
+            )
+        return election_results
+
+
+def _count_without(count_state, withdrawn_candidates: List[Candidate]) -> ElectionResults:
+    method, candidates, trie, kwargs = count_state
+    remaining_candidates = [
+        candidate for candidate in candidates if candidate not in withdrawn_candidates
+    ]
+    kwargs = dict(
+        kwargs, withdrawn_candidates=list(kwargs.get("withdrawn_candidates", ())) + list(withdrawn_candidates)
+    )
+    return method(remaining_candidates, trie, **kwargs)
@@ -32,6 +32,11 @@ setuptools.setup(
         "tabulate",
     ],
     packages=setuptools.find_packages(exclude=["tests", "test_data"]),
+    entry_points={
+        "console_scripts": [
+            "pyrankvote=pyrankvote.command_line:main",
+        ],
+    },
     test_suite="setup.my_test_suite",
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -0,0 +1,152 @@
+import os
+import random
+import tempfile
+import unittest
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, BallotTrie
+from pyrankvote.audit_log import AuditLog, AuditLogReader, AuditRecord
+from pyrankvote.helpers import SurplusTransferMethod
+
+
+class TestAuditLog(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "count.prvaud")
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_ballot_path(self):
+        per = Candidate("Per")
+        paal = Candidate("Pål")
+        askeladden = Candidate("Askeladden")
+        candidates = [per, paal, askeladden]
+
+        ballots = [
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, askeladden]),
+            Ballot(ranked_candidates=[per]),
+            Ballot(ranked_candidates=[paal]),
+            Ballot(ranked_candidates=[askeladden, paal]),
+        ]
+
+        with AuditLog(self.file_path) as audit_log:
+            pyrankvote.single_transferable_vote(candidates, ballots, number_of_seats=2, audit_log=audit_log)
+
+        reader = AuditLogReader(self.file_path, candidates)
+        self.assertListEqual(candidates, reader.candidates)
+
+        # Per is elected in the first round, and the 2 excess votes of Per are transferred
+        self.assertListEqual(
+            [AuditRecord(0, 2, None, per, 1.0), AuditRecord(1, 2, per, askeladden, 0.5)],
+            reader.get_ballot_path(2),
+        )
+        self.assertListEqual(
+            [AuditRecord(0, 3, None, per, 1.0), AuditRecord(1, 3, per, None, 0.5)],
+            reader.get_ballot_path(3),
+        )
+        self.assertListEqual([AuditRecord(0, 4, None, paal, 1.0)], reader.get_ballot_path(4))
+
+    def test_repeated_ballot_objects(self):
+        a, b, c = Candidate("A"), Candidate("B"), Candidate("C")
+        candidates = [a, b, c]
+        ballots = [Ballot(ranked_candidates=[c, a])] * 2 + [Ballot(ranked_candidates=[a])] * 3 + [
+            Ballot(ranked_candidates=[b])
+        ] * 4
+
+        with AuditLog(self.file_path) as audit_log:
+            pyrankvote.instant_runoff_voting(candidates, ballots, audit_log=audit_log)
+
+        # C is rejected first, and each of the two equal ballot objects is transferred to A once
+        reader = AuditLogReader(self.file_path, candidates)
+        for ballot_index in [0, 1]:
+            self.assertListEqual(
+                [AuditRecord(0, ballot_index, None, c, 1.0), AuditRecord(1, ballot_index, c, a, 1.0)],
+                reader.get_ballot_path(ballot_index),
+            )
+
+    def test_log_adds_up_to_transfers(self):
+        rng = random.Random(3)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+            for _ in range(500)
+        ]
+
+        for use_thread in [True, False]:
+            with AuditLog(self.file_path, buffer_size=256, use_thread=use_thread) as audit_log:
+                election_result = pyrankvote.preferential_block_voting(
+                    candidates, ballots, number_of_seats=2, audit_log=audit_log
+                )
+
+            reader = AuditLogReader(self.file_path)
+            transferred_votes = {}
+            for record in reader:
+                key = (record.round, record.from_candidate, record.to_candidate)
+                transferred_votes[key] = transferred_votes.get(key, 0.0) + record.weight
+
+            for round_number, round_ in enumerate(election_result.rounds):
+                if round_.transfers is None:
+                    continue
+                for i, from_candidate in enumerate(candidates):
+                    for to_candidate in candidates + [None]:
+                        from_name = reader.candidates[i]
+                        to_name = None if to_candidate is None else reader.candidates[candidates.index(to_candidate)]
+                        self.assertAlmostEqual(
+                            round_.transfers.get_number_of_votes(from_candidate, to_candidate),
+                            transferred_votes.get((round_number, from_name, to_name), 0.0),
+                        )
+
+            # Every ballot gets 2 votes in the first distribution, as candidates or blank votes
+            first_round_records = [record for record in reader if record.round == 0]
+            self.assertEqual(2 * len(ballots), len(first_round_records))
+
+            paths = reader.get_ballot_paths(range(len(ballots)))
+            for ballot_index, path in paths.items():
+                self.assertListEqual(path, reader.get_ballot_path(ballot_index))
+
+    def test_trie_is_not_supported(self):
+        candidates = [Candidate("A"), Candidate("B")]
+        ballots = [Ballot(ranked_candidates=candidates)]
+        with AuditLog(self.file_path) as audit_log:
+            self.assertRaises(
+                ValueError,
+                pyrankvote.instant_runoff_voting,
+                candidates,
+                BallotTrie.from_ballots(candidates, ballots),
+                audit_log=audit_log,
+            )
+
+    def test_non_transferable_last_parcel_surplus(self):
+        a, b, c, d, e, f = [Candidate(name) for name in "ABCDEF"]
+        candidates = [a, b, c, d, e, f]
+        ballots = (
+            [Ballot(ranked_candidates=[d, a, c])] * 12
+            + [Ballot(ranked_candidates=[e, a, c])] * 10
+            + [Ballot(ranked_candidates=[a, b])] * 9
+            + [Ballot(ranked_candidates=[b])] * 6
+            + [Ballot(ranked_candidates=[c])] * 5
+            + [Ballot(ranked_candidates=[f])] * 5
+        )
+
+        with AuditLog(self.file_path) as audit_log:
+            election_result = pyrankvote.single_transferable_vote(
+                candidates,
+                ballots,
+                number_of_seats=4,
+                surplus_transfer_method=SurplusTransferMethod.LastParcel,
+                audit_log=audit_log,
+            )
+
+        # A's surplus is 2.8 votes, but only 0.06 votes of each of E's 10 ballots are transferable
+        reader = AuditLogReader(self.file_path, candidates)
+        records = [record for record in reader if record.round == 2 and record.from_candidate == a]
+        self.assertEqual(20, len(records))
+        self.assertAlmostEqual(0.6, sum(record.weight for record in records if record.to_candidate == c))
+        self.assertAlmostEqual(2.2, sum(record.weight for record in records if record.to_candidate is None))
+        self.assertAlmostEqual(
+            election_result.rounds[2].transfers.get_number_of_votes(a, None),
+            sum(record.weight for record in records if record.to_candidate is None),
+        )
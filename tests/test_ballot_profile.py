@@ -0,0 +1,110 @@
+import random
+import unittest
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, BallotProfile, BallotTrie, EncodedBallots
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+class TestBallotProfile(unittest.TestCase):
+    def test_same_results_as_ballots(self):
+        rng = random.Random(4)
+
+        for _ in range(10):
+            candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+            ballots = [
+                Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+                for _ in range(300)
+            ]
+            profile = BallotProfile(candidates, ballots)
+
+            for method, kwargs in [
+                (pyrankvote.instant_runoff_voting, {}),
+                (pyrankvote.preferential_block_voting, {"number_of_seats": 2}),
+                (pyrankvote.single_transferable_vote, {"number_of_seats": 2}),
+            ]:
+                correct_results = method(candidates, ballots, **kwargs)
+                # The second count uses the cached first votes
+                for _ in range(2):
+                    results = method(candidates, profile, **kwargs)
+                    self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+
+            # Withdrawn candidates are skipped on every ballot, and other missing candidates raise KeyError
+            remaining_candidates = candidates[1:]
+            rewritten_ballots = [
+                Ballot(ranked_candidates=[c for c in ballot.ranked_candidates if c != candidates[0]])
+                for ballot in ballots
+            ]
+            self.assertListEqual(
+                get_round_results(pyrankvote.instant_runoff_voting(remaining_candidates, rewritten_ballots)),
+                get_round_results(
+                    pyrankvote.instant_runoff_voting(
+                        remaining_candidates, profile, withdrawn_candidates=[candidates[0]]
+                    )
+                ),
+            )
+            self.assertRaises(KeyError, pyrankvote.instant_runoff_voting, remaining_candidates, profile)
+
+    def test_candidate_order_of_wrapped_ballots(self):
+        a, b, c = Candidate("A"), Candidate("B"), Candidate("C")
+        ballots = [
+            Ballot(ranked_candidates=[a]),
+            Ballot(ranked_candidates=[a]),
+            Ballot(ranked_candidates=[b]),
+            Ballot(ranked_candidates=[b]),
+            Ballot(ranked_candidates=[c, a]),
+            Ballot(ranked_candidates=[c, a]),
+            Ballot(ranked_candidates=[c]),
+        ]
+        correct_results = pyrankvote.instant_runoff_voting([a, b, c], ballots)
+
+        # The profile has another candidate order than the encoded ballots, and A and B are only separated
+        # by the most second choice votes
+        encoded_ballots = EncodedBallots.from_ballots([a, b, c], ballots)
+        for _ in range(20):
+            profile = BallotProfile([c, b, a], encoded_ballots)
+            results = pyrankvote.instant_runoff_voting([a, b, c], profile)
+            self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+
+    def test_preprocessing_is_cached(self):
+        per = Candidate("Per")
+        paal = Candidate("Pål")
+        askeladden = Candidate("Askeladden")
+        candidates = [per, paal, askeladden]
+
+        ballots = [
+            Ballot(ranked_candidates=[askeladden, per]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[paal, per]),
+            Ballot(ranked_candidates=[paal, per, askeladden]),
+        ]
+        profile = BallotProfile(candidates, ballots)
+
+        with mock.patch.object(EncodedBallots, "from_ballots", wraps=EncodedBallots.from_ballots) as from_ballots:
+            pyrankvote.instant_runoff_voting(candidates, profile)
+            pyrankvote.single_transferable_vote(candidates, profile, number_of_seats=2)
+            self.assertEqual(1, from_ballots.call_count)
+
+        with mock.patch.object(BallotTrie, "get_first_votes", wraps=profile.get_trie().get_first_votes) as first_votes:
+            pyrankvote.instant_runoff_voting(candidates, profile)
+            pyrankvote.preferential_block_voting(candidates, profile, number_of_seats=2)
+            pyrankvote.preferential_block_voting(candidates, profile, number_of_seats=2)
+            self.assertEqual(1, first_votes.call_count, "Only the first votes with 2 votes per voter are new")
+
+        self.assertEqual(5, profile.get_number_of_ballots())
+        self.assertDictEqual({per: 2, paal: 2, askeladden: 1}, profile.get_first_preference_tallies())
+        self.assertListEqual(
+            [{per: 2, paal: 2, askeladden: 1}, {per: 3, paal: 2, askeladden: 0}, {per: 0, paal: 0, askeladden: 1}],
+            profile.get_positional_counts(),
+        )
@@ -0,0 +1,97 @@
+import unittest
+import random
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, BallotTrie
+from pyrankvote.test_helpers import assert_list_almost_equal
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+class TestBallotTrie(unittest.TestCase):
+    def test_shared_prefixes(self):
+        per = Candidate("Per")
+        paal = Candidate("Pål")
+        askeladden = Candidate("Askeladden")
+
+        candidates = [per, paal, askeladden]
+
+        ballots = [
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal, askeladden]),
+            Ballot(ranked_candidates=[per]),
+            Ballot(ranked_candidates=[]),
+        ]
+
+        trie = BallotTrie.from_ballots(candidates, ballots)
+
+        self.assertEqual(5, trie.get_number_of_ballots())
+        self.assertEqual(4, trie.get_number_of_nodes(), "Root, per, per-paal and per-paal-askeladden")
+
+        rankings = dict(trie.iter_rankings())
+        self.assertDictEqual({(): 1, (0,): 1, (0, 1): 2, (0, 1, 2): 1}, rankings)
+
+
+class TestTrieElectionManager(unittest.TestCase):
+    def test_irv(self):
+        bush = Candidate("George W. Bush (Republican)")
+        gore = Candidate("Al Gore (Democratic)")
+        nader = Candidate("Ralph Nader (Green)")
+
+        candidates = [bush, gore, nader]
+
+        ballots = [
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[nader, gore, bush]),
+            Ballot(ranked_candidates=[nader, gore]),
+            Ballot(ranked_candidates=[gore, nader, bush]),
+            Ballot(ranked_candidates=[gore, nader]),
+            Ballot(ranked_candidates=[gore, nader]),
+        ]
+
+        trie = BallotTrie.from_ballots(candidates, ballots)
+        election_result = pyrankvote.instant_runoff_voting(candidates, trie)
+
+        self.assertListEqual([gore], election_result.get_winners())
+
+        votes_round = [candidate_vc.number_of_votes for candidate_vc in election_result.rounds[-1].candidate_results]
+        assert_list_almost_equal(self, [5, 4, 0], votes_round)
+
+    def test_same_results_as_ballot_by_ballot_counting(self):
+        rng = random.Random(1)
+
+        for _ in range(100):
+            candidates = [Candidate("Candidate %i" % i) for i in range(rng.randint(2, 6))]
+            ballots = [
+                Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+                for _ in range(rng.randint(1, 100))
+            ]
+            trie = BallotTrie.from_ballots(candidates, ballots)
+            number_of_seats = rng.randint(1, len(candidates) - 1)
+
+            for method in [pyrankvote.preferential_block_voting, pyrankvote.single_transferable_vote]:
+                random.seed(0)
+                correct_results = get_round_results(method(candidates, ballots, number_of_seats))
+                random.seed(0)
+                results = get_round_results(method(candidates, trie, number_of_seats))
+
+                self.assertListEqual(correct_results, results, "%s should count a BallotTrie the same way" % method.__name__)
+
+    def test_pick_random_if_blank_not_supported(self):
+        per = Candidate("Per")
+        trie = BallotTrie.from_ballots([per], [Ballot(ranked_candidates=[per])])
+
+        with self.assertRaises(ValueError):
+            pyrankvote.instant_runoff_voting([per], trie, pick_random_if_blank=True)
@@ -0,0 +1,101 @@
+import math
+import sys
+import unittest
+import random
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, EncodedBallots
+from pyrankvote import bootstrap
+from pyrankvote.bootstrap import BootstrapAnalysis
+
+
+class TestBootstrapAnalysis(unittest.TestCase):
+    def get_candidates_and_ballots(self, seed=1):
+        rng = random.Random(seed)
+        candidates = [Candidate("Candidate %i" % i) for i in range(5)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(1, len(candidates))))
+            for _ in range(200)
+        ]
+        return candidates, ballots
+
+    def test_samples_are_counted_like_resampled_ballots(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        encoded_ballots = EncodedBallots.from_ballots(candidates, ballots)
+
+        for method, kwargs in [
+            (pyrankvote.instant_runoff_voting, {}),
+            (pyrankvote.single_transferable_vote, {"number_of_seats": 2}),
+        ]:
+            analysis = BootstrapAnalysis(candidates, encoded_ballots, method, **kwargs)
+            # The seed of the first sample when resampling with seed=3
+            sample_seed = random.Random(3).getrandbits(64)
+            weights = analysis.get_sample_weights(sample_seed)
+            self.assertEqual(len(ballots), sum(weights))
+
+            resampled_ballots = []
+            for (ranking, _), weight in zip(encoded_ballots.iter_rankings(), weights):
+                ranked_candidates = [candidates[index] for index in ranking]
+                resampled_ballots.extend(Ballot(ranked_candidates=ranked_candidates) for _ in range(weight))
+            random.seed(sample_seed)
+            correct_results = method(candidates, resampled_ballots, **kwargs)
+
+            bootstrap_results = analysis.resample(1, seed=3)
+            self.assertEqual(1, bootstrap_results.number_of_samples)
+            self.assertListEqual(
+                sorted(correct_results.get_winners(), key=candidates.index),
+                [candidate for candidate in candidates if bootstrap_results.winner_counts[candidate] == 1],
+            )
+            for i, round_ in enumerate(correct_results.rounds):
+                vote_distribution = bootstrap_results.get_round_vote_distribution(i)
+                for candidate, number_of_votes, _ in round_.candidate_results:
+                    self.assertAlmostEqual(number_of_votes, vote_distribution[candidate][0])
+                self.assertAlmostEqual(round_.number_of_blank_votes, bootstrap_results.round_blank_votes[i][0])
+
+    def test_reproducible_with_jobs(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        analysis = BootstrapAnalysis(candidates, ballots)
+
+        serial_results = analysis.resample(40, seed=5, batch_size=7)
+        parallel_results = analysis.resample(40, seed=5, jobs=2, batch_size=7)
+
+        self.assertEqual(40, serial_results.number_of_samples)
+        self.assertDictEqual(serial_results.winner_counts, parallel_results.winner_counts)
+        self.assertEqual(40, sum(serial_results.outcome_counts.values()))
+        self.assertAlmostEqual(1.0, sum(serial_results.get_winner_frequencies().values()))
+        self.assertListEqual(
+            list(serial_results.round_votes[0][0]), list(parallel_results.round_votes[0][0])
+        )
+
+    def test_clear_winner_always_wins(self):
+        candidates, _ = self.get_candidates_and_ballots()
+        ballots = [Ballot(ranked_candidates=[candidates[0]])] * 90 + [
+            Ballot(ranked_candidates=[candidates[1], candidates[0]])
+        ] * 10
+
+        bootstrap_results = BootstrapAnalysis(candidates, ballots).resample(20, seed=1)
+        self.assertEqual(1.0, bootstrap_results.get_winner_frequencies()[candidates[0]])
+        self.assertIn("100.0%", str(bootstrap_results))
+
+    def test_weights_without_numpy(self):
+        probabilities = [0.5, 0.3, 0.15, 0.05]
+        number_of_ballots = 100000
+
+        # Importing numpy raises ImportError
+        with mock.patch.dict(sys.modules, {"numpy": None}):
+            samples = [bootstrap._draw_weights(seed, probabilities, number_of_ballots) for seed in range(200)]
+            weights = bootstrap._draw_weights(0, probabilities, number_of_ballots)
+            self.assertListEqual(list(samples[0]), list(weights))
+
+        for i, probability in enumerate(probabilities):
+            mean = sum(weights[i] for weights in samples) / len(samples)
+            standard_deviation = math.sqrt(number_of_ballots * probability * (1 - probability) / len(samples))
+            self.assertLess(abs(mean - number_of_ballots * probability), 5 * standard_deviation)
+        for weights in samples:
+            self.assertEqual(number_of_ballots, sum(weights))
+
+        # Binomial draws with a small expected number of successes use the geometric method
+        rng = random.Random(1)
+        draws = [bootstrap._draw_binomial(rng, 1000, 0.002) for _ in range(2000)]
+        self.assertLess(abs(sum(draws) / len(draws) - 2.0), 5 * math.sqrt(2.0 / len(draws)))
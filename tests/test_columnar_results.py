@@ -0,0 +1,128 @@
+import unittest
+import io
+import os
+import tempfile
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot
+from pyrankvote.columnar_results import ColumnarResults, JsonLinesWriter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+def get_election_results():
+    per = Candidate("Per")
+    paal = Candidate("Pål")
+    askeladden = Candidate("Askeladden")
+    candidates = [per, paal, askeladden]
+
+    ballots = [
+        Ballot(ranked_candidates=[askeladden, per]),
+        Ballot(ranked_candidates=[per, paal]),
+        Ballot(ranked_candidates=[per, paal]),
+        Ballot(ranked_candidates=[paal, per]),
+        Ballot(ranked_candidates=[paal, per, askeladden]),
+        Ballot(ranked_candidates=[]),
+    ]
+
+    return candidates, pyrankvote.single_transferable_vote(candidates, ballots, number_of_seats=2)
+
+
+class TestColumnarResults(unittest.TestCase):
+    def test_columns(self):
+        candidates, election_results = get_election_results()
+        columnar_results = ColumnarResults.from_election_results(election_results)
+
+        number_of_rounds = len(election_results.rounds)
+        self.assertEqual(number_of_rounds, columnar_results.get_number_of_rounds())
+        self.assertEqual(number_of_rounds * len(candidates), len(columnar_results))
+        self.assertListEqual(sorted(list(range(number_of_rounds)) * 3), list(columnar_results.rounds))
+        self.assertEqual(str(election_results), str(columnar_results.to_election_results()))
+
+    def test_save_and_load(self):
+        candidates, election_results = get_election_results()
+        columnar_results = ColumnarResults.from_election_results(election_results)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "results.prvres")
+            columnar_results.save(file_path)
+
+            for use_mmap in [True, False]:
+                loaded_results = ColumnarResults.load(file_path, candidates, use_mmap=use_mmap)
+                self.assertEqual(str(election_results), str(loaded_results.to_election_results()))
+                self.assertIs(candidates[0], loaded_results.to_election_results().get_winners()[0])
+                self.assertListEqual(list(columnar_results.votes), list(loaded_results.votes))
+                del loaded_results  # Closes the memory map before the directory is removed
+
+            with open(file_path, "wb") as f:
+                f.write(b"Not a results file")
+            self.assertRaises(ValueError, ColumnarResults.load, file_path)
+
+    def test_json_lines(self):
+        candidates, election_results = get_election_results()
+
+        f = io.StringIO()
+        writer = JsonLinesWriter(f)
+        for round_ in election_results.rounds:
+            writer.write_round(round_)
+
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(election_results.rounds) + 1, len(lines), "Candidates are only written once")
+
+        read_results = ColumnarResults.read_json_lines(lines, candidates)
+        self.assertEqual(str(election_results), str(read_results.to_election_results()))
+
+        f = io.StringIO()
+        read_results.write_json_lines(f)
+        self.assertEqual(lines, f.getvalue().splitlines())
+
+    def test_transfers(self):
+        candidates, election_results = get_election_results()
+        columnar_results = ColumnarResults.from_election_results(election_results)
+
+        f = io.StringIO()
+        JsonLinesWriter(f).write_results(election_results)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "results.prvres")
+            columnar_results.save(file_path)
+            loaded_results = ColumnarResults.load(file_path, candidates, use_mmap=False)
+
+        for results in [
+            columnar_results,
+            loaded_results,
+            ColumnarResults.read_json_lines(f.getvalue().splitlines(), candidates),
+        ]:
+            rounds = results.to_election_results().rounds
+            self.assertIsNone(rounds[0].transfers)
+            for round_, correct_round in zip(rounds[1:], election_results.rounds[1:]):
+                self.assertIsNotNone(round_.transfers)
+                for from_candidate in candidates:
+                    self.assertDictEqual(
+                        correct_round.transfers.get_transfers_from(from_candidate),
+                        round_.transfers.get_transfers_from(from_candidate),
+                    )
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_to_numpy(self):
+        _, election_results = get_election_results()
+        columns = ColumnarResults.from_election_results(election_results).to_numpy()
+
+        self.assertEqual(numpy.float64, columns["votes"].dtype)
+        self.assertEqual(len(election_results.rounds), len(columns["blank_votes"]))
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_to_pandas(self):
+        _, election_results = get_election_results()
+        data_frame = ColumnarResults.from_election_results(election_results).to_pandas()
+
+        self.assertListEqual(["round", "candidate", "votes", "status"], list(data_frame.columns))
+        self.assertEqual(len(election_results.rounds) * 3, len(data_frame))
@@ -0,0 +1,129 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import command_line
+from pyrankvote.columnar_results import ColumnarResults
+from pyrankvote.command_line import main
+
+
+TEST_FOLDER = "test_data/external_irv/"
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(THIS_DIR, os.pardir, TEST_FOLDER)
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = self.temporary_directory.name
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def run_command(self, *arguments):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exit_code = main(list(arguments))
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_count_csv(self):
+        file_path = os.path.join(self.directory, "us_vt_btv_2009_03_mayor.normalized.csv")
+        shutil.copy(os.path.join(TEST_DATA_PATH, "us_vt_btv_2009_03_mayor.normalized.csv"), file_path)
+        output_path = os.path.join(self.directory, "results.jsonl")
+
+        exit_code, stdout, stderr = self.run_command(file_path, "--output", output_path)
+
+        self.assertEqual(0, exit_code)
+        self.assertIn("ROUND 1", stdout)
+        self.assertIn("FINAL RESULT", stdout)
+        self.assertTrue(stdout.endswith("Elected: Bob Kiss\n"))
+        self.assertIn("Loading ballots: 100%", stderr)
+
+        with open(output_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertIn("Bob Kiss", json.loads(lines[0])["new_candidates"])
+        self.assertEqual(607, json.loads(lines[-1])["blank_votes"])
+
+        # The second count uses the ballot cache
+        exit_code, stdout, stderr = self.run_command(file_path, "--winners-only", "--quiet")
+        self.assertEqual(0, exit_code)
+        self.assertEqual("Elected: Bob Kiss\n", stdout)
+        self.assertEqual("", stderr)
+
+    def test_count_blt(self):
+        file_path = os.path.join(self.directory, "election.blt")
+        with open(file_path, "w") as f:
+            f.write('3 2\n4 1 2 0\n3 2 0\n2 3 2 0\n0\n"Per"\n"Pål"\n"Askeladden"\n"Valg"\n')
+        output_path = os.path.join(self.directory, "results.prvres")
+
+        exit_code, stdout, _ = self.run_command(
+            file_path, "--method", "pbv", "--output", output_path, "--no-cache"
+        )
+
+        self.assertEqual(0, exit_code)
+        self.assertTrue(stdout.endswith("Elected: Pål, Per\n"))
+        results = ColumnarResults.load(output_path, use_mmap=False).to_election_results()
+        self.assertListEqual(["Pål", "Per"], [candidate.name for candidate in results.get_winners()])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, ".pyrankvote_cache")))
+
+        # Streaming reads the file in every round, and gives the same results
+        exit_code, streaming_stdout, _ = self.run_command(file_path, "--method", "pbv", "--streaming")
+        self.assertEqual(0, exit_code)
+        self.assertEqual(stdout, streaming_stdout)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, main, [file_path, "--method", "stv", "--streaming"])
+            for option in [["--parse-jobs", "2"], ["--contest", "Valg"], ["--no-cache"]]:
+                self.assertRaises(SystemExit, main, [file_path, "--method", "pbv", "--streaming"] + option)
+
+    def test_errors(self):
+        exit_code, _, stderr = self.run_command(os.path.join(self.directory, "missing.csv"), "--quiet")
+        self.assertEqual(1, exit_code)
+        self.assertIn("error", stderr)
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, main, [os.path.join(self.directory, "ballots.txt")])
+            self.assertRaises(SystemExit, main, [os.path.join(self.directory, "missing.csv"), "--seats", "0"])
+
+    def test_rounds_are_printed_while_counting(self):
+        file_path = os.path.join(self.directory, "election.blt")
+        with open(file_path, "w") as f:
+            f.write('4 1\n6 1 2 0\n4 2 1 0\n3 3 2 0\n2 4 3 0\n0\n"A"\n"B"\n"C"\n"D"\n"Valg"\n')
+        output_path = os.path.join(self.directory, "results.jsonl")
+        stdout = io.StringIO()
+        printed_before_round = []
+        written_before_round = []
+
+        def instant_runoff_voting(candidates, ballots, round_callback=None, **kwargs):
+            def record_round(round_):
+                printed_before_round.append(stdout.getvalue())
+                with open(output_path, encoding="utf-8") as f:
+                    written_before_round.append(f.read().splitlines())
+                round_callback(round_)
+
+            return pyrankvote.instant_runoff_voting(candidates, ballots, round_callback=record_round, **kwargs)
+
+        with mock.patch.dict(command_line.METHODS, {"irv": instant_runoff_voting}):
+            with contextlib.redirect_stdout(stdout):
+                self.assertEqual(0, main([file_path, "--quiet", "--no-cache", "--output", output_path]))
+
+        self.assertEqual(3, len(printed_before_round))
+        self.assertEqual("", printed_before_round[0])
+        self.assertTrue(printed_before_round[1].startswith("ROUND 1\n"))
+        self.assertNotIn("ROUND 2\n", printed_before_round[1])
+        self.assertIn("ROUND 2\n", printed_before_round[2])
+        self.assertNotIn("FINAL RESULT", printed_before_round[2])
+        self.assertTrue(stdout.getvalue().endswith("Elected: A\n"))
+        self.assertIn("FINAL RESULT", stdout.getvalue())
+
+        # The JSON lines are written while counting too
+        self.assertListEqual([], written_before_round[0])
+        self.assertEqual(1, json.loads(written_before_round[2][-1])["round"])
+        with open(output_path, encoding="utf-8") as f:
+            self.assertEqual(2, json.loads(f.read().splitlines()[-1])["round"])
@@ -0,0 +1,184 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, EncodedBallots
+from pyrankvote import counting_service
+from pyrankvote.counting_service import CountingClient, CountingService, ServiceBusyError, create_server
+from pyrankvote.counting_service import _UnixHTTPConnection
+from pyrankvote.shared_ballots import SharedEncodedBallots
+
+
+class TestCountingService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temporary_directory = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.temporary_directory.name, "pyrankvote.sock")
+
+        cls.ballot_directory = os.path.join(cls.temporary_directory.name, "ballots")
+        os.mkdir(cls.ballot_directory)
+
+        cls.service = CountingService(jobs=2, max_pending_counts=4, ballot_directory=cls.ballot_directory)
+        cls.server = create_server(cls.service, socket_path=cls.socket_path)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.client = CountingClient(socket_path=cls.socket_path, timeout=60)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.close()
+        cls.temporary_directory.cleanup()
+
+    def get_candidates_and_ballots(self):
+        bush = Candidate("George W. Bush (Republican)")
+        gore = Candidate("Al Gore (Democratic)")
+        nader = Candidate("Ralph Nader (Green)")
+
+        candidates = [bush, gore, nader]
+        ballots = [
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[nader, gore, bush]),
+            Ballot(ranked_candidates=[nader, gore]),
+            Ballot(ranked_candidates=[gore, nader, bush]),
+            Ballot(ranked_candidates=[gore, nader]),
+            Ballot(ranked_candidates=[gore, nader]),
+        ]
+        return candidates, ballots
+
+    def test_count_resident_ballots(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        handle = self.service.add_ballots(EncodedBallots.from_ballots(candidates, ballots))
+        self.assertIn(handle, self.client.get_ballot_sets())
+
+        for method, number_of_seats in [("irv", None), ("stv", 2), ("pbv", 2)]:
+            kwargs = {} if number_of_seats is None else {"number_of_seats": number_of_seats}
+            correct_results = getattr(pyrankvote, {
+                "irv": "instant_runoff_voting",
+                "stv": "single_transferable_vote",
+                "pbv": "preferential_block_voting",
+            }[method])(candidates, ballots, **kwargs)
+
+            results = self.client.count(handle, method, number_of_seats)
+            self.assertListEqual([candidate.name for candidate in correct_results.get_winners()], results["winners"])
+            self.assertEqual(len(correct_results.rounds), len(results["rounds"]))
+
+        self.client.unload(handle)
+        self.assertNotIn(handle, self.client.get_ballot_sets())
+        self.assertRaises(ValueError, self.client.count, handle)
+
+    def test_load_ballot_file(self):
+        file_path = os.path.join(self.ballot_directory, "election.blt")
+        with open(file_path, "w") as f:
+            f.write('3 2\n4 1 2 0\n3 2 0\n2 3 2 0\n0\n"Per"\n"Pål"\n"Askeladden"\n"Valg"\n')
+
+        handle = self.client.load_ballots(file_path, use_cache=False)
+        self.assertEqual(9, self.client.get_ballot_sets()[handle]["number_of_ballots"])
+
+        # The number of seats is read from the BLT file
+        results = self.client.count(handle, "stv")
+        self.assertListEqual(["Per", "Pål"], sorted(results["winners"]))
+
+        self.assertRaises(ValueError, self.client.load_ballots, os.path.join(self.ballot_directory, "missing.blt"))
+        self.client.unload(handle)
+
+    def test_only_ballot_directory_files_are_loaded(self):
+        file_path = os.path.join(self.temporary_directory.name, "election.blt")
+        with open(file_path, "w") as f:
+            f.write('3 1\n4 1 2 0\n3 2 0\n0\n"Per"\n"Pål"\n"Askeladden"\n"Valg"\n')
+
+        for path in [file_path, os.path.join(self.ballot_directory, os.pardir, "election.blt")]:
+            with self.assertRaises(ValueError) as context:
+                self.client.load_ballots(path, use_cache=False)
+            self.assertIn("not in the ballot directory", str(context.exception))
+
+        # Without a ballot directory, no files are loaded over HTTP
+        with mock.patch.object(self.service, "ballot_directory", None):
+            self.assertRaises(PermissionError, self.service.get_ballot_file_path, file_path)
+
+    def test_post_must_be_json(self):
+        connection = _UnixHTTPConnection(self.socket_path, timeout=60)
+        try:
+            # Like a form that a web page posts to the service
+            connection.request(
+                "POST",
+                "/ballots",
+                body=b'{"file": "election.blt"}',
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        self.assertEqual(415, response.status)
+
+    def test_worker_keeps_ballot_profile(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        handles = [self.service.add_ballots(EncodedBallots.from_ballots(candidates, ballots)) for _ in range(2)]
+        name_and_storage = [
+            (shared_ballots.name, shared_ballots.storage)
+            for shared_ballots in (self.service._ballot_sets[handle] for handle in handles)
+        ]
+
+        # The worker functions are run in this process
+        try:
+            counting_service._count_ballot_set(name_and_storage[0], "irv", None)
+            ballot_profile = counting_service._get_ballot_profile(name_and_storage[0])
+            trie = ballot_profile.get_trie()
+            counting_service._count_ballot_set(name_and_storage[0], "stv", 2)
+            counting_service._count_ballot_set(name_and_storage[1], "irv", None)
+            self.assertEqual(set(name_and_storage), set(counting_service._attached_ballot_sets))
+            self.assertIs(ballot_profile, counting_service._get_ballot_profile(name_and_storage[0]))
+            self.assertIs(trie, ballot_profile.get_trie())
+
+            counting_service._detach_ballot_set(name_and_storage[0])
+            self.assertEqual({name_and_storage[1]}, set(counting_service._attached_ballot_sets))
+        finally:
+            for key in name_and_storage:
+                counting_service._detach_ballot_set(key)
+            for handle in handles:
+                self.service.unload(handle)
+
+    def test_unload_during_count(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        handle = self.service.add_ballots(EncodedBallots.from_ballots(candidates, ballots))
+        shared_ballots = self.service._ballot_sets[handle]
+
+        # The ballot set is unloaded after the count is started, before a worker attaches to it
+        worker_count = counting_service._Worker.count
+
+        def unload_and_count(worker, *args):
+            self.service.unload(handle)
+            self.assertIn(shared_ballots.name, self.service._unloaded_ballot_sets)
+            return worker_count(worker, *args)
+
+        with mock.patch.object(counting_service._Worker, "count", autospec=True, side_effect=unload_and_count):
+            results = self.service.count(handle)
+        self.assertEqual(1, len(results.get_winners()))
+
+        # The shared ballots are removed when the count ends
+        self.assertNotIn(handle, self.service._ballot_sets)
+        self.assertEqual({}, self.service._unloaded_ballot_sets)
+        self.assertRaises(
+            FileNotFoundError, SharedEncodedBallots.attach, shared_ballots.name, shared_ballots.storage
+        )
+
+    def test_admission_control(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        handle = self.service.add_ballots(EncodedBallots.from_ballots(candidates, ballots))
+
+        # Pretend that the service is full
+        self.service._number_of_pending_counts = self.service.max_pending_counts
+        try:
+            self.assertRaises(ServiceBusyError, self.client.count, handle)
+        finally:
+            self.service._number_of_pending_counts = 0
+
+        self.assertEqual(1, len(self.client.count(handle)["winners"]))
+        self.service.unload(handle)
@@ -1,6 +1,10 @@
 import unittest
+import random
+import pyrankvote
 from pyrankvote import Candidate, Ballot
 from pyrankvote import helpers
+from pyrankvote.ballot_trie import BallotTrie
+from pyrankvote.multiple_seat_ranking_methods import _create_election_manager
 from pyrankvote.test_helpers import assert_list_almost_equal
 
 
@@ -243,3 +247,155 @@ class TestElectionManager(unittest.TestCase):
         self.assertAlmostEqual(stay_vc.number_of_votes, 3.0-0.5)
         self.assertAlmostEqual(soft_vc.number_of_votes, 1.0+2*0.5/3)
         self.assertAlmostEqual(hard_vc.number_of_votes, 0.0+1*0.5/3)
+
+    def test_withdrawn_candidates(self):
+        rng = random.Random(3)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+            for _ in range(200)
+        ]
+        withdrawn_candidates = candidates[:2]
+        remaining_candidates = candidates[2:]
+        rewritten_ballots = [
+            Ballot(ranked_candidates=[c for c in ballot.ranked_candidates if c not in withdrawn_candidates])
+            for ballot in ballots
+        ]
+
+        for method, kwargs in [
+            (pyrankvote.instant_runoff_voting, {}),
+            (pyrankvote.preferential_block_voting, {"number_of_seats": 2}),
+            (pyrankvote.single_transferable_vote, {"number_of_seats": 2}),
+            (pyrankvote.meek_single_transferable_vote, {"number_of_seats": 2}),
+        ]:
+            correct_results = method(remaining_candidates, rewritten_ballots, **kwargs)
+            for ballots_or_trie in [ballots, BallotTrie.from_ballots(candidates, ballots)]:
+                election_results = method(
+                    remaining_candidates, ballots_or_trie, withdrawn_candidates=withdrawn_candidates, **kwargs
+                )
+                self.assertEqual(str(correct_results), str(election_results))
+                self.assertRaises(KeyError, method, remaining_candidates, ballots_or_trie, **kwargs)
+
+        self.assertRaises(
+            ValueError, helpers.ElectionManager, candidates, ballots, withdrawn_candidates=withdrawn_candidates
+        )
+
+
+class TestDrawnLots(unittest.TestCase):
+    def get_candidates_and_ballots(self):
+        stay = Candidate("Stay")
+        soft = Candidate("Soft Brexit")
+        hard = Candidate("Hard Brexit")
+
+        candidates = [stay, soft, hard]
+        ballots = [
+            Ballot(ranked_candidates=[stay]),
+            Ballot(ranked_candidates=[soft, stay]),
+            Ballot(ranked_candidates=[hard, soft]),
+        ]
+        return candidates, ballots
+
+    def test_lots_break_ties(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        stay, soft, hard = candidates
+
+        for ranked_candidates in [[hard, stay, soft], [soft, hard, stay]]:
+            lots = helpers.DrawnLots(ranked_candidates)
+            for ballots_or_trie in [ballots, BallotTrie.from_ballots(candidates, ballots)]:
+                manager = _create_election_manager(
+                    candidates, ballots_or_trie, compare_method_if_equal=lots
+                )
+                ranked_candidates_in_race = [candidate_vc.candidate for candidate_vc in manager._candidates_in_race]
+                self.assertListEqual(ranked_candidates, ranked_candidates_in_race)
+
+    def test_lots_after_most_second_choice_votes(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        stay, soft, hard = candidates
+
+        # Stay and soft have one second choice vote each, hard has none
+        lots = helpers.DrawnLots([hard, stay, soft], after_most_second_choice_votes=True)
+        for ballots_or_trie in [ballots, BallotTrie.from_ballots(candidates, ballots)]:
+            manager = _create_election_manager(candidates, ballots_or_trie, compare_method_if_equal=lots)
+            ranked_candidates_in_race = [candidate_vc.candidate for candidate_vc in manager._candidates_in_race]
+            self.assertListEqual([stay, soft, hard], ranked_candidates_in_race)
+
+    def test_from_seed(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+
+        lots = helpers.DrawnLots.from_seed(candidates, seed=1)
+        self.assertListEqual(lots.ranked_candidates, helpers.DrawnLots.from_seed(candidates, seed=1).ranked_candidates)
+        self.assertSetEqual(set(candidates), set(lots.ranked_candidates))
+
+        election_result = pyrankvote.instant_runoff_voting(candidates, ballots, compare_method_if_equal=lots)
+        self.assertEqual(1, len(election_result.get_winners()))
+
+        self.assertRaises(ValueError, helpers.DrawnLots, [candidates[0], candidates[0]])
+        self.assertRaises(
+            ValueError, helpers.ElectionManager, candidates, ballots, compare_method_if_equal=helpers.DrawnLots(candidates[:2])
+        )
+
+
+class TestTransferMatrix(unittest.TestCase):
+    def test_stv_transfers(self):
+        per = Candidate("Per")
+        paal = Candidate("Pål")
+        askeladden = Candidate("Askeladden")
+        candidates = [per, paal, askeladden]
+
+        ballots = [
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, askeladden]),
+            Ballot(ranked_candidates=[per]),
+            Ballot(ranked_candidates=[paal]),
+            Ballot(ranked_candidates=[askeladden, paal]),
+        ]
+
+        for ballots_or_trie in [ballots, BallotTrie.from_ballots(candidates, ballots)]:
+            election_result = pyrankvote.single_transferable_vote(candidates, ballots_or_trie, number_of_seats=2)
+            self.assertIsNone(election_result.rounds[0].transfers, "No votes are transferred before the first round")
+
+            # Per gets 4 votes, the quota is 6 / 3 = 2 votes, and the 2 excess votes are transferred
+            transfers = election_result.rounds[1].transfers
+            self.assertAlmostEqual(1.0, transfers.get_number_of_votes(per, paal))
+            self.assertAlmostEqual(0.5, transfers.get_number_of_votes(per, askeladden))
+            self.assertAlmostEqual(0.5, transfers.get_number_of_votes(per, None))
+            self.assertEqual({paal: 1.0, askeladden: 0.5, None: 0.5}, transfers.get_transfers_from(per))
+            self.assertEqual({}, transfers.get_transfers_from(paal))
+            # Only Per has a row in the matrix
+            self.assertEqual([0], list(transfers.rows))
+
+    def test_transfers_add_up_to_round_results(self):
+        rng = random.Random(7)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(1, len(candidates))))
+            for _ in range(200)
+        ]
+
+        for method, kwargs in [
+            (pyrankvote.instant_runoff_voting, {}),
+            (pyrankvote.single_transferable_vote, {"number_of_seats": 3}),
+            (pyrankvote.preferential_block_voting, {"number_of_seats": 2}),
+        ]:
+            list_result = method(candidates, ballots, **kwargs)
+            trie_result = method(candidates, BallotTrie.from_ballots(candidates, ballots), **kwargs)
+
+            for previous_round, round_, trie_round in zip(
+                list_result.rounds, list_result.rounds[1:], trie_result.rounds[1:]
+            ):
+                self.assertEqual(sorted(round_.transfers.rows), sorted(trie_round.transfers.rows))
+                for from_index, row in round_.transfers.rows.items():
+                    assert_list_almost_equal(self, list(row), list(trie_round.transfers.rows[from_index]))
+
+                previous_votes = {result.candidate: result.number_of_votes for result in previous_round.candidate_results}
+                transfers = round_.transfers
+                for candidate, number_of_votes, _ in round_.candidate_results:
+                    received_votes = sum(transfers.get_number_of_votes(other, candidate) for other in candidates)
+                    transferred_votes = sum(transfers.get_transfers_from(candidate).values())
+                    self.assertAlmostEqual(previous_votes[candidate] + received_votes - transferred_votes, number_of_votes)
+
+                exhausted_votes = sum(transfers.get_number_of_votes(candidate, None) for candidate in candidates)
+                self.assertAlmostEqual(
+                    previous_round.number_of_blank_votes + exhausted_votes, round_.number_of_blank_votes
+                )
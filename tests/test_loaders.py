@@ -0,0 +1,348 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, EncodedBallots
+from pyrankvote import loaders
+from pyrankvote.test_helpers import assert_list_almost_equal
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+TEST_FOLDER = "test_data/external_irv/"
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(THIS_DIR, os.pardir, TEST_FOLDER)
+
+
+class TestEncodedBallots(unittest.TestCase):
+    def test_save_and_load(self):
+        per = Candidate("Per")
+        paal = Candidate("Pål")
+        candidates = [per, paal]
+        ballots = [
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[paal]),
+            Ballot(ranked_candidates=[]),
+        ]
+
+        encoded_ballots = EncodedBallots.from_ballots(candidates, ballots)
+        self.assertEqual(3, len(encoded_ballots), "Should store distinct rankings once")
+        self.assertEqual(4, encoded_ballots.get_number_of_ballots())
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "ballots.bin")
+            encoded_ballots.save(file_path)
+
+            for use_mmap in [True, False]:
+                loaded_ballots = EncodedBallots.load(file_path, use_mmap=use_mmap)
+                self.assertListEqual(list(encoded_ballots.iter_rankings()), list(loaded_ballots.iter_rankings()))
+                self.assertListEqual(candidates, loaded_ballots.candidates)
+
+                del loaded_ballots  # Release the memory map before the folder is removed
+
+    def test_weighted_ballots(self):
+        encoded_ballots = EncodedBallots.from_ranking_counts(
+            [Candidate("Per"), Candidate("Pål")], [((0, 1), 2), ((1,), 0.5)]
+        )
+        self.assertTrue(encoded_ballots.is_weighted())
+        self.assertEqual(2.5, encoded_ballots.get_number_of_ballots())
+        with self.assertRaises(ValueError):
+            encoded_ballots.to_ballots()
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "ballots.bin")
+            encoded_ballots.save(file_path)
+            loaded_ballots = EncodedBallots.load(file_path, use_mmap=False)
+
+        self.assertTrue(loaded_ballots.is_weighted())
+        self.assertListEqual([((0, 1), 2.0), ((1,), 0.5)], list(loaded_ballots.iter_rankings()))
+
+
+class TestNormalizedCsvLoader(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "us_vt_btv_2009_03_mayor.normalized.csv")
+        shutil.copy(os.path.join(TEST_DATA_PATH, "us_vt_btv_2009_03_mayor.normalized.csv"), self.file_path)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def count(self, encoded_ballots):
+        election_result = pyrankvote.instant_runoff_voting(encoded_ballots.candidates, encoded_ballots)
+        last_round = election_result.rounds[-1]
+
+        self.assertEqual(607, last_round.number_of_blank_votes)
+        number_of_votes = [candidate_result.number_of_votes for candidate_result in last_round.candidate_results]
+        assert_list_almost_equal(self, [4313, 4060, 0, 0, 0, 0], number_of_votes)
+
+    def test_load_and_count(self):
+        encoded_ballots = loaders.load_normalized_csv(self.file_path, use_cache=False)
+        self.assertEqual(8980, encoded_ballots.get_number_of_ballots())
+        self.count(encoded_ballots)
+
+    def test_cache(self):
+        cache_file_path = loaders.get_cache_file_path(self.file_path, "normalized_csv")
+        self.assertFalse(os.path.exists(cache_file_path))
+
+        encoded_ballots = loaders.load_normalized_csv(self.file_path)
+        self.assertTrue(os.path.exists(cache_file_path), "Should write the cache file")
+
+        cached_ballots = loaders.load_normalized_csv(self.file_path)
+        self.assertIsNotNone(cached_ballots._mmap, "Should memory-map the cache file")
+        self.assertListEqual(list(encoded_ballots.iter_rankings()), list(cached_ballots.iter_rankings()))
+        self.count(cached_ballots)
+        del cached_ballots
+
+        # If only the modification time changes, the hash is compared once, and the new time is cached
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        with mock.patch.object(loaders, "get_file_hash", wraps=loaders.get_file_hash) as get_file_hash:
+            for _ in range(2):
+                touched_ballots = loaders.load_normalized_csv(self.file_path)
+                self.assertEqual(8980, touched_ballots.get_number_of_ballots())
+                del touched_ballots
+        self.assertEqual(1, get_file_hash.call_count)
+        cached_source = EncodedBallots.load(cache_file_path, use_mmap=False).metadata["source"]
+        self.assertEqual(stat.st_mtime_ns + 10 ** 9, cached_source["mtime_ns"])
+
+        # Changing the file invalidates the cache
+        with open(self.file_path, "a") as f:
+            f.write("999999-99-9999,1,Bob Kiss\n")
+        changed_ballots = loaders.load_normalized_csv(self.file_path)
+        self.assertIsNone(changed_ballots._mmap)
+        self.assertEqual(8981, changed_ballots.get_number_of_ballots())
+
+    def test_parse_in_parts(self):
+        encoded_ballots = loaders.parse_normalized_csv(self.file_path)
+
+        progress = []
+        with mock.patch.object(loaders, "MIN_PART_SIZE", 1000):
+            encoded_ballots_from_parts = loaders.parse_normalized_csv(
+                self.file_path, jobs=2, progress=lambda bytes_parsed, file_size: progress.append(bytes_parsed)
+            )
+
+        def get_named_rankings(encoded_ballots):
+            return sorted(
+                (tuple(encoded_ballots.candidates[index].name for index in ranking), count)
+                for ranking, count in encoded_ballots.iter_rankings()
+            )
+
+        self.assertListEqual(get_named_rankings(encoded_ballots), get_named_rankings(encoded_ballots_from_parts))
+        self.assertEqual(os.path.getsize(self.file_path), progress[-1])
+        self.count(encoded_ballots_from_parts)
+
+
+class TestBltLoader(unittest.TestCase):
+    def test_parse_blt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "election.blt")
+            with open(file_path, "w") as f:
+                f.write(
+                    "4 2\n"
+                    "-4\n"
+                    "3 1 2 0\n"
+                    "(b2) 2 2 4 3 0  # Ballot id and comment\n"
+                    "1 3 1=2 - 1 0\n"
+                    "0\n"
+                    '"Per"\n"Pål"\n"Askeladden"\n"Espen"\n"Eventyrvalget"\n'
+                )
+
+            encoded_ballots = loaders.load_blt(file_path, use_cache=False)
+
+        self.assertListEqual(["Per", "Pål", "Askeladden", "Espen"], [c.name for c in encoded_ballots.candidates])
+        self.assertListEqual([((0, 1), 3), ((1, 3, 2), 2), ((2, 0), 1)], list(encoded_ballots.iter_rankings()))
+        self.assertEqual(2, encoded_ballots.metadata["number_of_seats"])
+        self.assertEqual("Eventyrvalget", encoded_ballots.metadata["title"])
+        self.assertListEqual(["Espen"], encoded_ballots.metadata["withdrawn_candidates"])
+
+    def test_weights(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "election.blt")
+            with open(file_path, "w") as f:
+                f.write('3 1\n1.5 1 2 0\n0.25 3 0\n2 1 2 0\n0\n"Per"\n"Pål"\n"Askeladden"\n"Valg"\n')
+
+            encoded_ballots = loaders.parse_blt(file_path)
+
+        self.assertTrue(encoded_ballots.is_weighted())
+        self.assertListEqual([((0, 1), 3.5), ((2,), 0.25)], list(encoded_ballots.iter_rankings()))
+
+        election_result = pyrankvote.single_transferable_vote(encoded_ballots.candidates, encoded_ballots, 1)
+        self.assertEqual("Per", election_result.get_winners()[0].name)
+        self.assertEqual(3.5, election_result.rounds[-1].candidate_results[0].number_of_votes)
+
+    def test_write_blt(self):
+        per, paal, askeladden = Candidate("Per"), Candidate("Pål"), Candidate("Askeladden")
+        candidates = [per, paal, askeladden]
+        ballots = (
+            [Ballot(ranked_candidates=[per, paal])] * 3
+            + [Ballot(ranked_candidates=[askeladden])] * 2
+            + [Ballot(ranked_candidates=[])]
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "election.blt")
+            for ballots_to_write in [ballots, EncodedBallots.from_ballots(candidates, ballots)]:
+                loaders.write_blt(
+                    file_path, candidates, ballots_to_write, 2, title="Valg", withdrawn_candidates=[askeladden]
+                )
+                with open(file_path, encoding="utf-8") as f:
+                    self.assertEqual(
+                        '3 2\n-3\n3 1 2 0\n2 3 0\n1 0\n0\n"Per"\n"Pål"\n"Askeladden"\n"Valg"\n', f.read()
+                    )
+
+                encoded_ballots = loaders.parse_blt(file_path)
+                self.assertListEqual([((0, 1), 3), ((2,), 2), ((), 1)], list(encoded_ballots.iter_rankings()))
+                self.assertEqual(2, encoded_ballots.metadata["number_of_seats"])
+                self.assertListEqual(["Askeladden"], encoded_ballots.metadata["withdrawn_candidates"])
+
+
+def get_nist_cvr(i, contest_id, selection_ranks):
+    """Returns a NIST CVR where each selection is (contest selection id, rank, has indication)"""
+    return {
+        "@type": "CVR.CVR",
+        "CurrentSnapshotId": "snapshot-%i" % i,
+        "CVRSnapshot": [
+            {
+                "@id": "snapshot-%i" % i,
+                "Type": "original",
+                "CVRContest": [
+                    {
+                        "ContestId": contest_id,
+                        "CVRContestSelection": [
+                            {
+                                "ContestSelectionId": selection_id,
+                                "SelectionPosition": [
+                                    {"HasIndication": has_indication, "NumberVotes": 1, "Rank": rank}
+                                ],
+                            }
+                            for selection_id, rank, has_indication in selection_ranks
+                        ],
+                    }
+                ],
+            }
+        ],
+    }
+
+
+class TestNistCvrJsonLoader(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "cvr.json")
+
+        self.election = {
+            "@type": "CVR.Election",
+            "Candidate": [
+                {"@id": "candidate-1", "Name": "Per"},
+                {"@id": "candidate-2", "Name": "Pål"},
+                {"@id": "candidate-3", "Name": "Askeladden"},
+            ],
+            "Contest": [
+                {
+                    "@id": "contest-1",
+                    "Name": "Mayor",
+                    "ContestSelection": [
+                        {"@id": "selection-1", "CandidateIds": ["candidate-1"]},
+                        {"@id": "selection-2", "CandidateIds": ["candidate-2"]},
+                        {"@id": "selection-3", "CandidateIds": ["candidate-3"]},
+                        {"@id": "write-in", "IsWriteIn": True},
+                    ],
+                },
+                {"@id": "contest-2", "Name": "Council", "ContestSelection": []},
+            ],
+        }
+        self.cvrs = [
+            get_nist_cvr(0, "contest-1", [("selection-1", 1, "yes"), ("selection-2", 2, "yes")]),
+            # Overvote in rank 1
+            get_nist_cvr(
+                1, "contest-1", [("selection-1", 1, "yes"), ("selection-2", 1, "yes"), ("selection-3", 2, "yes")]
+            ),
+            # Undervote in rank 1, and a selection without indication
+            get_nist_cvr(
+                2, "contest-1", [("selection-2", 2, "yes"), ("selection-1", 3, "yes"), ("selection-3", 3, "no")]
+            ),
+            # Per ranked twice, and a write-in
+            get_nist_cvr(
+                3, "contest-1", [("selection-1", 1, "yes"), ("selection-1", 2, "yes"), ("write-in", 3, "yes")]
+            ),
+            get_nist_cvr(4, "contest-2", []),
+        ]
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def write_report(self, election_first: bool):
+        report = {"@type": "CVR.CastVoteRecordReport", "Version": "1.0.0"}
+        if election_first:
+            report["Election"] = [self.election]
+        report["CVR"] = self.cvrs
+        if not election_first:
+            report["Election"] = [self.election]
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+    def test_parse_nist_cvr_json(self):
+        for election_first in [True, False]:
+            self.write_report(election_first)
+
+            # Small chunks, so values are split between chunks
+            with mock.patch.object(loaders, "JSON_CHUNK_SIZE", 7):
+                encoded_ballots = loaders.parse_nist_cvr_json(self.file_path, contest="Mayor")
+
+            self.assertListEqual(
+                ["Per", "Pål", "Askeladden", "write-in"], [c.name for c in encoded_ballots.candidates]
+            )
+            self.assertListEqual(
+                [((0, 1), 1), ((2,), 1), ((1, 0), 1), ((0, 3), 1)], list(encoded_ballots.iter_rankings())
+            )
+            self.assertEqual("Mayor", encoded_ballots.metadata["contest"])
+
+    def test_select_contest(self):
+        self.write_report(True)
+
+        encoded_ballots = loaders.load_nist_cvr_json(self.file_path, contest="contest-2", use_cache=False)
+        self.assertListEqual([((), 1)], list(encoded_ballots.iter_rankings()))
+
+        with self.assertRaises(ValueError):
+            loaders.parse_nist_cvr_json(self.file_path)
+        with self.assertRaises(ValueError):
+            loaders.parse_nist_cvr_json(self.file_path, contest="President")
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestParquetLoader(unittest.TestCase):
+    def test_parse_parquet(self):
+        table = pyarrow.table(
+            {
+                "ballot_id": [1, 2, 3, 4, 5],
+                "mayor_rank1": ["Per", "$OVERVOTE", None, "Per", "Pål"],
+                "mayor_rank2": ["Pål", "Per", "Pål", "Per", None],
+                "council_rank1": ["Askeladden", "Espen", "Espen", "Askeladden", "Espen"],
+            }
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "cvr.parquet")
+            pyarrow.parquet.write_table(table, file_path)
+
+            progress = []
+            with mock.patch.object(loaders, "PARQUET_BATCH_SIZE", 2):
+                encoded_ballots = loaders.parse_parquet(
+                    file_path, column_prefix="mayor_rank", progress=lambda *args: progress.append(args)
+                )
+            council_ballots = loaders.load_parquet(file_path, rank_columns=["council_rank1"], use_cache=False)
+
+        self.assertListEqual(["Per", "Pål"], [candidate.name for candidate in encoded_ballots.candidates])
+        self.assertListEqual([((0,), 2), ((0, 1), 1), ((1,), 2)], sorted(encoded_ballots.iter_rankings()))
+        self.assertListEqual([(2, 5), (4, 5), (5, 5)], progress)
+
+        self.assertListEqual(["Askeladden", "Espen"], sorted(c.name for c in council_ballots.candidates))
+        self.assertEqual(5, council_ballots.get_number_of_ballots())
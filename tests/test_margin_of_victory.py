@@ -0,0 +1,93 @@
+import unittest
+import itertools
+import random
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot
+from pyrankvote.margin_of_victory import get_margin_of_victory
+
+
+def apply_changes(ballots, changes):
+    ballots = sorted(ballots, key=lambda ballot: len(ballot.ranked_candidates))
+    for change in changes:
+        for _ in range(change.number_of_ballots):
+            ballot = next(
+                ballot for ballot in ballots
+                if len(ballot.ranked_candidates) > 0 and ballot.ranked_candidates[0] == change.from_candidate
+            )
+            ballots.remove(ballot)
+            ballots.append(Ballot(ranked_candidates=[change.to_candidate]))
+    return ballots
+
+
+def is_winner_changed_by_one_ballot(candidates, ballots, winner):
+    all_rankings = [
+        list(ranking)
+        for length in range(len(candidates) + 1)
+        for ranking in itertools.permutations(candidates, length)
+    ]
+    distinct_ballots = {tuple(ballot.ranked_candidates): ballot for ballot in ballots}.values()
+
+    for ballot in distinct_ballots:
+        for ranking in all_rankings:
+            changed_ballots = list(ballots)
+            changed_ballots.remove(ballot)
+            changed_ballots.append(Ballot(ranked_candidates=ranking))
+            if pyrankvote.instant_runoff_voting(candidates, changed_ballots).get_winners() != [winner]:
+                return True
+    return False
+
+
+class TestMarginOfVictory(unittest.TestCase):
+    def test_simple_case(self):
+        a, b, c = Candidate("A"), Candidate("B"), Candidate("C")
+        ballots = [Ballot(ranked_candidates=[a])] * 10 + [Ballot(ranked_candidates=[b])] * 8 + [
+            Ballot(ranked_candidates=[c, b])
+        ] * 3
+
+        margin = get_margin_of_victory([a, b, c], ballots)
+
+        self.assertEqual(b, margin.winner)
+        self.assertTrue(margin.is_exact())
+        self.assertEqual(1, margin.upper_bound)
+
+    def test_bounds_and_changes(self):
+        rng = random.Random(3)
+
+        for i in range(30):
+            candidates = [Candidate("Candidate %i" % i) for i in range(rng.randint(2, 5))]
+            ballots = [
+                Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+                for _ in range(rng.randint(5, 40))
+            ]
+            winners = pyrankvote.instant_runoff_voting(candidates, ballots).get_winners()
+            if len(winners) != 1:
+                continue
+
+            margin = get_margin_of_victory(candidates, ballots, jobs=2 if i % 10 == 0 else 1)
+
+            self.assertEqual(winners[0], margin.winner)
+            self.assertLessEqual(margin.lower_bound, margin.upper_bound)
+            self.assertEqual(margin.upper_bound, sum(change.number_of_ballots for change in margin.changes))
+
+            changed_ballots = apply_changes(ballots, margin.changes)
+            changed_winners = pyrankvote.instant_runoff_voting(candidates, changed_ballots).get_winners()
+            self.assertNotEqual([margin.winner], changed_winners)
+
+            if len(candidates) <= 3:
+                if is_winner_changed_by_one_ballot(candidates, ballots, margin.winner):
+                    self.assertLessEqual(margin.lower_bound, 1)
+                else:
+                    self.assertGreaterEqual(margin.upper_bound, 2)
+
+    def test_time_budget(self):
+        rng = random.Random(1)
+        candidates = [Candidate("Candidate %i" % i) for i in range(9)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(1, 4)))
+            for _ in range(300)
+        ]
+
+        margin = get_margin_of_victory(candidates, ballots, time_budget=0.5)
+        self.assertLessEqual(margin.lower_bound, margin.upper_bound)
+        self.assertGreater(margin.upper_bound, 0)
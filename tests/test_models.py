@@ -14,6 +14,53 @@ class TestCandidate(unittest.TestCase):
         self.assertNotEqual(candidate1, candidate3, "These candidates should NOT be equal/the same candidate.")
 
 
+class TestCandidateRegistry(unittest.TestCase):
+    def test_one_object_per_name(self):
+        """Test that the registry returns the same candidate object for the same name."""
+
+        registry = pyrankvote.CandidateRegistry()
+        candidate1 = registry.get("Per")
+        candidate2 = registry.get("Per")
+        candidate3 = registry.get("Aase")
+
+        self.assertIs(candidate1, candidate2, "The registry should return the canonical candidate object")
+        self.assertIsNot(candidate1, candidate3)
+        self.assertEqual(2, len(registry))
+
+    def test_stable_ids(self):
+        """Test that candidates get ids in the order they are registered."""
+
+        per = pyrankvote.Candidate("Per")
+        aase = pyrankvote.Candidate("Aase")
+        registry = pyrankvote.CandidateRegistry([per, aase])
+
+        self.assertEqual(0, registry.get_id(per))
+        self.assertEqual(1, registry.get_id(pyrankvote.Candidate("Aase")), "Equal candidates should share id")
+        self.assertIs(aase, registry.get_candidate(1))
+        self.assertListEqual([per, aase], registry.get_candidates())
+
+        self.assertRaises(KeyError, registry.get_id, pyrankvote.Candidate("Maria"))
+
+    def test_candidate_like_objects(self):
+        """Test that candidate-like objects can be interned, and that the first object becomes canonical."""
+
+        class NewCandidate:
+            def __init__(self, name):
+                self.name = name
+
+        per = NewCandidate("Per")
+        registry = pyrankvote.CandidateRegistry()
+
+        self.assertIs(per, registry.add(per))
+        self.assertIs(per, registry.add(NewCandidate("Per")))
+        self.assertIs(per, registry.get("Per"))
+        self.assertIn(pyrankvote.Candidate("Per"), registry)
+
+        ranked_candidates = registry.intern_ballot([pyrankvote.Candidate("Aase"), NewCandidate("Per")])
+        self.assertIs(per, ranked_candidates[1])
+        self.assertIs(registry.get("Aase"), ranked_candidates[0])
+
+
 class TestBallot(unittest.TestCase):
     def test_create_object(self):
         """Test that voting with two equal candidates raises DuplicateCandidateError"""
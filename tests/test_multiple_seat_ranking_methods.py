@@ -3,7 +3,7 @@ from pyrankvote.test_helpers import assert_list_almost_equal
 
 import pyrankvote
 from pyrankvote import Candidate, Ballot
-from pyrankvote.helpers import CandidateStatus
+from pyrankvote.helpers import CandidateStatus, SurplusTransferMethod
 
 
 class TestPreferentialBlockVoting(unittest.TestCase):
@@ -374,4 +374,152 @@ class TestSingleTransferableVote(unittest.TestCase):
         self.assertEqual(2, len(winners), "Should be two winners")
 
         self.assertIn(popular_moderate, winners, "William should be a winner")
-        self.assertIn(far_left, winners, "John should be a winner")
\ No newline at end of file
+        self.assertIn(far_left, winners, "John should be a winner")
+
+
+class TestSurplusTransferMethod(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d, self.e = [Candidate(name) for name in "ABCDE"]
+        self.candidates = [self.a, self.b, self.c, self.d, self.e]
+
+    def get_votes_in_round(self, election_result, round_nr):
+        return {
+            candidate_result.candidate: candidate_result.number_of_votes
+            for candidate_result in election_result.rounds[round_nr].candidate_results
+        }
+
+    def test_last_parcel(self):
+        a, b, c, d, e = self.a, self.b, self.c, self.d, self.e
+        ballots = (
+            [Ballot(ranked_candidates=[a, b])] * 5
+            + [Ballot(ranked_candidates=[d, a, c])] * 2
+            + [Ballot(ranked_candidates=[b, e])] * 4
+            + [Ballot(ranked_candidates=[c, b])] * 3
+            + [Ballot(ranked_candidates=[e, c])] * 3
+        )
+
+        # D is rejected, and A is elected with 7 votes (quota is 17/3) after getting D's 2 ballots
+        all_ballots_result = pyrankvote.single_transferable_vote(self.candidates, ballots, number_of_seats=2)
+        votes = self.get_votes_in_round(all_ballots_result, 2)
+        self.assertAlmostEqual(4 + 5 * (4 / 3.0) / 7, votes[b])
+        self.assertAlmostEqual(3 + 2 * (4 / 3.0) / 7, votes[c])
+
+        # Only the last parcel, D's 2 ballots, is transferred
+        for ballots_or_trie in [ballots, pyrankvote.BallotTrie.from_ballots(self.candidates, ballots)]:
+            last_parcel_result = pyrankvote.single_transferable_vote(
+                self.candidates,
+                ballots_or_trie,
+                number_of_seats=2,
+                surplus_transfer_method=SurplusTransferMethod.LastParcel,
+            )
+            votes = self.get_votes_in_round(last_parcel_result, 2)
+            self.assertAlmostEqual(17 / 3.0, votes[a])
+            self.assertAlmostEqual(4.0, votes[b])
+            self.assertAlmostEqual(3 + 4 / 3.0, votes[c])
+            self.assertListEqual([a, c], last_parcel_result.get_winners())
+
+    def test_last_parcel_is_not_transferred_with_higher_value(self):
+        a, b, c, d, e = self.a, self.b, self.c, self.d, self.e
+        f = Candidate("F")
+        candidates = self.candidates + [f]
+        ballots = (
+            [Ballot(ranked_candidates=[d, a, c])] * 12
+            + [Ballot(ranked_candidates=[e, a, c])] * 10
+            + [Ballot(ranked_candidates=[a, b])] * 9
+            + [Ballot(ranked_candidates=[b])] * 6
+            + [Ballot(ranked_candidates=[c])] * 5
+            + [Ballot(ranked_candidates=[f])] * 5
+        )
+
+        for ballots_or_trie in [ballots, pyrankvote.BallotTrie.from_ballots(candidates, ballots)]:
+            election_result = pyrankvote.single_transferable_vote(
+                candidates,
+                ballots_or_trie,
+                number_of_seats=4,
+                surplus_transfer_method=SurplusTransferMethod.LastParcel,
+            )
+
+            # D and E are elected (quota is 47/5), and pass A over the quota. A's surplus is 2.8 votes,
+            # but the last parcel, E's 10 ballots, was received with only 0.06 votes per ballot.
+            votes = self.get_votes_in_round(election_result, 2)
+            self.assertAlmostEqual(9.4, votes[a])
+            self.assertAlmostEqual(5.6, votes[c])
+            self.assertAlmostEqual(2.2, election_result.rounds[2].number_of_blank_votes)
+
+
+class TestMeekSingleTransferableVote(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d, self.e, self.f = [Candidate(name) for name in "ABCDEF"]
+        self.candidates = [self.a, self.b, self.c, self.d, self.e, self.f]
+        a, b, c, d, e, f = self.candidates
+        self.ballots = (
+            [Ballot(ranked_candidates=[d, a, c])] * 12
+            + [Ballot(ranked_candidates=[e, a, c])] * 10
+            + [Ballot(ranked_candidates=[a, b])] * 9
+            + [Ballot(ranked_candidates=[b])] * 6
+            + [Ballot(ranked_candidates=[c])] * 5
+            + [Ballot(ranked_candidates=[f])] * 5
+        )
+
+    def get_votes_in_round(self, election_result, round_nr):
+        return {
+            candidate_result.candidate: candidate_result.number_of_votes
+            for candidate_result in election_result.rounds[round_nr].candidate_results
+        }
+
+    def test_surplus_passes_elected_candidates(self):
+        a, b, c, d, e, f = self.candidates
+        election_result = pyrankvote.meek_single_transferable_vote(self.candidates, self.ballots, number_of_seats=4)
+
+        # D, E and A have the quota (47/5). A keeps 9.4 of 12.2 votes, and passes the rest of the value
+        # of all its ballots on, also the value it got from D and E.
+        votes = self.get_votes_in_round(election_result, 2)
+        for candidate in [a, d, e]:
+            self.assertAlmostEqual(9.4, votes[candidate], places=4)
+        self.assertAlmostEqual(6 + 9 * 2.8 / 12.2, votes[b], places=4)
+        self.assertAlmostEqual(5 + 3.2 * 2.8 / 12.2, votes[c], places=4)
+
+        # With STV, C is elected instead of B
+        self.assertListEqual([d, e, a, b], election_result.get_winners())
+        stv_result = pyrankvote.single_transferable_vote(self.candidates, self.ballots, number_of_seats=4)
+        self.assertListEqual([d, e, a, c], stv_result.get_winners())
+
+    def test_warm_start(self):
+        for ballots in [self.ballots, pyrankvote.BallotTrie.from_ballots(self.candidates, self.ballots)]:
+            warm_result = pyrankvote.meek_single_transferable_vote(self.candidates, ballots, number_of_seats=4)
+            cold_result = pyrankvote.meek_single_transferable_vote(
+                self.candidates, ballots, number_of_seats=4, warm_start=False
+            )
+            self.assertListEqual(warm_result.get_winners(), cold_result.get_winners())
+
+            # The iterations of the last round stop when B reaches the quota, so only the other rounds have
+            # converged keep factors
+            self.assertEqual(len(warm_result.rounds), len(cold_result.rounds))
+            for warm_round, cold_round in zip(warm_result.rounds[:-1], cold_result.rounds[:-1]):
+                assert_list_almost_equal(
+                    self,
+                    [result.number_of_votes for result in warm_round.candidate_results],
+                    [result.number_of_votes for result in cold_round.candidate_results],
+                    considered_equal_margin=0.001,
+                )
+
+    def test_one_seat_is_instant_runoff_voting(self):
+        election_result = pyrankvote.meek_single_transferable_vote(self.candidates, self.ballots, number_of_seats=1)
+        irv_result = pyrankvote.instant_runoff_voting(self.candidates, self.ballots)
+        self.assertListEqual(irv_result.get_winners(), election_result.get_winners())
+
+    def test_max_iterations(self):
+        election_result = pyrankvote.meek_single_transferable_vote(
+            self.candidates, self.ballots, number_of_seats=4, max_iterations=1
+        )
+        self.assertEqual(4, len(election_result.get_winners()))
+
+        with self.assertRaises(ValueError):
+            pyrankvote.meek_single_transferable_vote(self.candidates, self.ballots, 4, tolerance=0.0)
+
+    def test_candidate_not_in_trie(self):
+        g = Candidate("G")
+        trie = pyrankvote.BallotTrie.from_ballots(self.candidates, self.ballots)
+        with self.assertRaises(ValueError) as context:
+            pyrankvote.meek_single_transferable_vote(self.candidates + [g], trie, number_of_seats=4)
+        self.assertIn("G", str(context.exception))
@@ -0,0 +1,114 @@
+import random
+import unittest
+
+from pyrankvote import Candidate, Ballot, BallotProfile, EncodedBallots
+from pyrankvote.pairwise import (
+    PairwiseMatrix,
+    get_condorcet_winner,
+    get_pairwise_matrix,
+    ranked_pairs,
+    schulze,
+)
+
+
+def get_ballots(candidates, ranking_counts):
+    ballots = []
+    for ranking, count in ranking_counts:
+        ranked_candidates = [candidates[name] for name in ranking]
+        ballots.extend(Ballot(ranked_candidates=ranked_candidates) for _ in range(count))
+    return ballots
+
+
+class TestPairwiseMatrix(unittest.TestCase):
+    def test_same_as_counting_every_pair(self):
+        rng = random.Random(3)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+            for _ in range(500)
+        ]
+
+        for jobs in [1, 2]:
+            matrix = get_pairwise_matrix(candidates, EncodedBallots.from_ballots(candidates, ballots), jobs=jobs)
+            for candidate in candidates:
+                for other_candidate in candidates:
+                    if candidate is other_candidate:
+                        continue
+                    number_of_ballots = sum(
+                        1
+                        for ballot in ballots
+                        if candidate in ballot.ranked_candidates
+                        and (
+                            other_candidate not in ballot.ranked_candidates
+                            or ballot.ranked_candidates.index(candidate)
+                            < ballot.ranked_candidates.index(other_candidate)
+                        )
+                    )
+                    self.assertEqual(number_of_ballots, matrix.get_number_of_ballots(candidate, other_candidate))
+
+    def test_submatrix_and_cache(self):
+        a, b, c = Candidate("A"), Candidate("B"), Candidate("C")
+        ballots = [Ballot(ranked_candidates=[c, a, b]), Ballot(ranked_candidates=[b, c])]
+        profile = BallotProfile([a, b, c], ballots)
+
+        matrix = profile.get_pairwise_matrix()
+        self.assertIs(matrix, profile.get_pairwise_matrix())
+
+        # With C withdrawn
+        submatrix = get_pairwise_matrix([a, b], profile)
+        self.assertEqual([a, b], submatrix.candidates)
+        self.assertEqual(1, submatrix.get_number_of_ballots(a, b))
+        self.assertEqual(1, submatrix.get_number_of_ballots(b, a))
+        self.assertEqual(0, submatrix.get_margin(a, b))
+
+        with self.assertRaises(ValueError):
+            PairwiseMatrix([a, b], matrix.preferences)
+
+
+class TestCondorcetMethods(unittest.TestCase):
+    def test_tennessee(self):
+        # Tennessee capital example from Wikipedia (percentages of the voters)
+        names = ["Memphis", "Nashville", "Chattanooga", "Knoxville"]
+        candidates = {name: Candidate(name) for name in names}
+        memphis, nashville, chattanooga, knoxville = [candidates[name] for name in names]
+        ballots = get_ballots(
+            candidates,
+            [
+                (["Memphis", "Nashville", "Chattanooga", "Knoxville"], 42),
+                (["Nashville", "Chattanooga", "Knoxville", "Memphis"], 26),
+                (["Chattanooga", "Knoxville", "Nashville", "Memphis"], 15),
+                (["Knoxville", "Chattanooga", "Nashville", "Memphis"], 17),
+            ],
+        )
+        profile = BallotProfile(list(candidates.values()), ballots)
+
+        expected_ranking = [nashville, chattanooga, knoxville, memphis]
+        self.assertEqual(nashville, get_condorcet_winner(profile.candidates, profile))
+        self.assertListEqual(expected_ranking, schulze(profile.candidates, profile))
+        self.assertListEqual(expected_ranking, ranked_pairs(profile.candidates, profile))
+
+    def test_schulze_without_condorcet_winner(self):
+        # Example with a cycle from the Wikipedia article on the Schulze method
+        candidates = {name: Candidate(name) for name in "ABCDE"}
+        a, b, c, d, e = [candidates[name] for name in "ABCDE"]
+        ballots = get_ballots(
+            candidates,
+            [
+                ("ACBED", 5),
+                ("ADECB", 5),
+                ("BEDAC", 8),
+                ("CABED", 3),
+                ("CAEBD", 7),
+                ("CBADE", 2),
+                ("DCEBA", 7),
+                ("EBADC", 8),
+            ],
+        )
+        candidate_list = [a, b, c, d, e]
+
+        self.assertIsNone(get_condorcet_winner(candidate_list, ballots))
+        self.assertListEqual([e, a, c, b, d], schulze(candidate_list, ballots))
+
+        # Ranked pairs locks B > D (33), E > D (31), A > D (30) and C > B (29), skips D > C (28), locks E > B (27)
+        # and A > C (26), skips B > A (25), locks C > E (24) and skips E > A (23)
+        self.assertListEqual([a, c, e, b, d], ranked_pairs(candidate_list, ballots))
@@ -0,0 +1,81 @@
+import random
+import unittest
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot
+from pyrankvote.provisional_count import ProvisionalCount
+
+
+class TestProvisionalCount(unittest.TestCase):
+    def test_uniform_sample(self):
+        candidates = [Candidate("Candidate %i" % i) for i in range(20)]
+        ballots = [Ballot(ranked_candidates=[candidate]) for candidate in candidates]
+
+        number_of_times_sampled = [0] * len(candidates)
+        for seed in range(2000):
+            provisional_count = ProvisionalCount(candidates, sample_size=4, seed=seed)
+            provisional_count.add_ballots(ballots)
+            for ranking, count in provisional_count.get_sample().iter_rankings():
+                number_of_times_sampled[ranking[0]] += count
+
+        # Each ballot is in the sample with probability 4 / 20 (the standard deviation is about 18)
+        for number in number_of_times_sampled:
+            self.assertLess(abs(number - 400), 80)
+
+    def test_small_stream_is_counted_in_full(self):
+        bush = Candidate("George W. Bush (Republican)")
+        gore = Candidate("Al Gore (Democratic)")
+        nader = Candidate("Ralph Nader (Green)")
+        candidates = [bush, gore, nader]
+
+        ballots = [
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[nader, gore, bush]),
+            Ballot(ranked_candidates=[nader, gore]),
+            Ballot(ranked_candidates=[gore, nader, bush]),
+            Ballot(ranked_candidates=[gore, nader]),
+            Ballot(ranked_candidates=[gore, nader]),
+        ]
+
+        provisional_count = ProvisionalCount(candidates, sample_size=100)
+        for ballot in ballots:
+            provisional_count.add_ballot(ballot)
+
+        provisional_results = provisional_count.get_results(number_of_resamples=20, seed=1)
+        self.assertEqual(len(ballots), provisional_results.sample_size)
+        self.assertListEqual(
+            pyrankvote.instant_runoff_voting(candidates, ballots).get_winners(),
+            provisional_results.get_winners(),
+        )
+
+    def test_confidence_bounds(self):
+        rng = random.Random(5)
+        candidates = [Candidate("Candidate %i" % i) for i in range(4)]
+        popular_candidate = candidates[0]
+
+        provisional_count = ProvisionalCount(
+            candidates, sample_size=500, method=pyrankvote.single_transferable_vote, seed=2, number_of_seats=2
+        )
+        for _ in range(20):
+            ballots = []
+            for _ in range(1000):
+                ranked_candidates = rng.sample(candidates, 3)
+                if rng.random() < 0.3:
+                    ranked_candidates = [popular_candidate] + [c for c in ranked_candidates if c != popular_candidate]
+                ballots.append(Ballot(ranked_candidates=ranked_candidates))
+            provisional_count.add_ballots(ballots)
+
+        self.assertEqual(20000, provisional_count.number_of_ballots_seen)
+
+        provisional_results = provisional_count.get_results(number_of_resamples=100, seed=3, jobs=2)
+        self.assertEqual(500, provisional_results.sample_size)
+        self.assertIn(popular_candidate, provisional_results.get_confident_winners())
+
+        # About 30% + 70% / 4 of the ballots have the popular candidate as first choice
+        lower_bound, upper_bound = provisional_results.first_choice_bounds[popular_candidate]
+        self.assertLess(lower_bound, 0.475)
+        self.assertGreater(upper_bound, 0.475)
+        self.assertLess(upper_bound - lower_bound, 0.2)
+        self.assertIn("Sample of 500 of 20000 ballots", str(provisional_results))
@@ -0,0 +1,178 @@
+import os
+import random
+import unittest
+import tempfile
+import zlib
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, BallotTrie
+from pyrankvote import BallotProfile, BallotStream, EncodedBallots, SQLiteBallotStore
+from pyrankvote.helpers import CompareMethodIfEqual
+from pyrankvote.result_cache import ResultCache, get_cache_key
+
+
+def get_candidates_and_ballots():
+    per = Candidate("Per")
+    paal = Candidate("Pål")
+    askeladden = Candidate("Askeladden")
+
+    candidates = [per, paal, askeladden]
+
+    ballots = [
+        Ballot(ranked_candidates=[askeladden, per]),
+        Ballot(ranked_candidates=[per, paal]),
+        Ballot(ranked_candidates=[per, paal]),
+        Ballot(ranked_candidates=[paal, per]),
+        Ballot(ranked_candidates=[paal, per, askeladden]),
+    ]
+
+    return candidates, ballots
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.temporary_directory.name)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_cache_hit_skips_counting(self):
+        candidates, ballots = get_candidates_and_ballots()
+
+        election_result = self.cache.count(pyrankvote.instant_runoff_voting, candidates, ballots)
+
+        with mock.patch("pyrankvote.helpers.ElectionManager.__init__") as election_manager_init:
+            cached_election_result = self.cache.count(pyrankvote.instant_runoff_voting, candidates, ballots)
+            election_manager_init.assert_not_called()
+
+        self.assertEqual(str(election_result), str(cached_election_result))
+        self.assertIs(candidates[0], cached_election_result.get_winners()[0], "Should use the given candidate objects")
+
+        for round_, cached_round in zip(election_result.rounds, cached_election_result.rounds):
+            if round_.transfers is None:
+                self.assertIsNone(cached_round.transfers)
+            else:
+                self.assertListEqual(round_.transfers.candidates, cached_round.transfers.candidates)
+                self.assertDictEqual(round_.transfers.rows, cached_round.transfers.rows)
+
+    def test_round_callback(self):
+        candidates, ballots = get_candidates_and_ballots()
+        method = pyrankvote.single_transferable_vote
+
+        for _ in range(2):
+            rounds = []
+            election_result = self.cache.count(
+                method, candidates, ballots, number_of_seats=2, round_callback=rounds.append
+            )
+            self.assertEqual(len(election_result.rounds), len(rounds), "Should be called on a hit too")
+        self.assertIn(get_cache_key(method, candidates, ballots, number_of_seats=2), self.cache)
+
+    def test_canonical_key(self):
+        candidates, ballots = get_candidates_and_ballots()
+        method = pyrankvote.single_transferable_vote
+
+        key = get_cache_key(method, candidates, ballots, number_of_seats=2)
+
+        self.assertEqual(key, get_cache_key(method, candidates, ballots[::-1], number_of_seats=2))
+        self.assertEqual(key, get_cache_key(method, candidates, BallotTrie.from_ballots(candidates, ballots), number_of_seats=2))
+        self.assertEqual(key, get_cache_key(
+            method, candidates, ballots, number_of_seats=2,
+            compare_method_if_equal=CompareMethodIfEqual.MostSecondChoiceVotes
+        ), "Default options should give the same key")
+
+        self.assertNotEqual(key, get_cache_key(method, candidates, ballots, number_of_seats=1))
+        self.assertNotEqual(key, get_cache_key(pyrankvote.preferential_block_voting, candidates, ballots, number_of_seats=2))
+        self.assertNotEqual(key, get_cache_key(method, candidates, ballots[1:], number_of_seats=2))
+
+    def test_ballot_types(self):
+        candidates, ballots = get_candidates_and_ballots()
+        method = pyrankvote.single_transferable_vote
+        election_result = self.cache.count(method, candidates, ballots, number_of_seats=2)
+        key = get_cache_key(method, candidates, ballots, number_of_seats=2)
+
+        # The encoded ballots have another candidate order, which is mapped to the given candidates
+        encoded_ballots = EncodedBallots.from_ballots(candidates[::-1], ballots)
+        for other_ballots in [
+            encoded_ballots,
+            BallotTrie.from_ballots(candidates[::-1], ballots),
+            BallotProfile(candidates, encoded_ballots),
+        ]:
+            self.assertEqual(key, get_cache_key(method, candidates, other_ballots, number_of_seats=2))
+            with mock.patch("pyrankvote.helpers.ElectionManager.__init__") as election_manager_init:
+                cached_election_result = self.cache.count(method, candidates, other_ballots, number_of_seats=2)
+                election_manager_init.assert_not_called()
+            self.assertEqual(str(election_result), str(cached_election_result))
+
+        # Stores and streams are counted without the cache
+        stream = BallotStream.from_ballot_factory(candidates, lambda: iter(ballots))
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteBallotStore.from_ballots(os.path.join(directory, "ballots.sqlite"), candidates, ballots)
+            for other_ballots in [stream, store]:
+                self.assertRaises(ValueError, get_cache_key, pyrankvote.instant_runoff_voting, candidates, other_ballots)
+                size = self.cache.get_size()
+                results = self.cache.count(pyrankvote.instant_runoff_voting, candidates, other_ballots)
+                self.assertEqual(str(pyrankvote.instant_runoff_voting(candidates, ballots)), str(results))
+                self.assertEqual(size, self.cache.get_size())
+            store.close()
+
+    def test_random_counts_are_only_cached_if_seeded(self):
+        candidates, ballots = get_candidates_and_ballots()
+        method = pyrankvote.instant_runoff_voting
+
+        self.cache.count(method, candidates, ballots, compare_method_if_equal=CompareMethodIfEqual.Random)
+        self.assertEqual(0, self.cache.get_size())
+
+        self.cache.count(method, candidates, ballots, seed=1, compare_method_if_equal=CompareMethodIfEqual.Random)
+        self.assertGreater(self.cache.get_size(), 0)
+
+    def test_final_ties_are_seeded_from_the_key(self):
+        a, b = candidates = [Candidate("A"), Candidate("B")]
+        ballots = [Ballot(ranked_candidates=[a, b]), Ballot(ranked_candidates=[b, a])]
+        method = pyrankvote.instant_runoff_voting
+
+        # A and B are equal on all choices, so the tie is broken randomly
+        winners = set()
+        for i in range(20):
+            with tempfile.TemporaryDirectory() as directory:
+                random.seed(i)
+                winners.add(ResultCache(directory).count(method, candidates, ballots).get_winners()[0])
+        self.assertEqual(1, len(winners), "Should give the same results whenever they are cached")
+
+    def test_corrupt_entries_are_counted_again(self):
+        candidates, ballots = get_candidates_and_ballots()
+        method = pyrankvote.single_transferable_vote
+        election_result = self.cache.count(method, candidates, ballots, number_of_seats=2)
+
+        key = get_cache_key(method, candidates, ballots, number_of_seats=2)
+        file_path = self.cache._get_file_path(key)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        for corrupt_data in [data[: len(data) // 2], b"", zlib.compress(b"{}")]:
+            with open(file_path, "wb") as f:
+                f.write(corrupt_data)
+            self.assertIsNone(self.cache.get(key, candidates))
+            self.assertNotIn(key, self.cache, "Corrupt entry should be removed")
+
+            with open(file_path, "wb") as f:
+                f.write(corrupt_data)
+            cached_election_result = self.cache.count(method, candidates, ballots, number_of_seats=2)
+            self.assertEqual(str(election_result), str(cached_election_result))
+            self.assertIsNotNone(self.cache.get(key, candidates))
+
+    def test_lru_eviction(self):
+        candidates, ballots = get_candidates_and_ballots()
+
+        self.cache.count(pyrankvote.single_transferable_vote, candidates, ballots, number_of_seats=1)
+        size_of_one_result = self.cache.get_size()
+
+        cache = ResultCache(self.temporary_directory.name, max_size_bytes=2 * size_of_one_result + 10)
+        cache.count(pyrankvote.single_transferable_vote, candidates, ballots, number_of_seats=2)
+        cache.count(pyrankvote.single_transferable_vote, candidates, ballots, number_of_seats=1)
+        cache.count(pyrankvote.preferential_block_voting, candidates, ballots, number_of_seats=1)
+
+        method = pyrankvote.single_transferable_vote
+        self.assertNotIn(get_cache_key(method, candidates, ballots, number_of_seats=2), cache, "Least recently used")
+        self.assertIn(get_cache_key(method, candidates, ballots, number_of_seats=1), cache)
+        self.assertIn(get_cache_key(pyrankvote.preferential_block_voting, candidates, ballots, number_of_seats=1), cache)
@@ -0,0 +1,51 @@
+import random
+import unittest
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot
+from pyrankvote.seat_sweep import count_seat_range
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+class TestSeatSweep(unittest.TestCase):
+    def test_same_results_as_separate_counts(self):
+        rng = random.Random(6)
+        candidates = [Candidate("Candidate %i" % i) for i in range(8)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(1, len(candidates))))
+            for _ in range(400)
+        ]
+
+        for method in [pyrankvote.single_transferable_vote, pyrankvote.preferential_block_voting]:
+            for jobs in [1, 2]:
+                results = count_seat_range(candidates, ballots, range(1, 6), method=method, jobs=jobs)
+                self.assertListEqual([1, 2, 3, 4, 5], list(results))
+
+                for number_of_seats, election_result in results.items():
+                    correct_result = method(candidates, ballots, number_of_seats)
+                    self.assertListEqual(get_round_results(correct_result), get_round_results(election_result))
+
+    def test_withdrawn_candidates(self):
+        rng = random.Random(7)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+        ballots = [Ballot(ranked_candidates=rng.sample(candidates, 3)) for _ in range(200)]
+
+        remaining_candidates = candidates[:-1]
+        results = count_seat_range(
+            remaining_candidates,
+            pyrankvote.BallotProfile(candidates, ballots),
+            [2, 3],
+            withdrawn_candidates=candidates[-1:],
+        )
+        for number_of_seats, election_result in results.items():
+            self.assertEqual(number_of_seats, len(election_result.get_winners()))
+            self.assertNotIn(candidates[-1], election_result.get_winners())
@@ -0,0 +1,59 @@
+import unittest
+import os
+import pickle
+import random
+import tempfile
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, EncodedBallots
+from pyrankvote.parallel import map_with_shared_state
+from pyrankvote.shared_ballots import SharedEncodedBallots, shared_memory
+
+
+def count_without(shared_ballots, withdrawn_candidate_index):
+    candidates = [
+        candidate for i, candidate in enumerate(shared_ballots.candidates) if i != withdrawn_candidate_index
+    ]
+    election_results = pyrankvote.instant_runoff_voting(
+        candidates, shared_ballots, withdrawn_candidates=[shared_ballots.candidates[withdrawn_candidate_index]]
+    )
+    return type(shared_ballots).__name__, [candidate.name for candidate in election_results.get_winners()]
+
+
+class TestSharedEncodedBallots(unittest.TestCase):
+    def get_encoded_ballots(self):
+        rng = random.Random(1)
+        candidates = [Candidate("Candidate %i" % i) for i in range(5)]
+        ballots = [
+            Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+            for _ in range(500)
+        ]
+        return EncodedBallots.from_ballots(candidates, ballots)
+
+    def check_storage(self, storage, directory=None):
+        encoded_ballots = self.get_encoded_ballots()
+
+        with SharedEncodedBallots.create(encoded_ballots, storage=storage, directory=directory) as shared_ballots:
+            self.assertListEqual(list(encoded_ballots.iter_rankings()), list(shared_ballots.iter_rankings()))
+            self.assertLess(len(pickle.dumps(shared_ballots)), 200, "Should be pickled as its name")
+
+            attached_ballots = SharedEncodedBallots.attach(shared_ballots.name, storage)
+            self.assertEqual(encoded_ballots.get_number_of_ballots(), attached_ballots.get_number_of_ballots())
+            attached_ballots.close()
+
+            # Workers attach to the shared ballots
+            results = map_with_shared_state(count_without, shared_ballots, range(5), jobs=2)
+            for i, (type_name, winners) in enumerate(results):
+                self.assertEqual("SharedEncodedBallots", type_name)
+                self.assertEqual(count_without(encoded_ballots, i)[1], winners)
+
+        self.assertRaises((OSError, ValueError), SharedEncodedBallots.attach, shared_ballots.name, storage)
+
+    @unittest.skipIf(shared_memory is None, "multiprocessing.shared_memory requires Python 3.8")
+    def test_shared_memory(self):
+        self.check_storage("shared_memory")
+
+    def test_memory_mapped_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_storage("file", directory)
+            self.assertListEqual([], os.listdir(directory), "Should remove the file")
@@ -0,0 +1,164 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, SQLiteBallotStore
+from pyrankvote.helpers import SurplusTransferMethod
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+def get_rounded_rows(transfers):
+    return {from_index: [round(votes, 6) for votes in row] for from_index, row in transfers.rows.items()}
+
+
+def get_random_ballots(rng, candidates, number_of_ballots):
+    return [
+        Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+        for _ in range(number_of_ballots)
+    ]
+
+
+class TestSQLiteBallotStore(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.temporary_directory.name, "ballots.sqlite")
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_rankings_and_tallies(self):
+        a, b, c = Candidate("A"), Candidate("B"), Candidate("C")
+        ballots = [
+            Ballot(ranked_candidates=[a, b]),
+            Ballot(ranked_candidates=[c]),
+            Ballot(ranked_candidates=[a, b]),
+            Ballot(ranked_candidates=[]),
+        ]
+        with SQLiteBallotStore.from_ballots(self.database_path, [a, b, c], ballots) as store:
+            store.add_ranking_counts([((2,), 1.5)])
+            self.assertEqual(5.5, store.get_number_of_ballots())
+            self.assertEqual(3, store.get_number_of_rankings())
+            self.assertEqual({(0, 1): 2, (2,): 2.5, (): 1}, dict(store.iter_rankings()))
+            self.assertEqual({a: 2, b: 0, c: 2.5}, store.get_first_preference_tallies())
+
+        # The candidates are read from the database
+        with SQLiteBallotStore(self.database_path) as store:
+            self.assertEqual([a, b, c], store.candidates)
+        with self.assertRaises(ValueError):
+            SQLiteBallotStore(self.database_path, [a, b])
+
+    def test_same_results_as_ballots(self):
+        rng = random.Random(5)
+        candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+
+        for i in range(4):
+            ballots = get_random_ballots(rng, candidates, 300)
+            database_path = os.path.join(self.temporary_directory.name, "ballots%i.sqlite" % i)
+            store = SQLiteBallotStore.from_ballots(database_path, candidates, ballots)
+
+            for method, kwargs in [
+                (pyrankvote.instant_runoff_voting, {}),
+                (pyrankvote.preferential_block_voting, {"number_of_seats": 2}),
+                (pyrankvote.single_transferable_vote, {"number_of_seats": 2}),
+                (
+                    pyrankvote.single_transferable_vote,
+                    {"number_of_seats": 3, "surplus_transfer_method": SurplusTransferMethod.LastParcel},
+                ),
+            ]:
+                correct_results = method(candidates, ballots, **kwargs)
+                store.reset_count()
+                results = method(candidates, store, **kwargs)
+                self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+                for correct_round, round_result in zip(correct_results.rounds, results.rounds):
+                    if correct_round.transfers is None:
+                        self.assertIsNone(round_result.transfers)
+                    else:
+                        self.assertDictEqual(
+                            get_rounded_rows(correct_round.transfers), get_rounded_rows(round_result.transfers)
+                        )
+
+            # Withdrawn candidates are skipped on every ballot, and other missing candidates raise KeyError
+            store.reset_count()
+            remaining_candidates = candidates[1:]
+            rewritten_ballots = [
+                Ballot(ranked_candidates=[c for c in ballot.ranked_candidates if c != candidates[0]])
+                for ballot in ballots
+            ]
+            self.assertListEqual(
+                get_round_results(pyrankvote.instant_runoff_voting(remaining_candidates, rewritten_ballots)),
+                get_round_results(
+                    pyrankvote.instant_runoff_voting(
+                        remaining_candidates, store, withdrawn_candidates=[candidates[0]]
+                    )
+                ),
+            )
+            self.assertRaises(KeyError, pyrankvote.instant_runoff_voting, remaining_candidates, store)
+            store.close()
+
+    def test_resume_interrupted_count(self):
+        rng = random.Random(6)
+        candidates = [Candidate("Candidate %i" % i) for i in range(8)]
+        ballots = get_random_ballots(rng, candidates, 500)
+        correct_results = pyrankvote.single_transferable_vote(candidates, ballots, number_of_seats=3)
+
+        other_database_path = os.path.join(self.temporary_directory.name, "other.sqlite")
+        with SQLiteBallotStore.from_ballots(other_database_path, candidates, ballots) as other_store:
+            with mock.patch.object(other_store, "move_votes", wraps=other_store.move_votes) as move_votes:
+                pyrankvote.single_transferable_vote(candidates, other_store, number_of_seats=3)
+            number_of_transfers = move_votes.call_count
+        self.assertGreater(number_of_transfers, 3)
+
+        store = SQLiteBallotStore.from_ballots(self.database_path, candidates, ballots)
+        move_votes = store.move_votes
+        calls = []
+
+        def crash_on_third_transfer(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                # Some votes are moved before the crash, and are rolled back
+                move_votes(*args)
+                raise MemoryError("Crash")
+            return move_votes(*args)
+
+        with mock.patch.object(store, "move_votes", side_effect=crash_on_third_transfer):
+            with self.assertRaises(MemoryError):
+                pyrankvote.single_transferable_vote(candidates, store, number_of_seats=3)
+        store.close()
+
+        # The count continues from the last operation that was logged
+        store = SQLiteBallotStore(self.database_path)
+        with mock.patch.object(store, "move_votes", wraps=store.move_votes) as resumed_move_votes:
+            results = pyrankvote.single_transferable_vote(candidates, store, number_of_seats=3)
+        self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+        self.assertEqual(number_of_transfers - 2, resumed_move_votes.call_count)
+
+        # A finished count is replayed without moving any votes
+        with mock.patch.object(store, "move_votes") as replayed_move_votes:
+            results = pyrankvote.single_transferable_vote(candidates, store, number_of_seats=3)
+        self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+        replayed_move_votes.assert_not_called()
+
+        # Another count must reset the count in the store first
+        with self.assertRaises(ValueError):
+            pyrankvote.preferential_block_voting(candidates, store, number_of_seats=3)
+        with self.assertRaises(RuntimeError):
+            store.add_ballots(ballots)
+        store.close()
+
+    def test_unsupported_options(self):
+        a, b = Candidate("A"), Candidate("B")
+        with SQLiteBallotStore.from_ballots(self.database_path, [a, b], [Ballot(ranked_candidates=[a])]) as store:
+            with self.assertRaises(ValueError):
+                pyrankvote.instant_runoff_voting([a, b], store, pick_random_if_blank=True)
@@ -0,0 +1,115 @@
+import os
+import random
+import tempfile
+import unittest
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot, BallotStream, EncodedBallots
+from pyrankvote.loaders import write_blt
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+def get_transfers(election_result):
+    return [
+        None if round_result.transfers is None else round_result.transfers.rows
+        for round_result in election_result.rounds
+    ]
+
+
+class TestBallotStream(unittest.TestCase):
+    def test_same_results_as_ballots(self):
+        rng = random.Random(7)
+
+        for _ in range(10):
+            candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+            ballots = [
+                Ballot(ranked_candidates=rng.sample(candidates, rng.randint(0, len(candidates))))
+                for _ in range(300)
+            ]
+            stream = BallotStream.from_ballot_factory(candidates, lambda: iter(ballots))
+
+            for method, kwargs in [
+                (pyrankvote.instant_runoff_voting, {}),
+                (pyrankvote.preferential_block_voting, {"number_of_seats": 2}),
+                (pyrankvote.preferential_block_voting, {"number_of_seats": 3}),
+            ]:
+                correct_results = method(candidates, ballots, **kwargs)
+                results = method(candidates, stream, **kwargs)
+                self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+                self.assertListEqual(get_transfers(correct_results), get_transfers(results))
+
+            # Withdrawn candidates are skipped on every ballot, and other missing candidates raise KeyError
+            remaining_candidates = candidates[1:]
+            rewritten_ballots = [
+                Ballot(ranked_candidates=[c for c in ballot.ranked_candidates if c != candidates[0]])
+                for ballot in ballots
+            ]
+            self.assertListEqual(
+                get_round_results(pyrankvote.instant_runoff_voting(remaining_candidates, rewritten_ballots)),
+                get_round_results(
+                    pyrankvote.instant_runoff_voting(
+                        remaining_candidates, stream, withdrawn_candidates=[candidates[0]]
+                    )
+                ),
+            )
+            self.assertRaises(KeyError, pyrankvote.instant_runoff_voting, remaining_candidates, stream)
+
+    def test_one_pass_per_round(self):
+        a, b, c, d = candidates = [Candidate(name) for name in "ABCD"]
+        ranking_counts = [((0, 1), 6), ((1, 0), 4), ((2, 1), 3), ((3, 2), 2)]
+        number_of_passes = []
+
+        def open_rankings():
+            number_of_passes.append(1)
+            return iter(ranking_counts)
+
+        results = pyrankvote.instant_runoff_voting(candidates, BallotStream(candidates, open_rankings))
+
+        # D, then B, is rejected: the first votes and the votes after each rejection are read once
+        self.assertEqual([a], results.get_winners())
+        self.assertEqual(3, len(results.rounds))
+        self.assertEqual(3, len(number_of_passes))
+
+    def test_from_file(self):
+        per, paal, askeladden = candidates = [Candidate("Per"), Candidate("Pål"), Candidate("Askeladden")]
+        # No ties, so the results don't depend on random tie breaks
+        ballots = [
+            Ballot(ranked_candidates=[askeladden, per]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[per, paal]),
+            Ballot(ranked_candidates=[paal]),
+            Ballot(ranked_candidates=[per]),
+            Ballot(ranked_candidates=[per, askeladden]),
+        ]
+        correct_results = pyrankvote.preferential_block_voting(candidates, ballots, number_of_seats=2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            blt_path = os.path.join(directory, "election.blt")
+            write_blt(blt_path, candidates, ballots, number_of_seats=2)
+            encoded_path = os.path.join(directory, "election.ballots")
+            EncodedBallots.from_ballots(candidates, ballots).save(encoded_path)
+
+            for file_path in [blt_path, encoded_path]:
+                stream = BallotStream.from_file(file_path)
+                self.assertEqual(candidates, stream.candidates)
+                results = pyrankvote.preferential_block_voting(stream.candidates, stream, number_of_seats=2)
+                self.assertListEqual(get_round_results(correct_results), get_round_results(results))
+            self.assertEqual(2, BallotStream.from_file(blt_path).metadata["number_of_seats"])
+
+    def test_surplus_transfers_are_not_supported(self):
+        a, b, c = candidates = [Candidate(name) for name in "ABC"]
+        stream = BallotStream(candidates, lambda: iter([((0, 1), 6), ((1,), 2), ((2,), 2)]))
+
+        with self.assertRaises(ValueError):
+            pyrankvote.single_transferable_vote(candidates, stream, number_of_seats=2)
+        with self.assertRaises(ValueError):
+            pyrankvote.instant_runoff_voting(candidates, stream, pick_random_if_blank=True)
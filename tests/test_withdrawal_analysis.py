@@ -0,0 +1,105 @@
+import unittest
+import random
+
+import pyrankvote
+from pyrankvote import Candidate, Ballot
+from pyrankvote.withdrawal_analysis import WithdrawalAnalysis
+
+
+def get_round_results(election_result):
+    return [
+        [
+            (candidate_result.candidate, round(candidate_result.number_of_votes, 6), candidate_result.status)
+            for candidate_result in round_result.candidate_results
+        ] + [round(round_result.number_of_blank_votes, 6)]
+        for round_result in election_result.rounds
+    ]
+
+
+def count_with_rewritten_ballots(method, candidates, ballots, withdrawn_candidate, **kwargs):
+    remaining_candidates = [candidate for candidate in candidates if candidate != withdrawn_candidate]
+    rewritten_ballots = [
+        Ballot(ranked_candidates=[
+            candidate for candidate in ballot.ranked_candidates if candidate != withdrawn_candidate
+        ])
+        for ballot in ballots
+    ]
+    return method(remaining_candidates, rewritten_ballots, **kwargs)
+
+
+class TestWithdrawalAnalysis(unittest.TestCase):
+    def get_candidates_and_ballots(self):
+        bush = Candidate("George W. Bush (Republican)")
+        gore = Candidate("Al Gore (Democratic)")
+        nader = Candidate("Ralph Nader (Green)")
+
+        candidates = [bush, gore, nader]
+
+        ballots = [
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader, gore]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[bush, nader]),
+            Ballot(ranked_candidates=[nader, gore, bush]),
+            Ballot(ranked_candidates=[nader, gore]),
+            Ballot(ranked_candidates=[gore, nader, bush]),
+            Ballot(ranked_candidates=[gore, nader]),
+            Ballot(ranked_candidates=[gore, nader]),
+        ]
+
+        return candidates, ballots
+
+    def test_single_withdrawals(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        bush, gore, nader = candidates
+
+        analysis = WithdrawalAnalysis(candidates, ballots)
+        results = analysis.count_single_withdrawals()
+
+        self.assertListEqual([nader], results[gore].get_winners(), "Nader should win if Gore withdraws")
+        self.assertListEqual([gore], results[nader].get_winners())
+        self.assertListEqual([nader], results[bush].get_winners(), "Nader should win if Bush withdraws")
+
+        for candidate in candidates:
+            correct_results = count_with_rewritten_ballots(pyrankvote.instant_runoff_voting, candidates, ballots, candidate)
+            self.assertListEqual(get_round_results(correct_results), get_round_results(results[candidate]))
+
+        self.assertListEqual([nader], list(analysis.count_without([bush, gore]).get_winners()))
+
+    def test_reuses_base_rounds(self):
+        candidates, ballots = self.get_candidates_and_ballots()
+        bush, gore, nader = candidates
+
+        analysis = WithdrawalAnalysis(candidates, ballots)
+
+        # Nader is the only candidate rejected in the first round
+        self.assertIsNotNone(analysis._reuse_base_rounds(nader))
+        self.assertIsNone(analysis._reuse_base_rounds(gore))
+
+        base_rounds = get_round_results(analysis.get_base_results())
+        base_rounds_without_nader = [
+            [result for result in round_result if not isinstance(result, tuple) or result[0] != nader]
+            for round_result in base_rounds[1:]
+        ]
+        self.assertListEqual(base_rounds_without_nader, get_round_results(analysis.count_without([nader])))
+
+    def test_same_results_as_rewritten_ballots(self):
+        rng = random.Random(2)
+
+        for _ in range(20):
+            candidates = [Candidate("Candidate %i" % i) for i in range(6)]
+            ballots = [
+                Ballot(ranked_candidates=rng.sample(candidates, rng.randint(1, len(candidates))))
+                for _ in range(300)
+            ]
+
+            for method, kwargs in [
+                (pyrankvote.instant_runoff_voting, {}),
+                (pyrankvote.single_transferable_vote, {"number_of_seats": 2}),
+            ]:
+                analysis = WithdrawalAnalysis(candidates, ballots, method, **kwargs)
+                results = analysis.count_single_withdrawals(jobs=2)
+
+                for candidate in candidates:
+                    correct_results = count_with_rewritten_ballots(method, candidates, ballots, candidate, **kwargs)
+                    self.assertListEqual(get_round_results(correct_results), get_round_results(results[candidate]))